@@ -0,0 +1,570 @@
+"""
+Unified command line for FFXIV Market Annihilation.
+
+    python cli.py analyze --datacenter Chaos --num-items 200
+    python cli.py report
+    python cli.py compare data/runs/*.parquet
+    python cli.py crawl --limit 2000
+    python cli.py crawl --stream
+    python cli.py optimize --capital 5000000 --max-items 20
+    python cli.py arbitrage --region Europe --max-units 20
+    python cli.py warehouse consistent --min-runs 5 --last-runs 7
+    python cli.py inspect data/market_analysis_v2.parquet
+    python cli.py serve --port 8080
+    python cli.py synth serve --items 100000
+    python cli.py live --datacenter Chaos --output data/live_metrics.parquet
+    python cli.py bench run --items 2000
+    python cli.py bench-startup
+
+Only argparse and the standard library are imported at startup; pandas,
+requests and the analysis modules are imported inside the subcommand that
+needs them, so quick commands (and cron-driven refreshes) start fast.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+__version__ = "2.1.0"
+
+DEFAULT_DATACENTER = "Chaos"
+DEFAULT_OUTPUT = "data/market_analysis_v2.parquet"
+DEFAULT_CSV = "data/market_analysis_v2.csv"
+DEFAULT_STREAM_OUTPUT = "data/market_analysis_v2_parts"
+METADATA_CACHE_FILE = "data/market_metadata.json"
+WAREHOUSE_FILE = "data/warehouse.sqlite"
+STARTUP_BENCHMARK_FILE = "data/benchmarks/cli_startup.json"
+STARTUP_BUDGET_MS = 100.0
+PERF_HISTORY_FILE = "data/benchmarks/perf_history.json"
+DEFAULT_LIVE_OUTPUT = "data/live_metrics.parquet"
+DEFAULT_ARBITRAGE_OUTPUT = "data/region_arbitrage.parquet"
+
+
+def _configure_logging(level: str):
+    import logging
+    logging.basicConfig(
+        level=getattr(logging, level.upper(), logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _run_analysis(analyzer, args, **kwargs) -> int:
+    """Batch or streaming analysis per --stream; returns the number of items analyzed"""
+    if args.stream:
+        output = DEFAULT_STREAM_OUTPUT if args.output == DEFAULT_OUTPUT else args.output
+        summary = analyzer.analyze_streaming(output_path=output, use_order_book=args.order_book, **kwargs)
+        return summary.count
+    df = analyzer.analyze_and_export(
+        output_file=args.output,
+        csv_file=args.csv or None,
+        use_order_book=args.order_book,
+        **kwargs
+    )
+    return len(df)
+
+
+def cmd_analyze(args) -> int:
+    """Run the v2 history-based analysis"""
+    from main_v2 import build_analyzer
+
+    analyzer = build_analyzer(args.datacenter, stateful=not args.stateless,
+                              request_budget=args.request_budget, history_days=args.history_days or None)
+    analyzed = _run_analysis(analyzer, args, num_items=args.num_items)
+    print(f"\nTotal items analyzed: {analyzed}")
+    return 0 if analyzed else 1
+
+
+def cmd_crawl(args) -> int:
+    """Analyze the whole marketable item universe instead of recently updated items"""
+    from main_v2 import build_analyzer
+
+    analyzer = build_analyzer(args.datacenter, stateful=not args.stateless,
+                              history_days=args.history_days or None)
+    item_ids = analyzer.client.get_marketable_items()
+    if args.limit:
+        item_ids = item_ids[:args.limit]
+    analyzed = _run_analysis(analyzer, args, item_ids=item_ids)
+    print(f"\nTotal items analyzed: {analyzed} of {len(item_ids)} marketable")
+    return 0 if analyzed else 1
+
+
+def cmd_report(args) -> int:
+    """Print the v2 reports for a result file"""
+    from reports_v2 import generate_reports_v2
+
+    generate_reports_v2(args.input)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    """Diff two or more runs, or compare v1 vs v2 without arguments"""
+    from compare_versions import compare_runs, compare_methodologies, V1_RESULTS, V2_RESULTS, V2_RESULTS_CSV
+
+    if len(args.runs) == 1:
+        print("Need at least two runs to compare", file=sys.stderr)
+        return 2
+    if args.runs:
+        table = compare_runs(args.runs, top=args.top)
+        if args.output:
+            table.to_csv(args.output)
+    else:
+        v2_file = V2_RESULTS if os.path.exists(V2_RESULTS) else V2_RESULTS_CSV
+        compare_methodologies(V1_RESULTS, v2_file)
+    return 0
+
+
+def cmd_optimize(args) -> int:
+    """Allocate a gil budget across the analyzed items"""
+    from src.results_io import load_results
+    from src.portfolio import optimize_portfolio
+
+    df = load_results(args.input)
+    allocation, summary = optimize_portfolio(df, args.capital, volume_share=args.volume_share,
+                                             max_items=args.max_items, use_craft=not args.no_craft)
+    print(f"Capital: {summary['capital']:,.0f} gil | used: {summary['capital_used']:,.0f} gil | "
+          f"items: {summary['items']} of {summary['candidates']} candidates")
+    print(f"Expected daily profit: {summary['expected_daily_profit']:,.0f} gil "
+          f"({summary['return_on_capital']:.1%} on capital used)\n")
+    if len(allocation):
+        print(allocation.head(args.top).to_string(index=False, float_format=lambda x: f"{x:,.0f}"))
+    if args.output:
+        allocation.to_csv(args.output, index=False)
+    return 0
+
+
+def cmd_arbitrage(args) -> int:
+    """Best buy-DC / sell-DC pair per item across the datacenters of a region"""
+    from src.market_metadata import MarketMetadata
+    from src.region_arbitrage import RegionArbitrage
+    from src.results_io import write_results, build_run_metadata
+
+    metadata = MarketMetadata().load()
+    region = args.region or metadata.region_of(DEFAULT_DATACENTER)
+    arbitrage = RegionArbitrage(region, metadata=metadata)
+    if args.items:
+        item_ids = [int(i) for i in args.items.split(',') if i.strip()]
+    else:
+        item_ids = arbitrage.snapshots[arbitrage.datacenters[0]].client.get_marketable_items()
+        if args.limit:
+            item_ids = item_ids[:args.limit]
+    qualities = ('nq', 'hq') if args.quality == 'both' else (args.quality,)
+    df = arbitrage.analyze(item_ids, qualities=qualities, volume_share=args.volume_share,
+                           max_units=args.max_units, min_profit=args.min_profit)
+    print(f"Region {region} ({', '.join(arbitrage.datacenters)}): {len(df)} profitable item/quality pairs "
+          f"of {len(item_ids)} items\n")
+    if len(df):
+        print(df.head(args.top).to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+        write_results(df, args.output, build_run_metadata(region, {
+            'mode': 'region_arbitrage', 'items': len(item_ids), 'volume_share': args.volume_share,
+            'max_units': args.max_units, 'quality': args.quality}))
+    return 0
+
+
+def cmd_warehouse(args) -> int:
+    """Import result files into, or query, the SQLite results warehouse"""
+    from src.warehouse import ResultsWarehouse
+
+    warehouse = ResultsWarehouse(args.db)
+    try:
+        if args.action == 'import':
+            stored = [warehouse.import_file(path, datacenter=args.datacenter) for path in args.paths]
+            print(f"Imported {sum(r is not None for r in stored)} of {len(stored)} files")
+            return 0
+        if args.action == 'runs':
+            table = warehouse.runs(args.datacenter, limit=args.limit)
+        elif args.action == 'consistent':
+            table = warehouse.consistently_profitable(args.min_runs, args.last_runs, args.datacenter,
+                                                      min_profit=args.min_profit)
+        elif args.action == 'item':
+            table = warehouse.item_history(args.item_id, datacenter=args.datacenter)
+        else:
+            table = warehouse.query(' '.join(args.sql))
+        print(table.head(args.limit).to_string(index=False) if len(table) else "No rows")
+        return 0
+    finally:
+        warehouse.close()
+
+
+def cmd_synth(args) -> int:
+    """Generate a deterministic synthetic market: API-shaped files or a local stand-in API"""
+    from src.synthetic_market import SyntheticMarket, write_dataset, serve_market
+
+    market = SyntheticMarket(args.items, seed=args.seed, history_days=args.days,
+                             mean_daily_sales=args.mean_daily_sales, now=args.now)
+    if args.action == 'write':
+        stats = write_dataset(market, args.out, datacenter=args.datacenter, entries=args.entries)
+        print(json.dumps(stats, indent=2))
+        return 0
+    serve_market(market, host=args.host, port=args.port, error_rate=args.error_rate, latency=args.latency,
+                 feed_rate=args.feed_rate, feed_drop_after=args.feed_drop_after)
+    return 0
+
+
+def cmd_live(args) -> int:
+    """Ingest the Universalis WebSocket feed and write live per-item metrics periodically"""
+    from src.live_feed import LiveIngest, UNIVERSALIS_WS_URL
+    from src.results_io import write_results, build_run_metadata
+
+    datacenters = args.datacenter or ([] if args.world else [DEFAULT_DATACENTER])
+    item_ids = [int(i) for i in args.items.split(',') if i.strip()] if args.items else None
+    ingest = LiveIngest(worlds=args.world, datacenters=datacenters, item_ids=item_ids,
+                        url=args.url or UNIVERSALIS_WS_URL)
+    ingest.start()
+    deadline = time.time() + args.duration if args.duration else None
+    try:
+        while deadline is None or time.time() < deadline:
+            time.sleep(args.write_every if deadline is None
+                       else max(0.0, min(args.write_every, deadline - time.time())))
+            df = ingest.metrics_frame()
+            if len(df):
+                write_results(df, args.output, build_run_metadata(
+                    ','.join(datacenters + [str(w) for w in args.world or []]),
+                    {'mode': 'live', 'stats': dict(ingest.stats)}))
+            print(f"{time.strftime('%H:%M:%S')} {ingest.summary()}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.stop()
+    return 0
+
+
+def cmd_bench(args) -> int:
+    """Benchmark analyze/crawl/report against the synthetic stand-in and gate on regressions"""
+    from src.perf import (run_benchmark, load_history, save_record, find_baseline,
+                          compare_records, format_comparison)
+
+    tolerances = {'wall_s': args.tolerance, 'items_per_s': args.tolerance}
+    history = load_history(args.history)
+    if args.action == 'run':
+        candidate = run_benchmark(args.paths, n_items=args.items, seed=args.seed, repeats=args.repeats)
+        save_record(candidate, args.history)
+        baseline = find_baseline(history, commit=args.baseline, exclude_commit=candidate['commit'])
+    else:
+        candidate = find_baseline(history, commit=args.candidate)
+        baseline = find_baseline(history, commit=args.baseline,
+                                 exclude_commit=candidate['commit'] if candidate else None)
+        if candidate is None:
+            print(f"No benchmark records in {args.history}", file=sys.stderr)
+            return 1
+
+    print(f"Candidate: {candidate['commit']}{' (dirty)' if candidate.get('dirty') else ''} {candidate['ts']}")
+    if baseline is None:
+        print("No baseline to compare against; recorded this run as the first one")
+        return 0
+    if (baseline.get('items'), baseline.get('seed')) != (candidate.get('items'), candidate.get('seed')):
+        print(f"Baseline {baseline['commit']} used a different market (items/seed); not comparable", file=sys.stderr)
+        return 1
+    rows = compare_records(baseline, candidate, tolerances)
+    print(f"Baseline:  {baseline['commit']} {baseline['ts']}\n")
+    print(format_comparison(rows))
+    regressions = [r for r in rows if r['regression']]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond tolerance/noise")
+        return 0 if args.no_gate else 1
+    print("\nNo regressions")
+    return 0
+
+
+def cmd_inspect(args) -> int:
+    """Show the embedded run metadata and columns of a result file (or the metadata cache)"""
+    path = args.path
+    if '.json' in os.path.basename(path):
+        # JSON stores are compressed next to their logical path (.json.zst / .json.gz)
+        from src.compression import read_json
+
+        logical = path.rsplit('.json', 1)[0] + '.json'
+        cache = read_json(logical)
+        if cache is None:
+            print(f"{path} not found", file=sys.stderr)
+            return 1
+        age_h = (time.time() - cache.get('fetched_at', 0)) / 3600
+        print(f"Metadata cache: {path} (fetched {age_h:.1f}h ago)")
+        print(f"  Worlds: {len(cache.get('worlds', []))}")
+        print(f"  Datacenters: {', '.join(dc['name'] for dc in cache.get('data_centers', []))}")
+        print(f"  Worlds with tax rates: {len(cache.get('tax_rates', {}))}")
+        return 0
+
+    if not os.path.exists(path):
+        print(f"{path} not found", file=sys.stderr)
+        return 1
+
+    from src.results_io import available_columns, read_run_metadata
+
+    metadata = read_run_metadata(path)
+    columns = available_columns(path)
+    print(f"Result file: {path} ({os.path.getsize(path) / 1024:,.1f} KiB)")
+    if metadata:
+        print(f"  Datacenter: {metadata.get('datacenter')}")
+        print(f"  Run: {metadata.get('run_ts')}")
+        print(f"  Schema version: {metadata.get('schema_version')}")
+        print(f"  Parameters: {json.dumps(metadata.get('parameters', {}))}")
+    print(f"  Columns ({len(columns)}): {', '.join(columns)}")
+    return 0
+
+
+def cmd_serve(args) -> int:
+    """Serve the latest results and run metadata as JSON over HTTP"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+    from src.results_io import load_results, read_run_metadata
+
+    results_file = args.input
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, payload, status: int = 200):
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                import gzip
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if not os.path.exists(results_file):
+                self._send_json({'error': f"{results_file} not found"}, status=404)
+                return
+            # Re-read on every request so scheduled refreshes show up without a restart
+            if url.path == '/results':
+                columns = query['columns'][0].split(',') if 'columns' in query else None
+                df = load_results(results_file, columns=columns)
+                sort_by = query.get('sort', ['profitability'])[0]
+                if sort_by in df.columns:
+                    df = df.sort_values(sort_by, ascending=False)
+                df = df.head(int(query.get('top', [100])[0]))
+                records = json.loads(df.to_json(orient='records'))
+                self._send_json({'count': len(records), 'results': records})
+            elif url.path == '/metadata':
+                self._send_json(read_run_metadata(results_file))
+            else:
+                self._send_json({'error': 'not found', 'endpoints': ['/results', '/metadata']}, status=404)
+
+        def log_message(self, format, *log_args):
+            import logging
+            logging.getLogger('cli.serve').info(format % log_args)
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Serving {results_file} on http://{args.host}:{args.port} (/results, /metadata)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def cmd_bench_startup(args) -> int:
+    """
+    Time cold starts of the CLI in fresh interpreters and record the median.
+    Fails (exit 1) if the median exceeds the budget.
+    """
+    import statistics
+    import subprocess
+
+    command = [sys.executable, os.path.abspath(__file__)] + (args.cli_args or ['--version'])
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    median_ms = statistics.median(timings)
+    record = {
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'command': ' '.join(command[2:]),
+        'runs': args.runs,
+        'median_ms': round(median_ms, 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'budget_ms': args.budget_ms,
+        'python': sys.version.split()[0],
+    }
+
+    history = []
+    if os.path.exists(args.output):
+        try:
+            with open(args.output, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = []
+    history.append(record)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+
+    within = median_ms <= args.budget_ms
+    print(f"CLI startup ({record['command']}): median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(timings):.1f}, max {max(timings):.1f}) - budget {args.budget_ms:.0f} ms "
+          f"{'OK' if within else 'EXCEEDED'}")
+    return 0 if within else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="FFXIV Market Annihilation")
+    parser.add_argument('--version', action='version', version=f"%(prog)s {__version__}")
+    parser.add_argument('--log-level', default='INFO', help="Logging level (default: INFO)")
+    sub = parser.add_subparsers(dest='command', metavar='command')
+
+    def add_run_options(p):
+        p.add_argument('--datacenter', '-d', default=DEFAULT_DATACENTER, help="Datacenter to analyze")
+        p.add_argument('--output', '-o', default=DEFAULT_OUTPUT, help="Result file (.parquet/.feather/.csv)")
+        p.add_argument('--csv', default=DEFAULT_CSV, help="Extra CSV copy ('' to skip)")
+        p.add_argument('--order-book', action='store_true', help="Add depth-based buy prices from current listings")
+        p.add_argument('--stateless', action='store_true',
+                       help="Skip sketches, trends and tax metadata (plain v2 analysis)")
+        p.add_argument('--history-days', type=float, default=7,
+                       help="Days of sale history requested per item (0 = API default, default: 7)")
+        p.add_argument('--stream', action='store_true',
+                       help=f"Bounded memory: append each batch to disk as it is analyzed "
+                            f"(Parquet part directory, default {DEFAULT_STREAM_OUTPUT}; --csv is ignored)")
+
+    p = sub.add_parser('analyze', help="Analyze recently updated items")
+    add_run_options(p)
+    p.add_argument('--num-items', '-n', type=int, default=200, help="Number of items to analyze")
+    p.add_argument('--request-budget', type=int, default=None,
+                   help="Max history requests (100 items each) spent on adaptively selected items")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser('crawl', help="Analyze every marketable item")
+    add_run_options(p)
+    p.add_argument('--limit', type=int, default=0, help="Only the first N marketable items (0 = all)")
+    p.set_defaults(func=cmd_crawl)
+
+    p = sub.add_parser('report', help="Print reports for a result file")
+    p.add_argument('--input', '-i', default=DEFAULT_OUTPUT, help="Result file")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('compare', help="Compare runs (v1 vs v2 without arguments)")
+    p.add_argument('runs', nargs='*', help="Result files to diff, oldest first")
+    p.add_argument('--top', type=int, default=10, help="Rows to show per section")
+    p.add_argument('--output', help="Optional CSV path for the full comparison table")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser('optimize', help="Allocate capital across analyzed items")
+    p.add_argument('--input', '-i', default=DEFAULT_OUTPUT, help="Result file")
+    p.add_argument('--capital', type=float, required=True, help="Gil available to spend")
+    p.add_argument('--volume-share', type=float, default=1.0,
+                   help="Max share of each item's daily volume to buy (default: 1.0)")
+    p.add_argument('--max-items', type=int, default=None, help="Max number of distinct items")
+    p.add_argument('--no-craft', action='store_true', help="Never craft, even when cheaper than buying")
+    p.add_argument('--top', type=int, default=30, help="Allocation rows to print")
+    p.add_argument('--output', '-o', help="Optional CSV path for the full allocation")
+    p.set_defaults(func=cmd_optimize)
+
+    p = sub.add_parser('arbitrage', help="Best buy-DC / sell-DC pair per item across a region's datacenters")
+    p.add_argument('--region', '-r', default=None, help=f"Region (default: the region of {DEFAULT_DATACENTER})")
+    p.add_argument('--items', help="Comma-separated item IDs (default: every marketable item)")
+    p.add_argument('--limit', type=int, default=0, help="Only the first N marketable items (0 = all)")
+    p.add_argument('--quality', choices=['nq', 'hq', 'both'], default='both', help="Qualities to rank")
+    p.add_argument('--volume-share', type=float, default=1.0,
+                   help="Share of the smaller DC's daily volume to trade (default: 1.0)")
+    p.add_argument('--max-units', type=float, default=None, help="Cap on units traded per item and day")
+    p.add_argument('--min-profit', type=float, default=0.0, help="Minimum daily profit to list a pair")
+    p.add_argument('--top', type=int, default=30, help="Rows to print")
+    p.add_argument('--output', '-o', default=DEFAULT_ARBITRAGE_OUTPUT, help="Result file")
+    p.set_defaults(func=cmd_arbitrage)
+
+    p = sub.add_parser('warehouse', help="Import runs into / query the SQLite run history")
+    p.add_argument('--db', default=WAREHOUSE_FILE, help="Warehouse database")
+    p.add_argument('--datacenter', '-d', default=None, help="Only this datacenter")
+    p.add_argument('--limit', type=int, default=50, help="Rows to print")
+    p.set_defaults(func=cmd_warehouse)
+    actions = p.add_subparsers(dest='action', metavar='action', required=True)
+    a = actions.add_parser('import', help="Import result files (Parquet/Feather/CSV)")
+    a.add_argument('paths', nargs='+')
+    actions.add_parser('runs', help="List stored runs, newest first")
+    a = actions.add_parser('consistent', help="Items profitable in N of the last M runs")
+    a.add_argument('--min-runs', type=int, default=5, help="Profitable in at least N runs")
+    a.add_argument('--last-runs', type=int, default=7, help="... of the last M runs")
+    a.add_argument('--min-profit', type=float, default=0.0, help="Profitability threshold")
+    a = actions.add_parser('item', help="One item's metrics across runs")
+    a.add_argument('item_id', type=int)
+    a = actions.add_parser('sql', help="Run a SQL query")
+    a.add_argument('sql', nargs='+')
+
+    p = sub.add_parser('synth', help="Synthetic market data for load and scale tests")
+    p.add_argument('--items', type=int, default=10000, help="Number of items")
+    p.add_argument('--seed', type=int, default=0, help="Random seed (same seed, same market)")
+    p.add_argument('--days', type=int, default=14, help="Days of sale history per item")
+    p.add_argument('--mean-daily-sales', type=float, default=8.0, help="Mean sales per item per day (power law)")
+    p.add_argument('--now', type=float, default=None, help="Reference Unix time (default: current time)")
+    p.set_defaults(func=cmd_synth)
+    actions = p.add_subparsers(dest='action', metavar='action', required=True)
+    a = actions.add_parser('write', help="Write API-shaped response files")
+    a.add_argument('--out', default='data/synthetic', help="Output directory")
+    a.add_argument('--datacenter', '-d', default=DEFAULT_DATACENTER)
+    a.add_argument('--entries', type=int, default=100, help="History entries per item")
+    a = actions.add_parser('serve', help="Run a local stand-in for Universalis, XIVAPI and teamcraft")
+    a.add_argument('--host', default='127.0.0.1')
+    a.add_argument('--port', type=int, default=8700)
+    a.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    a.add_argument('--latency', type=float, default=0.0, help="Seconds of delay added per request")
+    a.add_argument('--feed-rate', type=float, default=200.0, help="WebSocket feed events per second")
+    a.add_argument('--feed-drop-after', type=int, default=0,
+                   help="Close feed connections after N events (exercises reconnect + gap fill)")
+
+    p = sub.add_parser('live', help="Ingest the Universalis WebSocket feed into live per-item metrics")
+    p.add_argument('--datacenter', '-d', action='append', help=f"Datacenter to subscribe to (repeatable; default {DEFAULT_DATACENTER})")
+    p.add_argument('--world', '-w', action='append', help="World name or ID to subscribe to (repeatable)")
+    p.add_argument('--items', help="Comma-separated item IDs to track (default: every item seen)")
+    p.add_argument('--url', default=None, help="Feed URL (default: UNIVERSALIS_WS_URL or the public feed)")
+    p.add_argument('--output', '-o', default=DEFAULT_LIVE_OUTPUT, help="Live metrics file, rewritten periodically")
+    p.add_argument('--write-every', type=float, default=30.0, help="Seconds between metric writes")
+    p.add_argument('--duration', type=float, default=0.0, help="Stop after N seconds (default: run until interrupted)")
+    p.set_defaults(func=cmd_live)
+
+    p = sub.add_parser('bench', help="Benchmark analyze/crawl/report per commit and gate on regressions")
+    p.add_argument('--history', default=PERF_HISTORY_FILE, help="Benchmark record store")
+    p.add_argument('--baseline', default=None, help="Baseline commit (default: newest record of another commit)")
+    p.add_argument('--tolerance', type=float, default=0.10, help="Allowed slowdown as a fraction (default: 0.10)")
+    p.add_argument('--no-gate', action='store_true', help="Report regressions without failing")
+    p.set_defaults(func=cmd_bench)
+    actions = p.add_subparsers(dest='action', metavar='action', required=True)
+    a = actions.add_parser('run', help="Run the benchmark, record it and compare with the baseline")
+    a.add_argument('--paths', nargs='+', choices=['analyze', 'crawl', 'report'],
+                   default=['analyze', 'crawl', 'report'])
+    a.add_argument('--items', type=int, default=2000, help="Synthetic market size")
+    a.add_argument('--seed', type=int, default=0)
+    a.add_argument('--repeats', type=int, default=3, help="Samples per path (noise estimate)")
+    a = actions.add_parser('compare', help="Compare stored records without running")
+    a.add_argument('--candidate', default=None, help="Candidate commit (default: newest record)")
+
+    p = sub.add_parser('inspect', help="Show metadata and columns of a result file or the metadata cache")
+    p.add_argument('path', nargs='?', default=DEFAULT_OUTPUT, help=f"Result file or {METADATA_CACHE_FILE}")
+    p.set_defaults(func=cmd_inspect)
+
+    p = sub.add_parser('serve', help="Serve results as JSON over HTTP")
+    p.add_argument('--input', '-i', default=DEFAULT_OUTPUT, help="Result file to serve")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8080)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser('bench-startup', help="Benchmark CLI cold-start time against a budget")
+    p.add_argument('--runs', type=int, default=10, help="Number of cold starts to time")
+    p.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS, help="Maximum median startup time")
+    p.add_argument('--output', default=STARTUP_BENCHMARK_FILE, help="JSON file the timings are appended to")
+    p.add_argument('cli_args', nargs=argparse.REMAINDER, help="CLI arguments to time (default: --version)")
+    p.set_defaults(func=cmd_bench_startup)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    _configure_logging(args.log_level)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
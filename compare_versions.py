@@ -1,25 +1,40 @@
 """
-Comparison between v1 (aggregated data) and v2 (history-based) analysis
-"""
-import pandas as pd
-
-print("\n" + "=" * 110)
-print("COMPARISON: Analysis v1 (Aggregated) vs v2 (History-Based)")
-print("=" * 110)
-
-# Load both datasets
-v1_df = pd.read_csv('data/market_analysis.csv')
-v2_df = pd.read_csv('data/market_analysis_v2.csv')
+Comparison between analysis runs.
 
-print("\n\n1. DATA QUALITY & COVERAGE")
-print("-" * 110)
-print(f"v1 (Aggregated): {len(v1_df)} items analyzed")
-print(f"v2 (History):    {len(v2_df)} items analyzed")
-print(f"Overlap (items in both): {len(set(v1_df['item_id']).intersection(set(v2_df['item_id'])))} items")
+Without arguments, compares v1 (aggregated data) and v2 (history-based) analysis.
+With two or more result files, diffs those runs (e.g. hourly v2 snapshots):
 
-print("\n\n2. METHODOLOGY DIFFERENCES")
-print("-" * 110)
-print("""
+    python compare_versions.py data/runs/*.parquet
+"""
+import os
+import argparse
+from src.results_io import load_results
+from src.run_diff import diff_runs, normalize_run, load_runs, summarize_runs, top_movers
+
+V1_RESULTS = 'data/market_analysis.csv'
+V2_RESULTS = 'data/market_analysis_v2.parquet'
+V2_RESULTS_CSV = 'data/market_analysis_v2.csv'
+
+
+def compare_methodologies(v1_file: str = V1_RESULTS, v2_file: str = V2_RESULTS):
+    """Compare a v1 (aggregated) result file with a v2 (history) result file"""
+    print("\n" + "=" * 110)
+    print("COMPARISON: Analysis v1 (Aggregated) vs v2 (History-Based)")
+    print("=" * 110)
+
+    # Load both datasets (only the columns compared below)
+    v1_df = load_results(v1_file, columns=['item_id', 'item_name', 'nq_profitability', 'nq_daily_sales'])
+    v2_df = load_results(v2_file, columns=['item_id', 'item_name', 'profitability', 'daily_volume'])
+
+    print("\n\n1. DATA QUALITY & COVERAGE")
+    print("-" * 110)
+    print(f"v1 (Aggregated): {len(v1_df)} items analyzed")
+    print(f"v2 (History):    {len(v2_df)} items analyzed")
+    print(f"Overlap (items in both): {len(set(v1_df['item_id']).intersection(set(v2_df['item_id'])))} items")
+
+    print("\n\n2. METHODOLOGY DIFFERENCES")
+    print("-" * 110)
+    print("""
 v1 (Aggregated API):
   - Uses averageSalePrice (can be skewed by outliers)
   - Uses minListing (only 1 item, not sustainable)
@@ -34,67 +49,62 @@ v2 (Historical Data):
   - Much more realistic and actionable
 """)
 
-print("\n3. KEY METRICS COMPARISON")
-print("-" * 110)
-
-# Get common items for comparison
-common_items = set(v1_df['item_id']).intersection(set(v2_df['item_id']))
-v1_common = v1_df[v1_df['item_id'].isin(common_items)].set_index('item_id')
-v2_common = v2_df[v2_df['item_id'].isin(common_items)].set_index('item_id')
-
-print(f"\nProfitability (first 10 common items):")
-print("Item ID | Item Name | v1 Profitability | v2 Profitability | Difference")
-print("-" * 110)
-
-for item_id in list(common_items)[:10]:
-    v1_prof = v1_common.loc[item_id, 'nq_profitability'] if 'nq_profitability' in v1_common.columns else 0
-    v2_prof = v2_common.loc[item_id, 'profitability']
-    v1_name = v1_common.loc[item_id, 'item_name']
-    
-    ratio = v2_prof / v1_prof if v1_prof != 0 else 0
-    print(f"{item_id:7d} | {v1_name:30s} | {v1_prof:17,.0f} | {v2_prof:17,.0f} | {ratio:8.2%}")
-
-print("\n\n4. VOLUME ANALYSIS")
-print("-" * 110)
-print(f"\nv1 Average daily sales across items: {v1_common['nq_daily_sales'].mean():.1f} units/day")
-print(f"v2 Average daily volume across items: {v2_common['daily_volume'].mean():.1f} units/day")
-
-print("\nv1 shows extremely high volume numbers (383,877 Ice Crystals/day reported)")
-print("v2 shows more realistic numbers (84,492 Ice Crystals/day)")
-print("\nReality check: Ice Crystals are gathered items, selling thousands per day is plausible")
-print("but v1's dailySaleVelocity appears to be cumulative across entire datacenter,")
-print("not per-world or realistic purchase volume")
-
-print("\n\n5. PROFITABILITY DISTRIBUTION")
-print("-" * 110)
-
-v1_positive = (v1_df['nq_profitability'] > 0).sum()
-v2_positive = (v2_df['profitability'] > 0).sum()
-
-print(f"\nv1 Items with positive profitability: {v1_positive}/{len(v1_df)} ({100*v1_positive/len(v1_df):.1f}%)")
-print(f"v2 Items with positive profitability: {v2_positive}/{len(v2_df)} ({100*v2_positive/len(v2_df):.1f}%)")
-
-print(f"\nv1 Total daily profitability: {v1_df['nq_profitability'].sum():,.0f} gil")
-print(f"v2 Total daily profitability: {v2_df['profitability'].sum():,.0f} gil")
-
-print(f"\nv1 Average per item: {v1_df['nq_profitability'].mean():,.0f} gil")
-print(f"v2 Average per item: {v2_df['profitability'].mean():,.0f} gil")
-
-print("\n\n6. TOP 5 ITEMS COMPARISON")
-print("-" * 110)
-print("\nv1 Top 5 by Profitability:")
-v1_top = v1_df.nlargest(5, 'nq_profitability')[['item_id', 'item_name', 'nq_profitability']]
-for idx, row in v1_top.iterrows():
-    print(f"  {row['item_id']:5d} - {row['item_name']:30s}: {row['nq_profitability']:15,.0f} gil")
-
-print("\nv2 Top 5 by Profitability:")
-v2_top = v2_df.nlargest(5, 'profitability')[['item_id', 'item_name', 'profitability']]
-for idx, row in v2_top.iterrows():
-    print(f"  {row['item_id']:5d} - {row['item_name']:30s}: {row['profitability']:15,.0f} gil")
-
-print("\n\n7. VERDICT & RECOMMENDATIONS")
-print("-" * 110)
-print("""
+    print("\n3. KEY METRICS COMPARISON")
+    print("-" * 110)
+
+    # Join both runs on item_id (indexed merge, no per-item lookups)
+    table = diff_runs({'v1': normalize_run(v1_df), 'v2': normalize_run(v2_df)})
+    common = table[table['status'] == 'persistent']
+    common = common.assign(ratio=(common['profitability@v2'] / common['profitability@v1'].where(common['profitability@v1'] != 0)).fillna(0))
+
+    print(f"\nProfitability (first 10 common items):")
+    print("Item ID | Item Name | v1 Profitability | v2 Profitability | Difference")
+    print("-" * 110)
+
+    for item_id, row in common.head(10).iterrows():
+        print(f"{item_id:7d} | {row['item_name']:30s} | {row['profitability@v1']:17,.0f} | {row['profitability@v2']:17,.0f} | {row['ratio']:8.2%}")
+
+    print("\n\n4. VOLUME ANALYSIS")
+    print("-" * 110)
+    print(f"\nv1 Average daily sales across items: {common['daily_volume@v1'].mean():.1f} units/day")
+    print(f"v2 Average daily volume across items: {common['daily_volume@v2'].mean():.1f} units/day")
+
+    print("\nv1 shows extremely high volume numbers (383,877 Ice Crystals/day reported)")
+    print("v2 shows more realistic numbers (84,492 Ice Crystals/day)")
+    print("\nReality check: Ice Crystals are gathered items, selling thousands per day is plausible")
+    print("but v1's dailySaleVelocity appears to be cumulative across entire datacenter,")
+    print("not per-world or realistic purchase volume")
+
+    print("\n\n5. PROFITABILITY DISTRIBUTION")
+    print("-" * 110)
+
+    v1_positive = (v1_df['nq_profitability'] > 0).sum()
+    v2_positive = (v2_df['profitability'] > 0).sum()
+
+    print(f"\nv1 Items with positive profitability: {v1_positive}/{len(v1_df)} ({100*v1_positive/len(v1_df):.1f}%)")
+    print(f"v2 Items with positive profitability: {v2_positive}/{len(v2_df)} ({100*v2_positive/len(v2_df):.1f}%)")
+
+    print(f"\nv1 Total daily profitability: {v1_df['nq_profitability'].sum():,.0f} gil")
+    print(f"v2 Total daily profitability: {v2_df['profitability'].sum():,.0f} gil")
+
+    print(f"\nv1 Average per item: {v1_df['nq_profitability'].mean():,.0f} gil")
+    print(f"v2 Average per item: {v2_df['profitability'].mean():,.0f} gil")
+
+    print("\n\n6. TOP 5 ITEMS COMPARISON")
+    print("-" * 110)
+    print("\nv1 Top 5 by Profitability:")
+    v1_top = v1_df.nlargest(5, 'nq_profitability')[['item_id', 'item_name', 'nq_profitability']]
+    for idx, row in v1_top.iterrows():
+        print(f"  {row['item_id']:5d} - {row['item_name']:30s}: {row['nq_profitability']:15,.0f} gil")
+
+    print("\nv2 Top 5 by Profitability:")
+    v2_top = v2_df.nlargest(5, 'profitability')[['item_id', 'item_name', 'profitability']]
+    for idx, row in v2_top.iterrows():
+        print(f"  {row['item_id']:5d} - {row['item_name']:30s}: {row['profitability']:15,.0f} gil")
+
+    print("\n\n7. VERDICT & RECOMMENDATIONS")
+    print("-" * 110)
+    print("""
 ✓ v2 (History-Based) is MORE RELIABLE because:
   1. Uses MEDIAN prices (not affected by one-time sales to collectors)
   2. Uses PERCENTILE-based margins (realistic buying/selling)
@@ -117,4 +127,63 @@ RECOMMENDATION:
 → For next phase: add crafting cost analysis to v2
 """)
 
-print("\n" + "=" * 110 + "\n")
+    print("\n" + "=" * 110 + "\n")
+
+
+def compare_runs(paths, top: int = 10):
+    """Diff two or more result files in the given order (oldest first)"""
+    runs = load_runs(paths)
+    table = diff_runs(runs)
+    labels = list(runs.keys())
+
+    print("\n" + "=" * 110)
+    print(f"RUN COMPARISON: {len(runs)} runs ({labels[0]} -> {labels[-1]})")
+    print("=" * 110)
+
+    print("\n\n1. RUN SUMMARY")
+    print("-" * 110)
+    print(summarize_runs(runs).to_string())
+
+    print("\n\n2. ITEM STATUS (first vs last run)")
+    print("-" * 110)
+    print(table['status'].value_counts().to_string())
+
+    movers = top_movers(table, n=top)
+    cols = ['item_name', f"profitability@{labels[0]}", f"profitability@{labels[-1]}",
+            'profitability_delta', 'rank_change']
+    print(f"\n\n3. TOP {top} GAINERS (profitability)")
+    print("-" * 110)
+    print(movers['gainers'][cols].to_string())
+    print(f"\n\n4. TOP {top} LOSERS (profitability)")
+    print("-" * 110)
+    print(movers['losers'][cols].to_string())
+
+    print("\n\n5. NEW ITEMS IN LATEST RUN")
+    print("-" * 110)
+    new_items = table[table['status'] == 'new'].head(top)
+    print(new_items[['item_name', f"profitability@{labels[-1]}"]].to_string() if len(new_items) else "None")
+
+    print("\n" + "=" * 110 + "\n")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare analysis runs")
+    parser.add_argument('runs', nargs='*', help="Result files to diff, oldest first (default: v1 vs v2)")
+    parser.add_argument('--top', type=int, default=10, help="Rows to show per section")
+    parser.add_argument('--output', help="Optional CSV path for the full comparison table")
+    args = parser.parse_args()
+
+    if len(args.runs) >= 2:
+        table = compare_runs(args.runs, top=args.top)
+        if args.output:
+            table.to_csv(args.output)
+    elif args.runs:
+        parser.error("Need at least two runs to compare")
+    else:
+        v2_file = V2_RESULTS if os.path.exists(V2_RESULTS) else V2_RESULTS_CSV
+        compare_methodologies(V1_RESULTS, v2_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,9 +36,8 @@ class MarketAnalyzer:
             url = f"{self.client.BASE_URL}/extra/stats/most-recently-updated"
             params = {"dcName": self.datacenter, "entries": 200}
             
-            import requests
             self.client._rate_limit()
-            response = requests.get(url, params=params)
+            response = self.client.session.get(url, params=params)
             response.raise_for_status()
             
             recent_data = response.json()
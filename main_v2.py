@@ -3,36 +3,87 @@ Main script for market analysis v2 (history-based)
 """
 import sys
 import logging
-from src.analyzer_v2 import MarketAnalyzerV2
+from typing import Optional
+from src.analyzer_v2 import MarketAnalyzerV2, HISTORY_DAYS
+from src.quantile_sketch import SketchStore
+from src.trends import TrendTracker
+from src.forecast import Forecaster
+from src.market_metadata import MarketMetadata
+from src.item_selection import ItemSelector
+from src.warehouse import ResultsWarehouse
+
+logger = logging.getLogger(__name__)
+
+DATACENTER = "Chaos"
+NUM_ITEMS = 200
+OUTPUT_FILE = "data/market_analysis_v2.parquet"
+CSV_FILE = "data/market_analysis_v2.csv"
+
+
+def build_analyzer(datacenter: str = DATACENTER, stateful: bool = True,
+                   request_budget: Optional[int] = None,
+                   history_days: Optional[float] = HISTORY_DAYS) -> MarketAnalyzerV2:
+    """
+    Create a v2 analyzer wired to the persistent per-run state.
+
+    With stateful=False no sketches/trends/metadata/selection state are loaded
+    or run history (plain v2 analysis). request_budget caps the history requests per run.
+    history_days is the sale window requested per item (None for the API default).
+    """
+    if not stateful:
+        return MarketAnalyzerV2(datacenter=datacenter, history_days=history_days)
+
+    # Price sketches accumulate sales across runs (7-day half-life)
+    sketch_store = SketchStore.load("data/price_sketches.json", half_life=7 * 86400)
+    # Rolling 7-day trend metrics, updated with each run's new sales
+    trend_tracker = TrendTracker.load("data/trend_state.json")
+    # Holt/EWMA price and volume forecasts, refitted on each newly closed day
+    forecaster = Forecaster.load("data/forecast_state.json")
+    # Worlds, DCs and tax rates are cached on disk for a day
+    try:
+        metadata = MarketMetadata().load()
+    except Exception as e:
+        logger.warning(f"Could not load market metadata, margins will not be tax-adjusted: {e}")
+        metadata = None
+    # Learns which items are worth refreshing from previous runs' results
+    selector = ItemSelector.load("data/selection_state.json", request_budget=request_budget)
+    # Every run is appended to the SQLite results warehouse
+    warehouse = ResultsWarehouse("data/warehouse.sqlite")
+    return MarketAnalyzerV2(datacenter=datacenter, sketch_store=sketch_store,
+                            trend_tracker=trend_tracker, metadata=metadata, selector=selector,
+                            warehouse=warehouse, history_days=history_days, forecaster=forecaster)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 
 def main():
     """Run the improved market analysis"""
-    analyzer = MarketAnalyzerV2(datacenter="Chaos")
-    
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    analyzer = build_analyzer(DATACENTER)
+
     print("=" * 80)
     print("FFXIV Market Annihilation - Market Analysis v2 (History-Based)")
     print("=" * 80)
-    print(f"Datacenter: Chaos")
+    print(f"Datacenter: {DATACENTER}")
     print(f"Analysis: Using historical sales data")
     print(f"Metrics: Median price, realistic volume, percentile-based margins")
     print()
-    
+
     try:
         df = analyzer.analyze_and_export(
-            output_file="data/market_analysis_v2.csv",
-            num_items=200
+            output_file=OUTPUT_FILE,
+            num_items=NUM_ITEMS,
+            csv_file=CSV_FILE,
+            use_order_book=True
         )
-        
+
         print("\n" + "=" * 80)
         print(f"Total items analyzed: {len(df)}")
         print("=" * 80)
-        
+
     except Exception as e:
         print(f"Error during analysis: {e}", file=sys.stderr)
         import traceback
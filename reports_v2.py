@@ -1,19 +1,41 @@
 """
 Advanced reporting for v2 analysis with detailed metrics
 """
+import os
 import pandas as pd
 import logging
+from src.results_io import load_results, read_run_metadata
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_reports_v2(csv_file: str = "data/market_analysis_v2.csv"):
-    """Generate detailed analysis reports from v2 data"""
+DEFAULT_RESULTS_FILE = "data/market_analysis_v2.parquet"
+FALLBACK_CSV_FILE = "data/market_analysis_v2.csv"
+
+# Only these columns are read from the results file
+REPORT_COLUMNS = [
+    'item_id', 'item_name', 'buy_price', 'median_price', 'sell_price',
+    'margin_per_unit', 'daily_volume', 'profitability',
+    'price_min', 'price_p25', 'price_p75', 'price_max',
+    'total_sales_in_history', 'total_quantity_in_history', 'days_span',
+    'net_profitability',
+    'mc_expected_profit', 'mc_profit_p05', 'mc_cvar_05', 'mc_prob_loss',
+    'hq_buy_price', 'hq_sell_price', 'hq_daily_volume', 'hq_profitability', 'hq_premium',
+]
+
+def generate_reports_v2(results_file: str = DEFAULT_RESULTS_FILE):
+    """Generate detailed analysis reports from v2 data (Parquet, Feather or CSV)"""
+    
+    if not os.path.exists(results_file) and results_file == DEFAULT_RESULTS_FILE:
+        logger.info(f"{results_file} not found, falling back to {FALLBACK_CSV_FILE}")
+        results_file = FALLBACK_CSV_FILE
     
-    df = pd.read_csv(csv_file)
+    df = load_results(results_file, columns=REPORT_COLUMNS)
+    metadata = read_run_metadata(results_file)
     
     print("\n" + "=" * 110)
     print("FFXIV Market Annihilation - Advanced Analysis Report v2 (History-Based)")
+    if metadata:
+        print(f"Datacenter: {metadata.get('datacenter')} | Run: {metadata.get('run_ts')}")
     print("=" * 110)
     
     # Report 1: Top profitable items
@@ -80,6 +102,25 @@ def generate_reports_v2(csv_file: str = "data/market_analysis_v2.csv"):
     else:
         print("No items found matching criteria.")
     
+    # Report 4b: HQ opportunities
+    if 'hq_profitability' in df.columns:
+        print("\n\n4b. TOP 15 HQ ITEMS BY DAILY PROFITABILITY")
+        print("-" * 110)
+        print("HQ sales analyzed separately; premium = HQ median / NQ median")
+        top_hq = df[df['hq_profitability'] > 0].nlargest(15, 'hq_profitability')[
+            ['item_id', 'item_name', 'hq_buy_price', 'hq_sell_price', 'hq_daily_volume', 'hq_profitability', 'hq_premium']
+        ].copy()
+        
+        if len(top_hq) > 0:
+            top_hq['hq_buy_price'] = top_hq['hq_buy_price'].apply(lambda x: f"{x:,.0f}")
+            top_hq['hq_sell_price'] = top_hq['hq_sell_price'].apply(lambda x: f"{x:,.0f}")
+            top_hq['hq_daily_volume'] = top_hq['hq_daily_volume'].apply(lambda x: f"{x:.1f}")
+            top_hq['hq_profitability'] = top_hq['hq_profitability'].apply(lambda x: f"{x:,.0f}")
+            top_hq['hq_premium'] = top_hq['hq_premium'].apply(lambda x: f"{x:.2f}x" if pd.notna(x) else "HQ only")
+            print(top_hq.to_string(index=False))
+        else:
+            print("No profitable HQ items found.")
+    
     # Report 5: Price volatility analysis
     print("\n\n5. PRICE VOLATILITY ANALYSIS (Price Range)")
     print("-" * 110)
@@ -113,6 +154,9 @@ def generate_reports_v2(csv_file: str = "data/market_analysis_v2.csv"):
     print(f"  - Median per item: {df['profitability'].median():,.0f} gil")
     print(f"  - Max: {df['profitability'].max():,.0f} gil")
     print(f"  - Min: {df['profitability'].min():,.0f} gil")
+    if 'net_profitability' in df.columns:
+        print(f"  - Total net of market tax: {df['net_profitability'].sum():,.0f} gil")
+        print(f"  - Items profitable after tax: {(df['net_profitability'] > 0).sum()}")
     
     print(f"\nVolume Metrics:")
     print(f"  - Average daily volume: {df['daily_volume'].mean():.1f} units")
@@ -156,7 +200,19 @@ def generate_reports_v2(csv_file: str = "data/market_analysis_v2.csv"):
         print(f"  - Total profitability: {low_volume['profitability'].sum():,.0f} gil/day")
         print(f"  - Examples: {', '.join(low_volume.nlargest(3, 'profitability')['item_name'].tolist())}")
     
+    if 'mc_expected_profit' in df.columns:
+        print("\nSIMULATED DOWNSIDE (Monte Carlo over observed prices and daily volumes)")
+        print("Top 15 by expected profit, with the 5% worst-day profit and chance of a losing day")
+        risk = df.dropna(subset=['mc_expected_profit']).nlargest(15, 'mc_expected_profit')[
+            ['item_id', 'item_name', 'profitability', 'mc_expected_profit', 'mc_profit_p05', 'mc_cvar_05', 'mc_prob_loss']
+        ].copy()
+        for col in ['profitability', 'mc_expected_profit', 'mc_profit_p05', 'mc_cvar_05']:
+            risk[col] = risk[col].apply(lambda x: f"{x:,.0f}")
+        risk['mc_prob_loss'] = risk['mc_prob_loss'].apply(lambda x: f"{x:.1%}")
+        print(risk.to_string(index=False))
+    
     print("\n" + "=" * 110 + "\n")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     generate_reports_v2()
@@ -1,8 +1,11 @@
 """
 Quick debug script to inspect API structure
 """
+import logging
 from src.universalis_client import UniversalisClient
 
+logging.basicConfig(level=logging.INFO)
+
 client = UniversalisClient()
 
 # Get worlds
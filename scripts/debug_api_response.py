@@ -1,9 +1,12 @@
 """
 Debug: inspect raw API response
 """
+import logging
 from src.universalis_client import UniversalisClient
 import json
 
+logging.basicConfig(level=logging.INFO)
+
 client = UniversalisClient(datacenter="Chaos")
 
 # Get data for a few items
@@ -1,9 +1,12 @@
 """
 Deep inspection of API data structure and metrics
 """
+import logging
 from src.universalis_client import UniversalisClient
 import json
 
+logging.basicConfig(level=logging.INFO)
+
 client = UniversalisClient(datacenter="Chaos")
 
 # Get detailed data for some items - both aggregated and history
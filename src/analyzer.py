@@ -2,18 +2,22 @@
 Market analysis and profitability calculation
 """
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 import pandas as pd
 from src.universalis_client import UniversalisClient
-from src.item_mapper import fetch_item_names_batch
+from src.market_snapshot import MarketSnapshot
+from src.metric_engine import MetricEngine
 
 logger = logging.getLogger(__name__)
 
 class MarketAnalyzer:
-    def __init__(self, datacenter: str = "Chaos"):
+    def __init__(self, datacenter: str = "Chaos", snapshot: Optional[MarketSnapshot] = None):
         self.client = UniversalisClient(datacenter)
         self.datacenter = datacenter
+        # Pass the v2 analyzer's snapshot to reuse data already fetched this run
+        self.snapshot = snapshot or MarketSnapshot(self.client)
+        self.engine = MetricEngine(self.client, datacenter, self.snapshot)
     
     def get_test_items(self, num_random: int = 100, num_top_sellers: int = 100) -> List[int]:
         """
@@ -33,18 +37,8 @@ class MarketAnalyzer:
         try:
             # Use the datacenter name directly - it's recognized by the API
             # Get most recently updated items - these have recent market activity
-            url = f"{self.client.BASE_URL}/extra/stats/most-recently-updated"
-            params = {"dcName": self.datacenter, "entries": 200}
-            
-            import requests
-            self.client._rate_limit()
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            recent_data = response.json()
-            if 'items' in recent_data and recent_data['items']:
-                for item in recent_data['items']:
-                    all_items_set.add(item['itemID'])
+            all_items_set.update(self.client.get_recently_updated(entries=200))
+            if all_items_set:
                 logger.info(f"Found {len(all_items_set)} recently updated items on {self.datacenter}")
         
         except Exception as e:
@@ -67,24 +61,9 @@ class MarketAnalyzer:
         
         all_data = {}
         
-        # Process in batches of 100 (API limit)
-        for i in range(0, len(item_ids), 100):
-            batch = item_ids[i:i+100]
-            logger.info(f"Processing batch {i//100 + 1}: items {i+1} to {min(i+100, len(item_ids))}")
-            
-            try:
-                response = self.client.get_aggregated_data(batch)
-                
-                if 'results' in response:
-                    for result in response['results']:
-                        item_id = result['itemId']
-                        all_data[item_id] = result
-                
-                if 'failedItems' in response and response['failedItems']:
-                    logger.warning(f"Failed to fetch {len(response['failedItems'])} items")
-            
-            except Exception as e:
-                logger.error(f"Error fetching batch: {e}")
+        # Batches of 100 (API limit); failures are isolated and failedItems re-queued
+        for payloads in self.snapshot.iter_batches('aggregated', item_ids):
+            all_data.update(payloads)
         
         logger.info(f"Successfully fetched data for {len(all_data)} items")
         return all_data
@@ -100,84 +79,10 @@ class MarketAnalyzer:
         
         This shows the potential profit from buying items and reselling them.
         """
-        results = []
-        
-        # Fetch item names in batch
-        item_names = fetch_item_names_batch(item_ids)
-        
-        for item_id in item_ids:
-            if item_id not in item_data:
-                continue
-            
-            data = item_data[item_id]
-            
-            try:
-                # Extract NQ and HQ data separately
-                nq_data = data.get('nq', {})
-                hq_data = data.get('hq', {})
-                
-                # For NQ: use average sale price and min listing (what we can buy at)
-                nq_min_listing = nq_data.get('minListing', {}).get('dc', {}).get('price', 0)
-                nq_avg_sale = nq_data.get('averageSalePrice', {}).get('dc', {}).get('price', 0)
-                nq_daily_velocity = nq_data.get('dailySaleVelocity', {}).get('dc', {}).get('quantity', 0)
-                
-                # If no DC-level min listing, try region
-                if nq_min_listing == 0:
-                    nq_min_listing = nq_data.get('minListing', {}).get('region', {}).get('price', 0)
-                
-                # If no DC-level average, try region  
-                if nq_avg_sale == 0:
-                    nq_avg_sale = nq_data.get('averageSalePrice', {}).get('region', {}).get('price', 0)
-                
-                if nq_daily_velocity == 0:
-                    nq_daily_velocity = nq_data.get('dailySaleVelocity', {}).get('region', {}).get('quantity', 0)
-                
-                # For HQ: same approach
-                hq_min_listing = hq_data.get('minListing', {}).get('dc', {}).get('price', 0)
-                hq_avg_sale = hq_data.get('averageSalePrice', {}).get('dc', {}).get('price', 0)
-                hq_daily_velocity = hq_data.get('dailySaleVelocity', {}).get('dc', {}).get('quantity', 0)
-                
-                if hq_min_listing == 0:
-                    hq_min_listing = hq_data.get('minListing', {}).get('region', {}).get('price', 0)
-                
-                if hq_avg_sale == 0:
-                    hq_avg_sale = hq_data.get('averageSalePrice', {}).get('region', {}).get('price', 0)
-                    
-                if hq_daily_velocity == 0:
-                    hq_daily_velocity = hq_data.get('dailySaleVelocity', {}).get('region', {}).get('quantity', 0)
-                
-                # Calculate margin: profit per unit = what we sell for - what we buy for
-                # Using average sale price as what we can sell for
-                nq_margin_per_unit = nq_avg_sale - nq_min_listing if (nq_avg_sale > 0 and nq_min_listing > 0) else 0
-                nq_profitability = nq_margin_per_unit * nq_daily_velocity
-                
-                hq_margin_per_unit = hq_avg_sale - hq_min_listing if (hq_avg_sale > 0 and hq_min_listing > 0) else 0
-                hq_profitability = hq_margin_per_unit * hq_daily_velocity
-                
-                # Skip items with no market activity
-                if nq_daily_velocity == 0 and hq_daily_velocity == 0:
-                    continue
-                
-                result = {
-                    'item_id': item_id,
-                    'item_name': item_names.get(item_id, f"Item_{item_id}"),
-                    'nq_min_listing': nq_min_listing,
-                    'nq_avg_sale_price': nq_avg_sale,
-                    'nq_daily_sales': nq_daily_velocity,
-                    'nq_margin_per_unit': nq_margin_per_unit,
-                    'nq_profitability': nq_profitability,
-                    'hq_min_listing': hq_min_listing,
-                    'hq_avg_sale_price': hq_avg_sale,
-                    'hq_daily_sales': hq_daily_velocity,
-                    'hq_margin_per_unit': hq_margin_per_unit,
-                    'hq_profitability': hq_profitability,
-                }
-                results.append(result)
-            
-            except Exception as e:
-                logger.warning(f"Error processing item {item_id}: {e}")
-        
-        return results
+        payloads = {item_id: item_data[item_id] for item_id in item_ids if item_id in item_data}
+        # Items without market activity get no row (see the v1_margins metric)
+        df = self.engine.compute(list(payloads), ['v1_margins', 'item_name'], inputs={'aggregated': payloads})
+        return df.to_dict('records')
     
     def analyze_and_export(self, output_file: str = "data/market_analysis.csv",
                           num_random: int = 100, num_top_sellers: int = 100):
@@ -2,18 +2,56 @@
 Market analysis v2 using historical data instead of aggregated data
 This provides more realistic profitability calculations
 """
-import statistics
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional
 import logging
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
 import time
-from src.universalis_client import UniversalisClient
+from src.universalis_client import UniversalisClient, ANALYSIS_HISTORY_FIELDS
+from src.results_io import write_results, build_run_metadata
+from src.quantile_sketch import SketchStore
+from src.trends import TrendTracker
+from src.forecast import Forecaster
+from src.market_metadata import MarketMetadata
+from src.market_snapshot import MarketSnapshot
+from src.item_selection import ItemSelector
+from src.warehouse import ResultsWarehouse
+from src.risk_sim import DEFAULT_PATHS
+from src.streaming import StreamingResultWriter, RunningSummary
+from src.compression import IO_STATS
+from src.perf import StageTimer
+from src.metric_engine import MetricEngine, sales_frame
 from src.item_mapper import fetch_item_names_batch
-from src.craft_cost import estimate_craft_cost
 
 logger = logging.getLogger(__name__)
 
+SECONDS_PER_DAY = 86400
+# Sale window requested from /history: the 7-day trend window, which also
+# covers the 3-day sell price
+HISTORY_DAYS = 7
+
+# Columns written to the result file, in order (missing optional ones are skipped)
+EXPORT_COLUMNS = [
+    'item_id', 'item_name',
+    'buy_price', 'median_price', 'sell_price', 'sell_price_p75',
+    'margin_per_unit', 'daily_volume', 'profitability',
+    'price_min', 'price_p25', 'price_p75', 'price_max',
+    'total_sales_in_history', 'total_quantity_in_history', 'days_span', 'anomalous_sales',
+    'sell_world_id', 'tax_rate', 'net_sell_price', 'net_margin_per_unit', 'net_profitability',
+    'sketch_p25', 'sketch_median', 'sketch_p75',
+    'vwap_7d', 'volume_7d', 'median_7d', 'volatility_7d', 'vwap_change_7d', 'trend_days',
+    'forecast_sell_price', 'forecast_daily_volume', 'forecast_days',
+    'depth_buy_price', 'depth_marginal_price', 'depth_units_filled',
+    'depth_units_listed', 'depth_fill_ratio', 'depth_profitability',
+    'mc_expected_profit', 'mc_profit_std', 'mc_profit_p05', 'mc_profit_p50',
+    'mc_cvar_05', 'mc_prob_loss',
+    'hq_buy_price', 'hq_median_price', 'hq_sell_price', 'hq_sell_price_p75',
+    'hq_margin_per_unit', 'hq_daily_volume', 'hq_profitability',
+    'hq_price_min', 'hq_price_p25', 'hq_price_p75', 'hq_price_max',
+    'hq_total_sales_in_history', 'hq_total_quantity_in_history', 'hq_premium',
+    'craft_cost', 'craft_sell_quality', 'craft_profit', 'craft_profit_daily'
+]
+
 class MarketAnalyzerV2:
     """
     Improved market analyzer using historical sales data
@@ -25,223 +63,214 @@ class MarketAnalyzerV2:
     4. Shows price distribution instead of just one number
     """
     
-    def __init__(self, datacenter: str = "Chaos"):
+    def __init__(self, datacenter: str = "Chaos", sketch_store: Optional[SketchStore] = None,
+                 trend_tracker: Optional[TrendTracker] = None,
+                 metadata: Optional[MarketMetadata] = None,
+                 selector: Optional[ItemSelector] = None,
+                 warehouse: Optional[ResultsWarehouse] = None,
+                 snapshot: Optional[MarketSnapshot] = None,
+                 history_days: Optional[float] = HISTORY_DAYS,
+                 forecaster: Optional[Forecaster] = None):
         self.client = UniversalisClient(datacenter)
         self.datacenter = datacenter
+        self.history_days = history_days
+        # Cached world/DC/tax registry used for tax-aware margins
+        self.metadata = metadata
+        # Per-run market data shared by history analysis, craft costing and the
+        # order book; a snapshot passed in may also be shared with other analyzers.
+        # History is limited to the analysis window and the entry fields v2 reads
+        self.snapshot = snapshot or MarketSnapshot(
+            self.client, history_entries=100, history_fields=ANALYSIS_HISTORY_FIELDS,
+            history_within=history_days * SECONDS_PER_DAY if history_days else None)
+        self._owns_snapshot = snapshot is None
+        # Optional long-horizon state, updated incrementally every run
+        self.sketch_store = sketch_store
+        self.trend_tracker = trend_tracker
+        # Optional price/volume forecasts fitted on the trend tracker's daily bars
+        self.forecaster = forecaster
+        # Optional adaptive selection: spend the request budget on promising items
+        self.selector = selector
+        # Optional run history: every exported run is also appended here
+        self.warehouse = warehouse
+        # Wall time per pipeline stage of the current run (benchmarks, logs)
+        self.timer = StageTimer()
+        # Metric plugins (v2 percentiles, craft, tax, depth, risk) over the shared snapshot
+        self.engine = MetricEngine(self.client, datacenter, self.snapshot, metadata=metadata, timer=self.timer)
     
     def get_test_items(self, num_items: int = 200) -> List[int]:
         """
         Get active items from the market
+
+        With a selector, recently updated items and items known from previous
+        runs are candidates, and the selector picks which ones to refresh.
         """
         logger.info(f"Selecting {num_items} active items from the market...")
         
         all_items_set = set()
         
         try:
-            url = f"{self.client.BASE_URL}/extra/stats/most-recently-updated"
-            params = {"dcName": self.datacenter, "entries": 300}
-            
-            import requests
-            self.client._rate_limit()
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            recent_data = response.json()
-            if 'items' in recent_data and recent_data['items']:
-                for item in recent_data['items']:
-                    all_items_set.add(item['itemID'])
+            all_items_set.update(self.client.get_recently_updated(entries=300))
+            if all_items_set:
                 logger.info(f"Found {len(all_items_set)} recently updated items on {self.datacenter}")
         
         except Exception as e:
             logger.warning(f"Could not fetch recently updated items: {e}")
         
         active_items = list(all_items_set)
+        if self.selector is not None:
+            candidates = active_items + self.selector.known_items()
+            return self.selector.select(candidates, num_items)
         return active_items[:num_items]
     
-    def analyze_item_history(self, item_id: int, history_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _update_incremental_state(self, item_ids: List[int], payloads: Dict[int, Any],
+                                  sales: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
-        Analyze a single item's history to extract realistic metrics based on actual sales.
-
-        Pricing model (to avoid overvalued listings):
-        - buy_price: 25th percentile of recent sales (what we realistically pay to acquire)
-        - sell_price: median of recent sales (what buyers actually pay)
-        We also compute p75 for reference but do not assume we can sell at p75 by default.
-
-        Volume model:
-        - daily_volume: average quantity sold per day from actual sales timestamps
+        Feed new sales into the optional sketch store / trend tracker, refit the
+        forecasts on the closed days, and return their long-horizon metrics
+        (all stored history, not just this fetch). Sales marked anomalous in
+        `sales` (the engine's sales input, in payload entry order) are skipped.
         """
-        
-        try:
-            entries = history_data.get('entries', [])
-            
-            if not entries:
-                return None
-            
-            # Extract all prices and quantities from history
-            prices = []
-            prices_recent = []  # last 3 days for a fresher sell-price estimate
-            total_quantity = 0
-            latest_ts = history_data.get('lastUploadTime', 0) / 1000  # seconds
-            three_days_ago = latest_ts - 3 * 86400 if latest_ts else None
-            
-            for entry in entries:
-                if entry.get('hq'):  # Skip HQ for now, focus on NQ
-                    continue
-                
-                price = entry.get('pricePerUnit', 0)
-                quantity = entry.get('quantity', 0)
-                timestamp = entry.get('timestamp', 0)
-
-                if price > 0 and quantity > 0:
-                    prices.append(price)
-                    total_quantity += quantity
-                    if three_days_ago and timestamp >= three_days_ago:
-                        prices_recent.append(price)
-            
-            if not prices:
-                return None
-            
-            # Get timestamps to calculate days (span of observed history)
-            timestamps = [e.get('timestamp', 0) for e in entries if e.get('timestamp', 0) > 0]
-            if timestamps:
-                oldest_timestamp = min(timestamps)
-                latest_timestamp = max(timestamps)
-                days_span = max((latest_timestamp - oldest_timestamp) / 86400, 1)  # At least 1 day
-            else:
-                days_span = 1
-            
-            # Calculate price metrics (using sales, not listings)
-            prices_sorted = sorted(prices)
-
-            # Percentiles
-            if len(prices_sorted) > 3:
-                q1, q2, q3 = statistics.quantiles(prices_sorted, n=4)
-            else:
-                q1 = min(prices_sorted)
-                q2 = statistics.median(prices_sorted)
-                q3 = max(prices_sorted)
-
-            # Recent median (last 3 days) to avoid stale/overpriced sells
-            if len(prices_recent) >= 5:
-                sell_price = statistics.median(prices_recent)
-            else:
-                sell_price = q2
-
-            buy_price = q1
-            median_price = q2
-            p75_price = q3
-            
-            daily_volume = total_quantity / days_span
-            
-            result = {
-                'item_id': item_id,
-                'buy_price': buy_price,  # 25th percentile of sales
-                'median_price': median_price,  # Overall median
-                'sell_price': sell_price,  # Median of last 3 days if available, else overall median
-                'sell_price_p75': p75_price,
-                'margin_per_unit': sell_price - buy_price,
-                'daily_volume': daily_volume,
-                'profitability': (sell_price - buy_price) * daily_volume,
-                'price_min': min(prices_sorted),
-                'price_max': max(prices_sorted),
-                'price_p25': buy_price,
-                'price_p75': p75_price,
-                'total_sales_in_history': len(prices),
-                'total_quantity_in_history': total_quantity,
-                'days_span': days_span,
-            }
-            
-            return result
-        
-        except Exception as e:
-            logger.warning(f"Error analyzing item {item_id}: {e}")
-            return None
+        now = time.time()
+        flagged: Dict[int, np.ndarray] = {}
+        if sales is not None and sales['anomalous'].any():
+            for item_id, mask in sales.groupby('item_id', sort=False)['anomalous']:
+                if mask.any():
+                    flagged[int(item_id)] = mask.to_numpy()
+        rows = []
+        for item_id in item_ids:
+            history_data = payloads[item_id]
+            if item_id in flagged:
+                entries = history_data.get('entries', [])
+                history_data = dict(history_data, entries=[e for e, bad in zip(entries, flagged[item_id]) if not bad])
+            row = {'item_id': item_id}
+            if self.sketch_store is not None:
+                self.sketch_store.update_from_history(item_id, history_data)
+                row.update(self.sketch_store.price_quantiles(item_id) or {})
+            if self.trend_tracker is not None:
+                self.trend_tracker.update_from_history(item_id, history_data)
+                row.update(self.trend_tracker.trend_metrics(item_id, now=now))
+            rows.append(row)
+        state = pd.DataFrame(rows)
+        if self.forecaster is not None and self.trend_tracker is not None:
+            self.forecaster.update(self.trend_tracker, item_ids, now=now)
+            state = state.merge(self.forecaster.forecast(item_ids), on='item_id', how='left')
+        return state
+    
+    def metric_names(self, use_order_book: bool = False, risk_paths: int = 0) -> List[str]:
+        """Metric plugins computed for a run with these options"""
+        names = ['v2_percentiles', 'item_name', 'craft_profit']
+        if self.metadata is not None:
+            names.append('tax_margin')
+        if use_order_book:
+            names.append('order_book')
+        if risk_paths:
+            names.append('risk')
+        return names
     
-    def fetch_and_analyze(self, item_ids: List[int]) -> List[Dict[str, Any]]:
+    def _analyze(self, payloads: Dict[int, Any], use_order_book: bool = False,
+                 risk_paths: int = 0, item_names: Optional[Dict[int, str]] = None) -> pd.DataFrame:
         """
-        Fetch history data for items and analyze profitability
+        All metrics for one set of history payloads in one engine pass, plus the
+        incremental sketch/trend columns; most profitable first.
+        Craft ingredients, listings and names are fetched once for the whole set
+        (item_names may pass names already resolved for a larger set).
+        """
+        # Built here so the incremental state skips the same anomalous sales as the metrics
+        sales = sales_frame(payloads)
+        inputs = {'history': payloads, 'sales': sales}
+        if item_names is not None:
+            inputs['item_names'] = item_names
+        df = self.engine.compute(list(payloads), self.metric_names(use_order_book, risk_paths),
+                                 inputs=inputs, risk_paths=risk_paths)
+        if len(df) and (self.sketch_store is not None or self.trend_tracker is not None):
+            state = self._update_incremental_state(df['item_id'].tolist(), payloads, sales)
+            df = df.merge(state, on='item_id', how='left')
+        return df.sort_values('profitability', ascending=False, kind='stable').reset_index(drop=True)
+    
+    def fetch_and_analyze(self, item_ids: List[int], use_order_book: bool = False,
+                          risk_paths: int = 0) -> pd.DataFrame:
         """
+        Fetch history data for items and compute the v2 metrics
+        """
+        df = self._analyze(self._fetch_history(item_ids), use_order_book, risk_paths)
+        logger.info(f"Successfully analyzed {len(df)} items")
+        return df
+    
+    def _fetch_history(self, item_ids: List[int]) -> Dict[int, Any]:
         logger.info(f"Fetching history for {len(item_ids)} items...")
         
-        all_results = []
-        
-        # Process in batches of 100
-        for i in range(0, len(item_ids), 100):
-            batch = item_ids[i:i+100]
-            logger.info(f"Processing batch {i//100 + 1}: items {i+1} to {min(i+100, len(item_ids))}")
-            
-            try:
-                response = self.client.get_history(batch, entries_to_return=100)
-                
-                # Response can be either a single item or multiple
-                if 'itemID' in response:
-                    # Single item response
-                    result = self.analyze_item_history(response['itemID'], response)
-                    if result:
-                        all_results.append(result)
-                
-                elif 'items' in response:
-                    # Multiple items response
-                    for item_id, item_data in response['items'].items():
-                        result = self.analyze_item_history(int(item_id), item_data)
-                        if result:
-                            all_results.append(result)
-            
-            except Exception as e:
-                logger.error(f"Error fetching batch: {e}")
-        
-        logger.info(f"Successfully analyzed {len(all_results)} items")
-        
-        # Fetch item names
-        item_ids_to_fetch = [r['item_id'] for r in all_results]
-        item_names = fetch_item_names_batch(item_ids_to_fetch)
-        
-        for result in all_results:
-            result['item_name'] = item_names.get(result['item_id'], f"Item_{result['item_id']}")
-        
-        return all_results
+        # Batches of 100 with retries, bisection of failing batches and
+        # re-queueing of unresolved IDs, served once per run by the snapshot
+        with self.timer.stage('history'):
+            return self.snapshot.history(item_ids)
+    
+    def _save_state(self):
+        if self.sketch_store is not None:
+            self.sketch_store.save()
+        if self.trend_tracker is not None:
+            self.trend_tracker.save()
+        if self.forecaster is not None:
+            self.forecaster.save()
     
-    def analyze_and_export(self, output_file: str = "data/market_analysis_v2.csv",
-                          num_items: int = 200):
+    def _run_metadata(self, num_items: int, item_ids: Optional[List[int]], use_order_book: bool,
+                      risk_paths: int, **extra) -> Dict[str, Any]:
+        parameters = {'num_items': num_items if item_ids is None else len(item_ids),
+                      'use_order_book': use_order_book,
+                      'risk_paths': risk_paths,
+                      'history_days': self.history_days}
+        parameters.update(extra)
+        return build_run_metadata(self.datacenter, parameters)
+    
+    def analyze_and_export(self, output_file: str = "data/market_analysis_v2.parquet",
+                          num_items: int = 200, csv_file: Optional[str] = None,
+                          use_order_book: bool = False, item_ids: Optional[List[int]] = None,
+                          risk_paths: int = DEFAULT_PATHS):
         """
         Complete analysis pipeline using history data
+
+        Results are written to output_file (Parquet/Feather/CSV by extension) with
+        the run metadata embedded; csv_file optionally writes an extra CSV copy.
+        With use_order_book, current listings are fetched to add depth-based buy prices.
+        item_ids overrides the recently-updated item selection (e.g. a full crawl).
+        risk_paths Monte Carlo paths per item are simulated for the mc_* risk columns (0 = skip).
         """
-        # Get test items
-        test_items = self.get_test_items(num_items)
+        if self._owns_snapshot:
+            self.snapshot.clear()
+        IO_STATS.reset()
+        self.timer.reset()
         
-        # Analyze history
-        results = self.fetch_and_analyze(test_items)
-
-        # Optional: craft cost estimation (best-effort; may fail for non-craftables)
-        for r in results:
-            craft_info = estimate_craft_cost(r['item_id'], self.client, self.datacenter)
-            if craft_info:
-                r['craft_cost'] = craft_info['craft_cost']
-                r['craft_profit'] = r['sell_price'] - craft_info['craft_cost']
-                r['craft_profit_per_unit'] = r['sell_price'] - craft_info['craft_cost']
-                r['craft_profit_daily'] = (r['sell_price'] - craft_info['craft_cost']) * r['daily_volume']
+        # Get test items
+        with self.timer.stage('select'):
+            test_items = item_ids if item_ids is not None else self.get_test_items(num_items)
         
-        # Sort by profitability
-        results_sorted = sorted(results, key=lambda x: x['profitability'], reverse=True)
+        # Analyze history (craft costs, tax, order-book depth and risk in the same pass)
+        payloads = self._fetch_history(test_items)
+        df = self._analyze(payloads, use_order_book, risk_paths)
+        logger.info(f"Successfully analyzed {len(df)} items")
         
-        # Create DataFrame and export
-        df = pd.DataFrame(results_sorted)
+        if self.selector is not None and item_ids is None:
+            # IDs the fetch did not resolve teach the selector nothing
+            self.selector.update(test_items, df, resolved=payloads)
+            self.selector.save()
         
         if len(df) > 0:
-            export_columns = [
-                'item_id', 'item_name',
-                'buy_price', 'median_price', 'sell_price', 'sell_price_p75',
-                'margin_per_unit', 'daily_volume', 'profitability',
-                'price_min', 'price_p25', 'price_p75', 'price_max',
-                'total_sales_in_history', 'total_quantity_in_history', 'days_span',
-                'craft_cost', 'craft_profit', 'craft_profit_daily'
-            ]
-            
-            export_columns = [col for col in export_columns if col in df.columns]
+            export_columns = [col for col in EXPORT_COLUMNS if col in df.columns]
             df = df[export_columns]
-            df.to_csv(output_file, index=False)
+
+            with self.timer.stage('export'):
+                self._save_state()
+
+                metadata = self._run_metadata(num_items, item_ids, use_order_book, risk_paths)
+                write_results(df, output_file, metadata)
+                if csv_file:
+                    write_results(df, csv_file)
+                if self.warehouse is not None:
+                    self.warehouse.insert_run(df, metadata)
             
             logger.info(f"Analysis complete! Results exported to {output_file}")
+            logger.info(f"Market data requests: {self.snapshot.summary()}")
+            logger.info(f"I/O: {IO_STATS.summary()}")
+            logger.info(f"Stage timings: {self.timer.summary()}")
             logger.info(f"\nTop 15 items by profitability:")
             top_cols = ['item_id', 'item_name', 'buy_price', 'sell_price', 'daily_volume', 'profitability']
             top_cols = [col for col in top_cols if col in df.columns]
@@ -261,3 +290,80 @@ class MarketAnalyzerV2:
             logger.warning("No items were successfully analyzed")
         
         return df
+    
+    def analyze_streaming(self, output_path: str = "data/market_analysis_v2_parts",
+                          num_items: int = 200, item_ids: Optional[List[int]] = None,
+                          use_order_book: bool = False, risk_paths: int = DEFAULT_PATHS,
+                          top_k: int = 15) -> RunningSummary:
+        """
+        Bounded-memory variant of analyze_and_export for large scans.
+
+        Each history batch is analyzed, enriched and appended to output_path
+        (a directory of Parquet parts, or a .csv file) before the next batch is
+        fetched; only the running top-K and summary statistics stay in memory.
+        The partial output is readable with load_results(output_path) mid-run.
+        """
+        if self._owns_snapshot:
+            self.snapshot.clear()
+        IO_STATS.reset()
+        self.timer.reset()
+        
+        with self.timer.stage('select'):
+            test_items = item_ids if item_ids is not None else self.get_test_items(num_items)
+        metadata = self._run_metadata(num_items, item_ids, use_order_book, risk_paths, streaming=True)
+        writer = StreamingResultWriter(output_path, EXPORT_COLUMNS, metadata)
+        summary = RunningSummary(top_k=top_k)
+        run_id = self.warehouse.begin_run(metadata) if self.warehouse is not None else None
+        
+        logger.info(f"Streaming analysis of {len(test_items)} items to {output_path}...")
+        learn = self.selector is not None and item_ids is None
+        targets = {int(i) for i in test_items}
+        # Names for the whole scan at once: a cold cache downloads the item dump once, not per chunk
+        with self.timer.stage('item_name'):
+            names = fetch_item_names_batch(list(targets))
+        profitable = 0
+        for payloads in self.snapshot.iter_batches('history', test_items):
+            df = self._analyze(payloads, use_order_book, risk_paths, item_names=names)
+            # History and listings of this chunk are not needed again this run; keep
+            # memory flat. Ingredient prices stay cached (bounded by the recipe graph)
+            self.snapshot.evict('history', list(payloads))
+            self.snapshot.evict('listings', list(payloads))
+            
+            if learn:
+                profitable += self.selector.update(list(payloads), df, record_run=False)['profitable']
+            if len(df) == 0:
+                continue
+            
+            with self.timer.stage('export'):
+                writer.append(df)
+                summary.update(df)
+                if run_id is not None:
+                    self.warehouse.append_items(run_id, df, metadata)
+        
+        self._save_state()
+        if learn:
+            # One run record for the whole scan, like a batch run (IDs the API
+            # never returned were not rewarded)
+            self.selector.run_stats(len(targets), profitable)
+            self.selector.save()
+        
+        stats = summary.stats()
+        logger.info(f"Streaming analysis complete! {writer.rows} rows in {writer.parts} chunks at {output_path}")
+        logger.info(f"Market data requests: {self.snapshot.summary()}")
+        logger.info(f"I/O: {IO_STATS.summary()}")
+        logger.info(f"Stage timings: {self.timer.summary()}")
+        if stats['items']:
+            print(f"\nTop {top_k} items by profitability:")
+            print("\n" + summary.top().to_string(index=False))
+            print(f"\n\nStatistics:")
+            print(f"Total items analyzed: {stats['items']}")
+            print(f"Average daily profitability per item: {stats['mean']:,.0f} gil")
+            print(f"Total daily profitability (sum): {stats['total']:,.0f} gil")
+            print(f"Max daily profitability: {stats['max']:,.0f} gil")
+            print(f"Median daily profitability (approx.): {stats['median']:,.0f} gil")
+            print(f"Items with positive profitability: {stats['positive']}")
+            print(f"Items with realistic volume (>5/day): {stats['liquid']}")
+        else:
+            logger.warning("No items were successfully analyzed")
+        
+        return summary
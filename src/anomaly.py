@@ -0,0 +1,176 @@
+"""
+Streaming detection of anomalous sales and listings (price spikes, dumps,
+manipulation).
+
+Each (item, quality) keeps a robust location/scale estimate of log sale
+prices: a running median and MAD. Exact rolling medians cost O(log n) per
+update and need the window in memory, so both are tracked with frugal
+stochastic-approximation steps instead, which are O(1) and keep two floats
+of state:
+
+- median: moves a bounded step (ETA_MEDIAN x scale) towards each new price,
+  so a single extreme sale barely moves it,
+- MAD: scaled up or down by a constant factor depending on whether the new
+  absolute deviation is above or below it (converges to the median absolute
+  deviation, stays positive).
+
+The first WARMUP sales initialize both from their exact median and MAD. A
+sale is anomalous when its robust z-score |x - median| / (1.4826 MAD) is
+above Z_THRESHOLD; listings are scored against the same sale statistics
+without updating them.
+
+AnomalyDetector applies this per event (live feed); flag_sales() runs the
+identical updates over a whole sales frame at once, stepping every
+(item, quality) series in lockstep with array operations.
+"""
+import math
+import statistics
+import logging
+from collections import deque
+from typing import Dict, Tuple
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+WARMUP = 10          # sales before an item/quality is scored
+Z_THRESHOLD = 4.0    # robust z-score above which a price is anomalous
+ETA_MEDIAN = 0.1     # median step, in units of the current MAD
+ETA_MAD = 0.05       # log-factor by which the MAD moves per sale
+MIN_MAD = 0.05       # MAD floor in log price (about 5%), for items that always trade at one price
+MAD_TO_SIGMA = 1.4826
+
+
+class RobustStat:
+    """Running median / MAD of log prices for one item and quality"""
+
+    __slots__ = ('median', 'mad', 'n', '_warmup')
+
+    def __init__(self):
+        self.median = math.nan
+        self.mad = math.nan
+        self.n = 0
+        self._warmup = []
+
+    @property
+    def ready(self) -> bool:
+        return self.n >= WARMUP
+
+    def zscore(self, x: float) -> float:
+        """Robust z-score of a log price (NaN during warm-up)"""
+        if self.n < WARMUP:
+            return math.nan
+        return abs(x - self.median) / (MAD_TO_SIGMA * self.mad)
+
+    def update(self, x: float) -> float:
+        """Add one log price; returns its z-score against the estimate before the update"""
+        self.n += 1
+        if self.n <= WARMUP:
+            self._warmup.append(x)
+            if self.n < WARMUP:
+                return math.nan
+            self.median = statistics.median(self._warmup)
+            self.mad = max(statistics.median(abs(v - self.median) for v in self._warmup), MIN_MAD)
+            self._warmup = []
+            return abs(x - self.median) / (MAD_TO_SIGMA * self.mad)
+        d = x - self.median
+        z = abs(d) / (MAD_TO_SIGMA * self.mad)
+        if d:
+            self.median += math.copysign(ETA_MEDIAN * self.mad, d)
+        if abs(d) != self.mad:
+            self.mad = max(self.mad * math.exp(math.copysign(ETA_MAD, abs(d) - self.mad)), MIN_MAD)
+        return z
+
+
+class AnomalyDetector:
+    """
+    Per-event anomaly flags for sales and listings of many items.
+    Every check is O(1); flagged events are kept in a bounded log.
+    """
+
+    def __init__(self, z_threshold: float = Z_THRESHOLD, log_size: int = 1000):
+        self.z_threshold = z_threshold
+        self.stats: Dict[Tuple[int, bool], RobustStat] = {}
+        self.flagged: deque = deque(maxlen=log_size)
+        self.counts = {'sales': 0, 'flagged_sales': 0, 'listings': 0, 'flagged_listings': 0}
+
+    def check_sale(self, item_id: int, price: float, hq: bool = False, timestamp: float = 0.0) -> bool:
+        """Score a sale and fold it into the item's statistics; True if anomalous"""
+        if price <= 0:
+            return False
+        key = (int(item_id), bool(hq))
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = RobustStat()
+        z = stat.update(math.log(price))
+        self.counts['sales'] += 1
+        if z > self.z_threshold:
+            self.counts['flagged_sales'] += 1
+            self.flagged.append({'kind': 'sale', 'item_id': key[0], 'hq': key[1], 'price': price,
+                                 'typical_price': math.exp(stat.median), 'z': z, 'timestamp': timestamp})
+            return True
+        return False
+
+    def check_listing(self, item_id: int, price: float, hq: bool = False, timestamp: float = 0.0) -> bool:
+        """Score a listing against the item's sale statistics (not updated); True if anomalous"""
+        stat = self.stats.get((int(item_id), bool(hq)))
+        if stat is None or not stat.ready or price <= 0:
+            return False
+        self.counts['listings'] += 1
+        z = stat.zscore(math.log(price))
+        if z > self.z_threshold:
+            self.counts['flagged_listings'] += 1
+            self.flagged.append({'kind': 'listing', 'item_id': int(item_id), 'hq': bool(hq), 'price': price,
+                                 'typical_price': math.exp(stat.median), 'z': z, 'timestamp': timestamp})
+            return True
+        return False
+
+    def flagged_frame(self) -> pd.DataFrame:
+        """Recently flagged events, newest last"""
+        return pd.DataFrame(list(self.flagged), columns=['kind', 'item_id', 'hq', 'price', 'typical_price',
+                                                         'z', 'timestamp'])
+
+
+def flag_sales(sales: pd.DataFrame, z_threshold: float = Z_THRESHOLD) -> pd.Series:
+    """
+    Anomaly flags for a sales frame (item_id, hq, price, timestamp), as if
+    each item's sales had been streamed through AnomalyDetector oldest first.
+    The warm-up sales are also checked against the initial estimate, since
+    the whole history is at hand. Invalid prices are never flagged.
+    """
+    flags = np.zeros(len(sales), dtype=bool)
+    valid = (sales['price'] > 0).to_numpy()
+    if not valid.any():
+        return pd.Series(flags, index=sales.index)
+    rows = np.flatnonzero(valid)
+    frame = sales.iloc[rows]
+    order = np.lexsort((frame['timestamp'].to_numpy(), frame['hq'].to_numpy(), frame['item_id'].to_numpy()))
+    rows = rows[order]
+    keys = frame['item_id'].to_numpy()[order] * 2 + frame['hq'].to_numpy()[order]
+    values = np.log(frame['price'].to_numpy(dtype=np.float64)[order])
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    warm = counts >= WARMUP
+    starts, counts = starts[warm], counts[warm]
+    if not len(starts):
+        return pd.Series(flags, index=sales.index)
+
+    # Exact median / MAD of each series' first WARMUP sales
+    block_idx = starts[:, None] + np.arange(WARMUP)
+    block = values[block_idx]
+    median = np.median(block, axis=1)
+    mad = np.maximum(np.median(np.abs(block - median[:, None]), axis=1), MIN_MAD)
+    z = np.abs(block - median[:, None]) / (MAD_TO_SIGMA * mad[:, None])
+    flags[rows[block_idx[z > z_threshold]]] = True
+
+    # Then every series steps through its k-th sale together
+    for k in range(WARMUP, int(counts.max())):
+        active = np.flatnonzero(counts > k)
+        idx = starts[active] + k
+        d = values[idx] - median[active]
+        m = mad[active]
+        flags[rows[idx[np.abs(d) / (MAD_TO_SIGMA * m) > z_threshold]]] = True
+        median[active] += np.sign(d) * ETA_MEDIAN * m
+        mad[active] = np.maximum(m * np.exp(np.sign(np.abs(d) - m) * ETA_MAD), MIN_MAD)
+    return pd.Series(flags, index=sales.index)
@@ -0,0 +1,253 @@
+"""
+Failure-isolating batch fetcher for the Universalis multi-item endpoints.
+
+A single error used to drop a whole 100-item batch. BatchFetcher instead:
+- retries transient failures (timeouts, connection errors, 429/5xx) with
+  jittered exponential backoff,
+- bisects a batch that keeps failing for non-transient reasons until the
+  offending IDs are isolated; when both halves fail the same way the error
+  is systemic (wrong datacenter, 403, API change) and is re-raised instead,
+- re-queues IDs the API reports as failed/unresolved into later batches,
+- remembers permanently bad IDs on disk so future runs skip them.
+
+An ID is only blacklisted on item-specific evidence: the API reporting it
+as failed/unresolved, or a single ID failing while its sibling half
+succeeds. The bad item list is keyed by scope (endpoint and datacenter),
+and each save merges with the file on disk so fetchers don't overwrite
+each other's entries.
+"""
+import random
+import time
+import logging
+from collections import deque
+from typing import Callable, Dict, Any, List, Iterator, Optional, Tuple
+import requests
+from src.compression import read_json, write_json, store_exists
+
+logger = logging.getLogger(__name__)
+
+BAD_ITEMS_FILE = "data/bad_items.json"
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """True for errors worth retrying as-is (network problems, rate limiting, 5xx)"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def _failure_key(error: Exception) -> Tuple[Any, ...]:
+    """What makes two failures 'the same way': the status code for HTTP errors"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return ('http', error.response.status_code)
+    return (type(error).__name__, str(error))
+
+
+def split_response(response: Dict[str, Any]) -> Tuple[Dict[int, Any], List[int]]:
+    """
+    Normalize a multi-item response into ({item_id: payload}, failed_ids).
+
+    Handles history/current-data responses ('items' dict or a single 'itemID'
+    object, with 'unresolvedItems') and aggregated responses ('results' list
+    with 'failedItems').
+    """
+    payloads: Dict[int, Any] = {}
+    if 'itemID' in response:
+        payloads[int(response['itemID'])] = response
+    elif 'items' in response:
+        payloads = {int(item_id): data for item_id, data in response['items'].items()}
+    elif 'results' in response:
+        payloads = {int(result['itemId']): result for result in response['results']}
+
+    failed = response.get('failedItems') or response.get('unresolvedItems') or []
+    return payloads, [int(item_id) for item_id in failed]
+
+
+class BatchFetcher:
+    """
+    Fetch many item IDs through a batch endpoint (e.g. client.get_history)
+    without letting individual failures take down whole batches.
+    """
+
+    def __init__(self, fetch_fn: Callable[[List[int]], Dict[str, Any]], batch_size: int = 100,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 max_requeues: int = 2, bad_items_path: str = BAD_ITEMS_FILE,
+                 bad_item_ttl: float = 7 * 86400, scope: str = 'default'):
+        self.fetch_fn = fetch_fn
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_requeues = max_requeues
+        self.bad_items_path = bad_items_path
+        self.bad_item_ttl = bad_item_ttl
+        # An ID can be bad for one endpoint/datacenter and fine for another
+        self.scope = scope
+        self.bad_items: Dict[int, Dict[str, Any]] = self._read_bad_items().get(scope, {})
+        self.stats = {'requests': 0, 'retries': 0, 'bisections': 0, 'requeued': 0, 'new_bad_items': 0}
+
+    def _read_bad_items(self) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """Unexpired entries of every scope on disk: {scope: {item_id: entry}}"""
+        if not self.bad_items_path or not store_exists(self.bad_items_path):
+            return {}
+        try:
+            data = read_json(self.bad_items_path)
+            now = time.time()
+            # Expired entries get another chance; the old unscoped layout ({item_id: entry}) is dropped
+            return {scope: {int(k): v for k, v in entries.items() if now - v.get('ts', 0) < self.bad_item_ttl}
+                    for scope, entries in data.items() if not scope.isdigit() and isinstance(entries, dict)}
+        except Exception as e:
+            logger.warning(f"Could not load bad item list: {e}")
+            return {}
+
+    def save_bad_items(self):
+        """Merge this scope's entries into the file, keeping other scopes' entries"""
+        if not self.bad_items_path:
+            return
+        try:
+            data = self._read_bad_items()
+            data.setdefault(self.scope, {}).update(self.bad_items)
+            write_json(self.bad_items_path, {scope: {str(k): v for k, v in entries.items()}
+                                             for scope, entries in data.items() if entries})
+        except Exception as e:
+            logger.warning(f"Could not save bad item list: {e}")
+
+    def _mark_bad(self, item_id: int, reason: str):
+        logger.warning(f"Marking item {item_id} as bad for {self.scope}: {reason}")
+        self.bad_items[item_id] = {'reason': reason, 'ts': time.time()}
+        self.stats['new_bad_items'] += 1
+
+    def _backoff(self, attempt: int):
+        # Full jitter: spreads retries out so parallel runs don't hammer in sync
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        time.sleep(delay)
+
+    def _call_with_retries(self, batch: List[int]) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats['requests'] += 1
+                return self.fetch_fn(batch)
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                self.stats['retries'] += 1
+                logger.info(f"Transient error on batch of {len(batch)} ({e}), retrying...")
+                self._backoff(attempt)
+        raise RuntimeError("unreachable")
+
+    def _try(self, batch: List[int]) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        """Call with retries; HTTP/network errors are returned, anything else (bugs, bad JSON) propagates"""
+        try:
+            return self._call_with_retries(batch), None
+        except (requests.HTTPError, requests.ConnectionError, requests.Timeout) as e:
+            return None, e
+
+    def _bisect(self, batch: List[int]) -> Iterator[Dict[str, Any]]:
+        """
+        Split a batch that failed and yield the responses of the
+        parts that succeed. An ID is only marked bad when it fails on its own
+        while its sibling half succeeds; both halves failing the same way
+        means the error has nothing to do with the items, so it is re-raised.
+        """
+        self.stats['bisections'] += 1
+        mid = len(batch) // 2
+        results = [(half,) + self._try(half) for half in (batch[:mid], batch[mid:])]
+        errors = [e for _, _, e in results if e is not None]
+        if len(errors) == 2 and _failure_key(errors[0]) == _failure_key(errors[1]):
+            logger.error(f"Both halves of a batch of {len(batch)} failed with {errors[0]}: not item-specific")
+            raise errors[0]
+
+        for half, response, e in results:
+            if response is not None:
+                yield response
+            elif is_transient(e):
+                logger.error(f"Giving up on {len(half)} items after retries: {e}")
+            elif len(half) > 1:
+                yield from self._bisect(half)
+            elif len(errors) == 1:
+                self._mark_bad(half[0], str(e) or repr(e))
+            else:
+                logger.error(f"Item {half[0]} failed with {e}; its sibling failed too, not marking it bad")
+
+    def iter_batches(self, item_ids: List[int]) -> Iterator[Dict[int, Any]]:
+        """
+        Yield {item_id: payload} for each successfully fetched batch.
+        Known-bad IDs are skipped; failed IDs are retried in later batches.
+        Errors that are not specific to the requested items (every half of a
+        batch failing the same way, or the whole first batch failing) are
+        re-raised after saving the bad item list.
+        """
+        skipped = [i for i in item_ids if i in self.bad_items]
+        if skipped:
+            logger.info(f"Skipping {len(skipped)} known-bad items for {self.scope}")
+        pending = [i for i in dict.fromkeys(item_ids) if i not in self.bad_items]
+
+        work = deque(pending[i:i+self.batch_size] for i in range(0, len(pending), self.batch_size))
+        requeue: List[int] = []
+        requeue_counts: Dict[int, int] = {}
+        deferred_once = set()
+        batch_no = 0
+        succeeded = False
+
+        try:
+            while work or requeue:
+                if work:
+                    batch = work.popleft()
+                    # Top up with re-queued IDs if there is room
+                    room = self.batch_size - len(batch)
+                    if room > 0 and requeue:
+                        batch = batch + requeue[:room]
+                        requeue = requeue[room:]
+                else:
+                    batch, requeue = requeue[:self.batch_size], requeue[self.batch_size:]
+
+                batch_no += 1
+                logger.info(f"Processing batch {batch_no}: {len(batch)} items")
+
+                response, error = self._try(batch)
+                if error is None:
+                    responses = [response]
+                elif is_transient(error):
+                    # Still failing after retries: try once more at the end of the queue
+                    key = tuple(batch)
+                    if key not in deferred_once:
+                        deferred_once.add(key)
+                        work.append(batch)
+                    else:
+                        logger.error(f"Giving up on batch of {len(batch)} items: {error}")
+                    continue
+                elif len(batch) > 1:
+                    responses = self._bisect(batch)
+                elif succeeded:
+                    # Other batches went through, so this lone ID is the problem
+                    self._mark_bad(batch[0], str(error) or repr(error))
+                    continue
+                else:
+                    logger.error(f"First request failed with {error}: not item-specific")
+                    raise error
+
+                for response in responses:
+                    succeeded = True
+                    payloads, failed = split_response(response)
+                    for item_id in failed:
+                        requeue_counts[item_id] = requeue_counts.get(item_id, 0) + 1
+                        if requeue_counts[item_id] > self.max_requeues:
+                            self._mark_bad(item_id, "reported as failed by the API")
+                        else:
+                            self.stats['requeued'] += 1
+                            requeue.append(item_id)
+
+                    if payloads:
+                        yield payloads
+        finally:
+            self.save_bad_items()
+
+    def fetch(self, item_ids: List[int]) -> Dict[int, Any]:
+        """Fetch all IDs and return one {item_id: payload} mapping"""
+        results: Dict[int, Any] = {}
+        for payloads in self.iter_batches(item_ids):
+            results.update(payloads)
+        return results
@@ -0,0 +1,219 @@
+"""
+Compressed transport and compressed local stores.
+
+- http_session() returns a requests.Session that advertises every content
+  encoding urllib3 can decode here (gzip/deflate always, br with the brotli
+  package, zstd with zstandard) and counts bytes on the wire against decoded
+  bytes for every response.
+- read_json()/write_json() keep JSON caches and state files compact and
+  compressed next to their logical path (data/item_cache.json is stored as
+  data/item_cache.json.zst, or .gz without zstandard). Plain files written
+  by older versions are still read.
+- IO_STATS collects wire and disk byte counts; the analyzers reset it at the
+  start of a run and log its summary at the end.
+"""
+import gzip
+import json
+import os
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+import requests
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is used instead
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC = 'zstd' if zstandard is not None else 'gzip'
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+GZIP_LEVEL = 1   # favor speed; JSON still shrinks ~5-10x
+ZSTD_LEVEL = 3
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class IOStats:
+    """Thread-safe byte counters for one run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.wire_bytes = 0
+            self.body_bytes = 0
+            self.disk_bytes = 0
+            self.disk_raw_bytes = 0
+            self.files_written = 0
+
+    def record_response(self, wire_bytes: int, body_bytes: int):
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+
+    def record_write(self, stored_bytes: int, raw_bytes: Optional[int] = None):
+        with self._lock:
+            self.files_written += 1
+            self.disk_bytes += stored_bytes
+            self.disk_raw_bytes += stored_bytes if raw_bytes is None else raw_bytes
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'wire_bytes': self.wire_bytes,
+                'body_bytes': self.body_bytes,
+                'disk_bytes': self.disk_bytes,
+                'disk_raw_bytes': self.disk_raw_bytes,
+                'files_written': self.files_written,
+            }
+
+    def summary(self) -> str:
+        s = self.as_dict()
+        wire_ratio = s['body_bytes'] / s['wire_bytes'] if s['wire_bytes'] else 1.0
+        disk_ratio = s['disk_raw_bytes'] / s['disk_bytes'] if s['disk_bytes'] else 1.0
+        return (f"{s['requests']} HTTP responses, {_mib(s['wire_bytes'])} on the wire "
+                f"({_mib(s['body_bytes'])} decoded, {wire_ratio:.1f}x); "
+                f"{s['files_written']} files, {_mib(s['disk_bytes'])} on disk ({disk_ratio:.1f}x)")
+
+
+def _mib(n: int) -> str:
+    return f"{n / 1024 / 1024:,.2f} MiB"
+
+
+IO_STATS = IOStats()
+
+
+# Transport
+
+def accept_encoding() -> str:
+    """Content encodings this interpreter can decode, best first"""
+    from urllib3.util.request import ACCEPT_ENCODING
+    encodings = [e.strip() for e in ACCEPT_ENCODING.split(',')]
+    preferred = [e for e in ('zstd', 'br', 'gzip', 'deflate') if e in encodings]
+    return ", ".join(preferred + [e for e in encodings if e not in preferred])
+
+
+def _wire_bytes(response: requests.Response) -> int:
+    # urllib3 counts the (still compressed) bytes it read off the socket
+    tell = getattr(response.raw, 'tell', None)
+    try:
+        wire = tell() if tell is not None else 0
+    except Exception:
+        wire = 0
+    return wire or int(response.headers.get('Content-Length') or len(response.content))
+
+
+class CountingSession(requests.Session):
+    """Session with explicit Accept-Encoding that records wire/decoded bytes in IO_STATS"""
+
+    def __init__(self):
+        super().__init__()
+        self.headers['Accept-Encoding'] = accept_encoding()
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if not kwargs.get('stream'):
+            IO_STATS.record_response(_wire_bytes(response), len(response.content))
+        return response
+
+
+def http_session() -> CountingSession:
+    return CountingSession()
+
+
+_shared_session: Optional[CountingSession] = None
+_shared_lock = threading.Lock()
+
+
+def shared_session() -> CountingSession:
+    """Process-wide session for the module-level fetchers (XIVAPI, teamcraft); reuses connections"""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = http_session()
+        return _shared_session
+
+
+# Local stores
+
+def compress(data: bytes, codec: str = CODEC) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return data
+
+
+def decompress(data: bytes) -> bytes:
+    """Decode by magic bytes; anything else is returned as-is (plain files)"""
+    if data.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed store but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 31)
+    if data.startswith(_GZIP_MAGIC):
+        return gzip.decompress(data)
+    return data
+
+
+def stored_path(path: str, codec: str = CODEC) -> str:
+    """Physical file for a logical store path"""
+    return path + SUFFIXES.get(codec, '')
+
+
+def _variants(path: str) -> List[str]:
+    return [path + suffix for suffix in SUFFIXES.values()] + [path]
+
+
+def find_store(path: str) -> Optional[str]:
+    """Newest existing physical file for a logical store path (compressed or legacy plain)"""
+    existing = [p for p in _variants(path) if os.path.isfile(p)]
+    return max(existing, key=os.path.getmtime) if existing else None
+
+
+def store_exists(path: str) -> bool:
+    return find_store(path) is not None
+
+
+def read_json(path: str) -> Any:
+    """Load a JSON store by logical path; None if it does not exist"""
+    physical = find_store(path)
+    if physical is None:
+        return None
+    with open(physical, 'rb') as f:
+        return json.loads(decompress(f.read()))
+
+
+def write_json(path: str, payload: Any, codec: str = CODEC) -> int:
+    """
+    Write a JSON store compactly and compressed, atomically.
+    Other compressed variants of the same store are removed. Returns bytes written.
+    """
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    data = compress(raw, codec)
+    target = stored_path(path, codec)
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+    for other in _variants(path)[:-1]:
+        if other != target and os.path.exists(other):
+            os.remove(other)
+    IO_STATS.record_write(len(data), len(raw))
+    return len(data)
+
+
+def record_file_write(path: str, raw_bytes: Optional[int] = None):
+    """Count a file written by another writer (results, CSV) in IO_STATS"""
+    try:
+        IO_STATS.record_write(os.path.getsize(path), raw_bytes)
+    except OSError:
+        pass
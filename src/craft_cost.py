@@ -2,37 +2,24 @@
 Craft cost estimation using XIVAPI recipes and Universalis prices.
 This is a best-effort estimator; data availability may vary.
 """
+import os
 import logging
-import requests
 from typing import Dict, Any, List, Optional
 from src.universalis_client import UniversalisClient
+from src.market_snapshot import MarketSnapshot
+from src.recipe_resolver import default_resolver
 
 logger = logging.getLogger(__name__)
 
-XIVAPI_SEARCH = "https://xivapi.com/search"
-XIVAPI_RECIPE = "https://xivapi.com/recipe/{id}"
+XIVAPI_BASE_URL = os.environ.get("XIVAPI_BASE_URL", "https://xivapi.com").rstrip("/")
+XIVAPI_SEARCH = f"{XIVAPI_BASE_URL}/search"
+XIVAPI_RECIPE = XIVAPI_BASE_URL + "/recipe/{id}"
 
 
 def fetch_recipe_for_item(item_id: int) -> Optional[Dict[str, Any]]:
     """Find a recipe that produces the given item_id and return recipe data."""
     try:
-        params = {
-            "indexes": "recipe",
-            "filters": f"ItemResult.ID={item_id}",
-            "page": 1
-        }
-        resp = requests.get(XIVAPI_SEARCH, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        results = data.get("Results", [])
-        if not results:
-            return None
-        recipe_id = results[0].get("ID")
-        if recipe_id is None:
-            return None
-        recipe_resp = requests.get(XIVAPI_RECIPE.format(id=recipe_id), timeout=15)
-        recipe_resp.raise_for_status()
-        return recipe_resp.json()
+        return default_resolver().resolve_one(item_id)
     except Exception as e:
         logger.warning(f"Recipe fetch failed for item {item_id}: {e}")
         return None
@@ -51,18 +38,31 @@ def extract_ingredients(recipe: Dict[str, Any]) -> List[Dict[str, int]]:
     return ingredients
 
 
-def estimate_craft_cost(item_id: int, client: UniversalisClient, datacenter: str) -> Optional[Dict[str, Any]]:
+def ingredient_min_price(aggregated_result: Dict[str, Any]) -> Optional[float]:
+    """NQ min listing price for an ingredient from one aggregated result (DC, else region)"""
+    min_listing = aggregated_result.get("nq", {}).get("minListing", {})
+    return min_listing.get("dc", {}).get("price") or min_listing.get("region", {}).get("price")
+
+
+def estimate_craft_cost(item_id: int, client: UniversalisClient, datacenter: str,
+                        snapshot: Optional[MarketSnapshot] = None,
+                        recipe: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     """
     Estimate craft cost for an item by summing ingredient costs (min listing price per ingredient).
     Returns None if recipe or prices are unavailable.
+
+    With a snapshot, all ingredient prices come from one (cached) batch lookup
+    instead of one aggregated request per ingredient.
     """
-    recipe = fetch_recipe_for_item(item_id)
+    recipe = recipe or fetch_recipe_for_item(item_id)
     if not recipe:
         return None
     ingredients = extract_ingredients(recipe)
     if not ingredients:
         return None
 
+    prefetched = snapshot.aggregated([ing["item_id"] for ing in ingredients]) if snapshot else None
+
     ingredient_costs = []
     total_cost = 0.0
 
@@ -70,23 +70,13 @@ def estimate_craft_cost(item_id: int, client: UniversalisClient, datacenter: str
         ing_id = ing["item_id"]
         amount = ing["amount"]
         try:
-            # Use aggregated to get min listing for ingredient (DC level)
-            resp = client.get_aggregated_data([ing_id])
-            min_price = None
-            if "results" in resp and resp["results"]:
-                ing_res = resp["results"][0]
-                # prefer DC minListing if present
-                min_price = (
-                    ing_res.get("nq", {})
-                    .get("minListing", {})
-                    .get("dc", {})
-                    .get("price")
-                ) or (
-                    ing_res.get("nq", {})
-                    .get("minListing", {})
-                    .get("region", {})
-                    .get("price")
-                )
+            if prefetched is not None:
+                ing_res = prefetched.get(ing_id)
+            else:
+                # Use aggregated to get min listing for ingredient (DC level)
+                resp = client.get_aggregated_data([ing_id])
+                ing_res = resp["results"][0] if resp.get("results") else None
+            min_price = ingredient_min_price(ing_res) if ing_res else None
             if min_price is None:
                 continue
             cost = min_price * amount
@@ -101,5 +91,30 @@ def estimate_craft_cost(item_id: int, client: UniversalisClient, datacenter: str
 
     return {
         "craft_cost": total_cost,
+        "can_hq": bool(recipe.get("CanHq")),
         "ingredients": ingredient_costs,
     }
+
+
+def estimate_craft_costs(item_ids: List[int], client: UniversalisClient, datacenter: str,
+                         snapshot: MarketSnapshot) -> Dict[int, Dict[str, Any]]:
+    """
+    Craft costs for many items: recipes first, then every distinct ingredient
+    priced in shared batches through the snapshot.
+    """
+    # Batched searches + concurrent body fetches instead of two requests per item
+    recipes = default_resolver().resolve(item_ids)
+    ingredient_ids = {ing["item_id"] for recipe in recipes.values() if recipe
+                      for ing in extract_ingredients(recipe)}
+    if ingredient_ids:
+        logger.info(f"Pricing {len(ingredient_ids)} distinct ingredients for {len(item_ids)} items")
+        snapshot.prefetch('aggregated', sorted(ingredient_ids))
+
+    costs = {}
+    for item_id, recipe in recipes.items():
+        if not recipe:
+            continue
+        craft_info = estimate_craft_cost(item_id, client, datacenter, snapshot=snapshot, recipe=recipe)
+        if craft_info:
+            costs[item_id] = craft_info
+    return costs
@@ -1,24 +1,25 @@
 """
 Cache and mapping utilities for item names
 """
-import json
 import os
 import logging
 from typing import Dict, List, Optional
-import requests
+from src.compression import read_json, write_json, store_exists, shared_session
 
 logger = logging.getLogger(__name__)
 
 ITEM_CACHE_FILE = "data/item_cache.json"
+TEAMCRAFT_ITEMS_URL = os.environ.get(
+    "TEAMCRAFT_ITEMS_URL",
+    "https://raw.githubusercontent.com/ffxiv-teamcraft/ffxiv-teamcraft/master/libs/data/src/lib/json/items.json")
 
 def load_item_cache() -> Dict[int, str]:
     """Load cached item name mappings"""
-    if os.path.exists(ITEM_CACHE_FILE):
+    if store_exists(ITEM_CACHE_FILE):
         try:
-            with open(ITEM_CACHE_FILE, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
-                # Convert string keys back to integers
-                return {int(k): v for k, v in cache.items()}
+            cache = read_json(ITEM_CACHE_FILE)
+            # Convert string keys back to integers
+            return {int(k): v for k, v in cache.items()}
         except Exception as e:
             logger.warning(f"Could not load item cache: {e}")
     return {}
@@ -26,10 +27,8 @@ def load_item_cache() -> Dict[int, str]:
 def save_item_cache(cache: Dict[int, str]):
     """Save item name mappings to cache"""
     try:
-        os.makedirs("data", exist_ok=True)
-        with open(ITEM_CACHE_FILE, 'w', encoding='utf-8') as f:
-            # Convert integer keys to strings for JSON
-            json.dump({str(k): v for k, v in cache.items()}, f, ensure_ascii=False, indent=2)
+        # Convert integer keys to strings for JSON
+        write_json(ITEM_CACHE_FILE, {str(k): v for k, v in cache.items()})
     except Exception as e:
         logger.warning(f"Could not save item cache: {e}")
 
@@ -59,10 +58,7 @@ def fetch_item_names_batch(item_ids: List[int]) -> Dict[int, str]:
     try:
         # Try using the ffxiv-teamcraft JSON dump (more reliable)
         logger.info("Attempting to load item names from ffxiv-teamcraft...")
-        response = requests.get(
-            "https://raw.githubusercontent.com/ffxiv-teamcraft/ffxiv-teamcraft/master/libs/data/src/lib/json/items.json",
-            timeout=30
-        )
+        response = shared_session().get(TEAMCRAFT_ITEMS_URL, timeout=30)
         response.raise_for_status()
         
         items_json = response.json()
@@ -0,0 +1,249 @@
+"""
+Adaptive item selection under a per-run request budget.
+
+Every refreshed item is a "pull" of a bandit arm whose reward is the
+log-profitability the analysis found for it. ItemSelector keeps a
+time-decayed posterior (mean / spread of the reward) per item across runs
+and picks the items to refresh by Thompson sampling: items that keep
+turning a profit are refreshed often, volatile or rarely seen items get
+wider posteriors (and so get explored), and a fixed share of the budget is
+always spent on random candidates so new opportunities are discovered.
+
+Items not refreshed for max_age (10 half-lives by default, when their
+observations carry ~0.1% weight) are dropped, so the candidate pool and the
+saved state stay bounded. IDs a run failed to fetch are not rewarded at
+all: an outage says nothing about an item's profitability.
+"""
+import math
+import time
+import logging
+from typing import Dict, Any, List, Optional, Iterable
+import numpy as np
+import pandas as pd
+from src.compression import read_json, write_json, store_exists
+
+logger = logging.getLogger(__name__)
+
+SELECTION_FILE = "data/selection_state.json"
+ITEMS_PER_REQUEST = 100  # history endpoint batch size
+PROFITABLE_THRESHOLD = 0.0
+
+
+def item_reward(profit: float) -> float:
+    """Reward for one refresh: log-scaled daily profit, 0 for unprofitable/missing items"""
+    if profit is None or not np.isfinite(profit) or profit <= 0:
+        return 0.0
+    return math.log1p(profit)
+
+
+class ItemSelector:
+    """
+    Thompson-sampling selector over item IDs.
+
+    Per item it stores the decayed number of refreshes `n`, the running
+    reward mean and sum of squared deviations, the last price volatility and
+    the time of the last refresh. Observations lose half their weight every
+    `half_life` seconds so the selector follows changing markets.
+    """
+
+    def __init__(self, path: str = SELECTION_FILE, request_budget: Optional[int] = None,
+                 exploration: float = 0.1, half_life: float = 3 * 86400,
+                 prior_weight: float = 1.0, prior_sigma: float = 3.0, seed: Optional[int] = None,
+                 max_age: Optional[float] = None):
+        self.path = path
+        self.request_budget = request_budget
+        self.exploration = exploration
+        self.half_life = half_life
+        self.max_age = 10 * half_life if max_age is None else max_age
+        self.prior_weight = prior_weight
+        self.prior_sigma = prior_sigma
+        self.rng = np.random.default_rng(seed)
+        self.items: Dict[int, Dict[str, float]] = {}
+        self.runs: List[Dict[str, Any]] = []
+
+    # Selection
+
+    def budget_items(self, num_items: int) -> int:
+        """Number of items one run may refresh, given the request budget"""
+        if self.request_budget is None:
+            return num_items
+        return min(num_items, self.request_budget * ITEMS_PER_REQUEST)
+
+    def _prior_mean(self) -> float:
+        # Unseen items are assumed to be as good as an average known item
+        means = [s['mean'] for s in self.items.values() if s['n'] > 0]
+        return float(np.mean(means)) if means else 0.0
+
+    def sample_scores(self, candidates: List[int], now: Optional[float] = None) -> np.ndarray:
+        """One posterior sample of the expected reward per candidate"""
+        now = time.time() if now is None else now
+        count = len(candidates)
+        n = np.zeros(count)
+        mean = np.zeros(count)
+        m2 = np.zeros(count)
+        volatility = np.zeros(count)
+        age = np.zeros(count)
+        for i, item_id in enumerate(candidates):
+            state = self.items.get(item_id)
+            if state:
+                n[i], mean[i], m2[i] = state['n'], state['mean'], state['m2']
+                volatility[i] = state.get('volatility', 0.0)
+                age[i] = max(now - state['ts'], 0.0)
+
+        decay = 0.5 ** (age / self.half_life)
+        weight = n * decay
+        prior_mean = self._prior_mean()
+        post_weight = self.prior_weight + weight
+        post_mean = (self.prior_weight * prior_mean + weight * mean) / post_weight
+        # Observed spread where there is enough data, prior spread otherwise;
+        # volatile items are widened so they get re-checked more often
+        observed_sd = np.sqrt(np.where(n > 1, m2 / np.maximum(n - 1, 1), self.prior_sigma ** 2))
+        sigma = np.maximum(observed_sd, 0.25) * (1 + np.clip(volatility, 0, 2))
+        return post_mean + self.rng.standard_normal(count) * sigma / np.sqrt(post_weight)
+
+    def select(self, candidates: Iterable[int], num_items: int, now: Optional[float] = None) -> List[int]:
+        """
+        Choose up to num_items (capped by the request budget) candidates to
+        refresh: the top Thompson samples plus a random exploration share.
+        """
+        candidates = list(dict.fromkeys(int(c) for c in candidates))
+        k = min(self.budget_items(num_items), len(candidates))
+        if k <= 0:
+            return []
+
+        n_explore = int(round(k * self.exploration))
+        scores = self.sample_scores(candidates, now)
+        order = np.argsort(-scores, kind='stable')
+        chosen = [candidates[i] for i in order[:k - n_explore]]
+
+        if n_explore:
+            rest = [candidates[i] for i in order[k - n_explore:]]
+            picks = self.rng.choice(len(rest), size=min(n_explore, len(rest)), replace=False)
+            chosen.extend(rest[i] for i in picks)
+
+        known = sum(1 for c in chosen if c in self.items)
+        logger.info(f"Selected {len(chosen)} of {len(candidates)} candidates "
+                    f"({known} known, {len(chosen) - known} new, {n_explore} exploration)")
+        return chosen
+
+    # Learning
+
+    def observe(self, item_id: int, reward: float, volatility: Optional[float] = None,
+                now: Optional[float] = None):
+        """Add one refresh outcome to an item's decayed reward statistics"""
+        now = time.time() if now is None else now
+        state = self.items.get(item_id)
+        if state is None:
+            state = {'n': 0.0, 'mean': 0.0, 'm2': 0.0, 'volatility': 0.0, 'ts': now}
+            self.items[item_id] = state
+        decay = 0.5 ** (max(now - state['ts'], 0.0) / self.half_life)
+        n = state['n'] * decay + 1
+        delta = reward - state['mean']
+        state['mean'] += delta / n
+        state['m2'] = state['m2'] * decay + delta * (reward - state['mean'])
+        state['n'] = n
+        state['ts'] = now
+        if volatility is not None and np.isfinite(volatility):
+            state['volatility'] = float(volatility)
+
+    def update(self, requested: List[int], results: pd.DataFrame, now: Optional[float] = None,
+               record_run: bool = True, resolved: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        """
+        Learn from one run: every requested item gets a reward, items that
+        were fetched but produced no result (no sales) count as reward 0.
+        With `resolved` (the IDs the fetch returned), the other requested IDs
+        are skipped instead. Returns the run's yield statistics.
+        """
+        now = time.time() if now is None else now
+        rows = self._result_rows(results)
+        resolved = None if resolved is None else {int(i) for i in resolved}
+        profitable = 0
+        for item_id in dict.fromkeys(int(i) for i in requested):
+            if resolved is not None and item_id not in resolved:
+                continue
+            profit, volatility = rows.get(item_id, (0.0, None))
+            if profit > PROFITABLE_THRESHOLD:
+                profitable += 1
+            self.observe(item_id, item_reward(profit), volatility, now)
+
+        return self.run_stats(len(requested), profitable, now, record=record_run)
+
+    def run_stats(self, items: int, profitable: int, now: Optional[float] = None,
+                  record: bool = True) -> Dict[str, Any]:
+        """Yield statistics of one run (optionally kept in the run history)"""
+        now = time.time() if now is None else now
+        requests_used = math.ceil(items / ITEMS_PER_REQUEST)
+        stats = {
+            'ts': now,
+            'items': items,
+            'requests': requests_used,
+            'profitable': profitable,
+            'profitable_per_request': profitable / requests_used if requests_used else 0.0,
+        }
+        if record:
+            self.runs = (self.runs + [stats])[-100:]
+            logger.info(f"Selection yield: {profitable} profitable items from {requests_used} requests "
+                        f"({stats['profitable_per_request']:.1f}/request)")
+        return stats
+
+    def seed_from_results(self, results: pd.DataFrame, now: Optional[float] = None):
+        """Bootstrap item statistics from a stored result frame (previous runs)"""
+        rows = self._result_rows(results)
+        for item_id, (profit, volatility) in rows.items():
+            self.observe(item_id, item_reward(profit), volatility, now)
+        logger.info(f"Seeded selection state with {len(rows)} items")
+
+    @staticmethod
+    def _result_rows(results: pd.DataFrame) -> Dict[int, tuple]:
+        """item_id -> (profit, volatility) from a v2 result frame"""
+        if results is None or len(results) == 0 or 'item_id' not in results.columns:
+            return {}
+        profit_col = 'net_profitability' if 'net_profitability' in results.columns else 'profitability'
+        profit = results[profit_col].fillna(0.0).to_numpy(dtype=float)
+        if {'price_p25', 'price_p75', 'median_price'} <= set(results.columns):
+            # Interquartile range relative to the median
+            volatility = ((results['price_p75'] - results['price_p25'])
+                          / results['median_price'].where(results['median_price'] > 0)).to_numpy(dtype=float)
+        else:
+            volatility = np.full(len(results), np.nan)
+        return {int(i): (float(p), float(v) if np.isfinite(v) else None)
+                for i, p, v in zip(results['item_id'], profit, volatility)}
+
+    def known_items(self) -> List[int]:
+        return list(self.items)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Forget items not refreshed for max_age; returns the number dropped"""
+        now = time.time() if now is None else now
+        stale = [item_id for item_id, state in self.items.items() if now - state['ts'] > self.max_age]
+        for item_id in stale:
+            del self.items[item_id]
+        if stale:
+            logger.info(f"Dropped {len(stale)} items not refreshed for {self.max_age / 86400:.0f} days")
+        return len(stale)
+
+    # Persistence
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        self.prune()
+        payload = {
+            'items': {str(k): v for k, v in self.items.items()},
+            'runs': self.runs,
+        }
+        write_json(path, payload)
+
+    @classmethod
+    def load(cls, path: str = SELECTION_FILE, **kwargs) -> "ItemSelector":
+        """Load selector state from disk, or return an empty selector"""
+        selector = cls(path, **kwargs)
+        if not store_exists(path):
+            return selector
+        try:
+            payload = read_json(path)
+            selector.items = {int(k): v for k, v in payload.get('items', {}).items()}
+            selector.runs = payload.get('runs', [])
+            selector.prune()
+        except Exception as e:
+            logger.warning(f"Could not load selection state: {e}")
+        return selector
@@ -0,0 +1,411 @@
+"""
+Event-driven ingest from the Universalis WebSocket feed.
+
+Instead of polling most-recently-updated and refetching history, LiveIngest
+subscribes to sales/add, listings/add and listings/remove for the configured
+worlds (datacenters are expanded to their worlds) and applies each BSON
+event to per-item in-memory state on a background thread:
+
+- sales feed the rolling 7-day trend bars (ItemTrend) and a time-decayed
+  price t-digest, plus running unit counts for velocity,
+- listings are kept per world and listing ID, so the cheapest NQ/HQ offer
+  is always current,
+- every sale and listing is scored by a streaming median/MAD detector
+  (src/anomaly.py); anomalous sales are counted but kept out of the trend,
+  sketch and velocity state.
+
+Every update is O(1) amortized per sale/listing; no REST request is made
+while the connection is up. After a disconnect the ingest reconnects with
+jittered backoff and fills the gap through REST: recent history since the
+stalest item's last sale (sales already applied are recognized by key and
+dropped, whatever world they are from) and a fresh listings snapshot, for
+the items it tracks.
+"""
+import math
+import os
+import random
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterable
+import pandas as pd
+from src.anomaly import AnomalyDetector
+from src.batch_fetcher import BatchFetcher
+from src.quantile_sketch import TDigest
+from src.trends import ItemTrend, TREND_COLUMNS
+from src.universalis_client import UniversalisClient, GAP_FILL_HISTORY_FIELDS
+from src.ws_protocol import WebSocketClient, WebSocketClosed, bson_decode, bson_encode
+
+logger = logging.getLogger(__name__)
+
+# Overridable to point at the synthetic stand-in (src/synthetic_market.py)
+UNIVERSALIS_WS_URL = os.environ.get("UNIVERSALIS_WS_URL", "wss://universalis.app/api/ws")
+CHANNELS = ('sales/add', 'listings/add', 'listings/remove')
+SECONDS_PER_DAY = 86400
+
+LIVE_COLUMNS = ['item_id', 'sales_window', 'units_window', 'daily_units', 'last_price', 'p25_price',
+                'median_price', 'min_listing_nq', 'min_listing_hq', 'listings', 'last_sale',
+                'last_event', 'flagged_sales', 'flagged_listings'] + TREND_COLUMNS
+
+
+def _timestamp(value: Any) -> float:
+    """Seconds since epoch from seconds, milliseconds or a BSON datetime"""
+    ts = float(value or 0)
+    return ts / 1000 if ts > 1e11 else ts
+
+
+def _sale_key(sale: Dict[str, Any], world: Optional[int]) -> tuple:
+    return (int(_timestamp(sale.get('timestamp'))), sale.get('pricePerUnit'), sale.get('quantity'),
+            sale.get('buyerName'), world)
+
+
+def _listing_key(listing: Dict[str, Any], world: Optional[int]) -> Any:
+    # REST and feed listings carry listingID; fall back to content for mirrors without it
+    return listing.get('listingID') or (world, listing.get('retainerName'), listing.get('pricePerUnit'),
+                                        listing.get('quantity'), bool(listing.get('hq')))
+
+
+class LiveItemState:
+    """Incrementally maintained market state for one item"""
+
+    RECENT_KEYS = 256
+
+    def __init__(self, window_days: int = 7, half_life: float = 3 * SECONDS_PER_DAY,
+                 recent_keys: int = RECENT_KEYS):
+        self.window = window_days * SECONDS_PER_DAY
+        self.trend = ItemTrend(window=window_days)
+        self.sketch = TDigest(compression=50, half_life=half_life)
+        self.recent = deque()             # (timestamp, quantity) inside the window
+        self.units = 0
+        self.last_price: Optional[float] = None
+        self.last_sale = 0.0
+        self.last_event = 0.0
+        self.flagged_sales = 0
+        self.flagged_listings = 0
+        # Recently applied sales, so gap-fill and feed overlap is not double counted
+        self._seen_keys: deque = deque(maxlen=recent_keys)
+        self._seen = set()
+        self.listings: Dict[int, Dict[Any, Dict[str, Any]]] = {}  # world -> listing key -> listing
+
+    def add_sale(self, sale: Dict[str, Any], world: Optional[int] = None,
+                 detector: Optional[AnomalyDetector] = None, item_id: int = 0) -> bool:
+        """
+        Apply one sale; False if it was already seen. With a detector, an
+        anomalous sale is only counted (flagged_sales), not applied.
+        """
+        key = _sale_key(sale, world if world is not None else sale.get('worldID'))
+        if key in self._seen:
+            return False
+        if len(self._seen_keys) == self._seen_keys.maxlen:
+            self._seen.discard(self._seen_keys[0])
+        self._seen_keys.append(key)
+        self._seen.add(key)
+
+        price, quantity = float(sale.get('pricePerUnit') or 0), int(sale.get('quantity') or 0)
+        ts = _timestamp(sale.get('timestamp'))
+        if price <= 0 or quantity <= 0:
+            return False
+        if detector is not None and detector.check_sale(item_id, price, bool(sale.get('hq')), ts):
+            self.flagged_sales += 1
+            return True
+        self.trend.add_sale(price, quantity, ts)
+        self.sketch.add(price, quantity, timestamp=ts)
+        self.recent.append((ts, quantity))
+        self.units += quantity
+        if ts >= self.last_sale:
+            self.last_sale, self.last_price = ts, price
+        self._evict(max(self.last_sale, ts))
+        return True
+
+    def _evict(self, now: float):
+        cutoff = now - self.window
+        while self.recent and self.recent[0][0] < cutoff:
+            _, quantity = self.recent.popleft()
+            self.units -= quantity
+
+    def add_listings(self, world: int, listings: Iterable[Dict[str, Any]]):
+        book = self.listings.setdefault(world, {})
+        for listing in listings:
+            book[_listing_key(listing, world)] = listing
+
+    def remove_listings(self, world: int, listings: Iterable[Dict[str, Any]]):
+        book = self.listings.get(world, {})
+        for listing in listings:
+            book.pop(_listing_key(listing, world), None)
+
+    def replace_listings(self, world: int, listings: Iterable[Dict[str, Any]]):
+        self.listings[world] = {}
+        self.add_listings(world, listings)
+
+    def metrics(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        self._evict(now)
+        self.trend.advance_to(now)
+        min_nq = min_hq = math.inf
+        count = 0
+        for book in self.listings.values():
+            for listing in book.values():
+                count += 1
+                price = listing.get('pricePerUnit') or math.inf
+                if listing.get('hq'):
+                    min_hq = min(min_hq, price)
+                else:
+                    min_nq = min(min_nq, price)
+        p25, median = self.sketch.quantiles([0.25, 0.5]) if len(self.sketch) else (math.nan, math.nan)
+        window_days = self.window / SECONDS_PER_DAY
+        return {
+            'sales_window': len(self.recent),
+            'units_window': self.units,
+            'daily_units': self.units / window_days,
+            'last_price': self.last_price if self.last_price is not None else math.nan,
+            'p25_price': p25,
+            'median_price': median,
+            'min_listing_nq': min_nq if min_nq < math.inf else math.nan,
+            'min_listing_hq': min_hq if min_hq < math.inf else math.nan,
+            'listings': count,
+            'last_sale': self.last_sale,
+            'last_event': self.last_event,
+            'flagged_sales': self.flagged_sales,
+            'flagged_listings': self.flagged_listings,
+            **self.trend.metrics(),
+        }
+
+
+class LiveIngest:
+    """
+    Background WebSocket ingest into LiveItemState per item.
+
+    worlds / datacenters select the subscriptions (names or world IDs);
+    item_ids, if given, limits the tracked items and is seeded through REST
+    on the first connect.
+    """
+
+    def __init__(self, worlds: Optional[List[Any]] = None, datacenters: Optional[List[str]] = None,
+                 item_ids: Optional[Iterable[int]] = None, url: str = UNIVERSALIS_WS_URL,
+                 channels: Iterable[str] = CHANNELS, window_days: int = 7,
+                 gap_fill_entries: int = 100, metadata=None, idle_timeout: float = 60.0,
+                 max_backoff: float = 60.0):
+        self.url = url
+        self.channels = list(channels)
+        self.window_days = window_days
+        self.gap_fill_entries = gap_fill_entries
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.item_filter = {int(i) for i in item_ids} if item_ids is not None else None
+        self.world_ids, self.world_dcs = self._resolve_worlds(worlds or [], datacenters or [], metadata)
+        # Gap fill dedupes by sale key alone, so remember at least two fills' worth per datacenter
+        self.recent_keys = max(LiveItemState.RECENT_KEYS,
+                               2 * gap_fill_entries * max(len(set(self.world_dcs.values())), 1))
+        self.items: Dict[int, LiveItemState] = {}
+        self.detector = AnomalyDetector()
+        self.stats = {'connects': 0, 'events': 0, 'sales': 0, 'duplicate_sales': 0, 'listings': 0,
+                      'decode_errors': 0, 'gap_fills': 0, 'gap_filled_sales': 0, 'rest_requests': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ws: Optional[WebSocketClient] = None
+        self._connected_once = False
+
+    @staticmethod
+    def _resolve_worlds(worlds: List[Any], datacenters: List[str], metadata):
+        """World IDs to subscribe to and the datacenter of each (for REST gap fills)"""
+        if metadata is None:
+            from src.market_metadata import MarketMetadata
+            metadata = MarketMetadata().load()
+        world_dcs: Dict[int, str] = {}
+        for dc in datacenters:
+            ids = metadata.worlds_in_datacenter(dc)
+            if not ids:
+                raise ValueError(f"Unknown datacenter: {dc}")
+            world_dcs.update({world_id: dc for world_id in ids})
+        for world in worlds:
+            world_id = metadata.world_id(int(world) if str(world).isdigit() else world)
+            if world_id is None:
+                raise ValueError(f"Unknown world: {world}")
+            world_dcs[world_id] = metadata.datacenter_of(world_id)
+        if not world_dcs:
+            raise ValueError("No worlds or datacenters to subscribe to")
+        return sorted(world_dcs), world_dcs
+
+    # Event handling
+
+    def _state(self, item_id: int) -> Optional[LiveItemState]:
+        if self.item_filter is not None and item_id not in self.item_filter:
+            return None
+        state = self.items.get(item_id)
+        if state is None:
+            state = self.items[item_id] = LiveItemState(self.window_days, recent_keys=self.recent_keys)
+        return state
+
+    def handle_message(self, message: Dict[str, Any]):
+        """Apply one decoded feed event to the item state"""
+        event = message.get('event')
+        if event not in ('sales/add', 'listings/add', 'listings/remove'):
+            return
+        world = message.get('world')
+        if world is not None and int(world) not in self.world_dcs:
+            return
+        item_id = int(message.get('item') or 0)
+        with self._lock:
+            state = self._state(item_id)
+            self.stats['events'] += 1
+            if state is None:
+                return
+            state.last_event = time.time()
+            if event == 'sales/add':
+                # Feed batches are newest first; trend bars want time order
+                sales = sorted(message.get('sales') or [], key=lambda s: _timestamp(s.get('timestamp')))
+                for sale in sales:
+                    if state.add_sale(sale, world, self.detector, item_id):
+                        self.stats['sales'] += 1
+                    else:
+                        self.stats['duplicate_sales'] += 1
+            elif event == 'listings/add':
+                for listing in message.get('listings') or []:
+                    if self.detector.check_listing(item_id, listing.get('pricePerUnit') or 0,
+                                                   bool(listing.get('hq')), state.last_event):
+                        state.flagged_listings += 1
+                state.add_listings(world, message.get('listings') or [])
+                self.stats['listings'] += len(message.get('listings') or [])
+            else:
+                state.remove_listings(world, message.get('listings') or [])
+
+    # Connection
+
+    def _subscribe(self, ws: WebSocketClient):
+        for channel in self.channels:
+            for world_id in self.world_ids:
+                ws.send(bson_encode({'event': 'subscribe', 'channel': f"{channel}{{world={world_id}}}"}))
+
+    def _read_loop(self, ws: WebSocketClient):
+        while not self._stop.is_set():
+            _, payload = ws.recv()
+            try:
+                message = bson_decode(payload)
+            except ValueError as e:
+                self.stats['decode_errors'] += 1
+                logger.debug(f"Undecodable feed message: {e}")
+                continue
+            self.handle_message(message)
+
+    def run(self):
+        """Connect, subscribe, gap-fill and ingest until stop() (reconnecting on errors)"""
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                ws = WebSocketClient(self.url, timeout=self.idle_timeout).connect()
+            except OSError as e:
+                delay = random.uniform(0, min(self.max_backoff, 2 ** attempt))
+                attempt += 1
+                logger.warning(f"Feed connect to {self.url} failed ({e}); retrying in {delay:.1f}s")
+                self._stop.wait(delay)
+                continue
+            self._ws = ws
+            self.stats['connects'] += 1
+            try:
+                self._subscribe(ws)
+                logger.info(f"Subscribed to {len(self.channels)} channels on {len(self.world_ids)} worlds")
+                # Events arriving meanwhile wait in the socket buffer
+                if self._connected_once or self.item_filter is not None:
+                    self.gap_fill()
+                self._connected_once = True
+                attempt = 0
+                self._read_loop(ws)
+            except (WebSocketClosed, socket.timeout, OSError) as e:
+                if not self._stop.is_set():
+                    logger.warning(f"Feed connection lost ({e}); reconnecting")
+            finally:
+                ws.close()
+                self._ws = None
+
+    def start(self) -> "LiveIngest":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='live-ingest', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None and ws.sock is not None:
+            try:
+                # Unblocks the reader thread
+                ws.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # REST gap fill
+
+    def gap_fill(self, item_ids: Optional[Iterable[int]] = None):
+        """
+        Bring tracked items up to date through REST after a (re)connect:
+        recent history, deduplicated against the sales already applied, and a
+        fresh listings snapshot.
+        """
+        with self._lock:
+            ids = sorted(item_ids if item_ids is not None else (self.item_filter or self.items))
+            # Only the gap since the stalest item's last sale (plus a minute of clock slack),
+            # at most the live window
+            window = self.window_days * SECONDS_PER_DAY
+            oldest = min((self.items[i].last_sale if i in self.items else 0.0) for i in ids) if ids else 0.0
+            within = min(window, max(time.time() - oldest, 0) + 60)
+        if not ids:
+            return
+        start = time.perf_counter()
+        added = 0
+        for dc in sorted(set(self.world_dcs.values())):
+            client = UniversalisClient(dc)
+            worlds = {w for w, d in self.world_dcs.items() if d == dc}
+            history = BatchFetcher(lambda b: client.get_history(b, entries_to_return=self.gap_fill_entries,
+                                                                entries_within=within,
+                                                                fields=GAP_FILL_HISTORY_FIELDS),
+                                   scope=f"history/{dc}")
+            listings = BatchFetcher(lambda b: client.get_listings(b), scope=f"listings/{dc}")
+            for payloads in history.iter_batches(ids):
+                with self._lock:
+                    for item_id, payload in payloads.items():
+                        state = self._state(item_id)
+                        if state is None:
+                            continue
+                        entries = sorted((e for e in payload.get('entries', []) if e.get('worldID') in worlds),
+                                         key=lambda e: _timestamp(e.get('timestamp')))
+                        # No timestamp cut: a lagging world's upload can be older than the item's last sale
+                        for entry in entries:
+                            if state.add_sale(entry, detector=self.detector, item_id=item_id):
+                                added += 1
+            for payloads in listings.iter_batches(ids):
+                with self._lock:
+                    for item_id, payload in payloads.items():
+                        state = self._state(item_id)
+                        if state is None:
+                            continue
+                        by_world: Dict[int, List[Dict[str, Any]]] = {w: [] for w in worlds}
+                        for listing in payload.get('listings', []):
+                            if listing.get('worldID') in by_world:
+                                by_world[listing['worldID']].append(listing)
+                        for world_id, rows in by_world.items():
+                            state.replace_listings(world_id, rows)
+            self.stats['rest_requests'] += history.stats['requests'] + listings.stats['requests']
+        self.stats['gap_fills'] += 1
+        self.stats['gap_filled_sales'] += added
+        logger.info(f"Gap fill: {added} sales for {len(ids)} items in {time.perf_counter() - start:.1f}s")
+
+    # Output
+
+    def metrics_frame(self, now: Optional[float] = None) -> pd.DataFrame:
+        """One row of live metrics per item seen so far"""
+        now = now or time.time()
+        with self._lock:
+            rows = [dict(item_id=item_id, **state.metrics(now)) for item_id, state in self.items.items()]
+        return pd.DataFrame(rows, columns=LIVE_COLUMNS)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"{s['events']} events ({s['sales']} sales, {s['duplicate_sales']} duplicates, "
+                f"{s['listings']} listings; {self.detector.counts['flagged_sales']} anomalous sales, "
+                f"{self.detector.counts['flagged_listings']} anomalous listings), {len(self.items)} items, {s['connects']} connects, "
+                f"{s['gap_filled_sales']} sales gap-filled with {s['rest_requests']} REST requests")
@@ -0,0 +1,167 @@
+"""
+Cached world / datacenter / tax-rate metadata.
+
+Worlds, datacenters and the market tax rates of every world change rarely,
+so they are fetched once, persisted with a TTL and served from in-memory
+dicts (O(1) lookups). Tax can then be applied to a whole result frame in
+one vectorized step.
+"""
+import time
+import logging
+from typing import Dict, Any, List, Optional, Union
+import pandas as pd
+from src.universalis_client import UniversalisClient
+from src.compression import read_json, write_json, store_exists
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_FILE = "data/market_metadata.json"
+DEFAULT_TTL = 24 * 3600
+
+WorldKey = Union[int, str]
+
+
+class MarketMetadata:
+    """Registry of worlds, datacenters and per-world market tax rates"""
+
+    def __init__(self, client: Optional[UniversalisClient] = None,
+                 path: str = METADATA_CACHE_FILE, ttl: float = DEFAULT_TTL):
+        self.client = client or UniversalisClient()
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = 0.0
+        self.worlds_by_id: Dict[int, str] = {}
+        self.world_ids_by_name: Dict[str, int] = {}
+        self.data_centers: Dict[str, Dict[str, Any]] = {}
+        self.dc_by_world: Dict[int, str] = {}
+        self.tax_rates: Dict[int, Dict[str, int]] = {}
+        self.effective_tax: Dict[int, float] = {}
+
+    def is_fresh(self) -> bool:
+        return bool(self.worlds_by_id) and (time.time() - self.fetched_at) < self.ttl
+
+    def load(self, force: bool = False) -> "MarketMetadata":
+        """Load from the disk cache if fresh, otherwise refetch everything"""
+        if not force and not self.is_fresh():
+            self._load_cache()
+        if force or not self.is_fresh():
+            self.refresh()
+        return self
+
+    def refresh(self):
+        """Fetch worlds, datacenters and tax rates for every world"""
+        logger.info("Refreshing world/datacenter/tax metadata...")
+        worlds = self.client.get_worlds()
+        data_centers = self.client.get_data_centers()
+        tax_rates = {}
+        for world in worlds:
+            try:
+                tax_rates[world['id']] = self.client.get_tax_rates(world['name'])
+            except Exception as e:
+                logger.warning(f"Could not fetch tax rates for {world['name']}: {e}")
+        self._index(worlds, data_centers, tax_rates)
+        self.fetched_at = time.time()
+        self._save_cache()
+
+    def _index(self, worlds: List[Dict[str, Any]], data_centers: List[Dict[str, Any]],
+               tax_rates: Dict[int, Dict[str, int]]):
+        self.worlds_by_id = {int(w['id']): w['name'] for w in worlds}
+        self.world_ids_by_name = {w['name'].lower(): int(w['id']) for w in worlds}
+        self.data_centers = {dc['name']: dc for dc in data_centers}
+        self.dc_by_world = {int(world_id): dc['name'] for dc in data_centers for world_id in dc.get('worlds', [])}
+        self.tax_rates = {int(k): v for k, v in tax_rates.items()}
+        # Cheapest retainer city per world, as a fraction
+        self.effective_tax = {world_id: min(rates.values()) / 100
+                              for world_id, rates in self.tax_rates.items() if rates}
+
+    def _load_cache(self):
+        if not store_exists(self.path):
+            return
+        try:
+            cache = read_json(self.path)
+            self._index(cache['worlds'], cache['data_centers'], cache['tax_rates'])
+            self.fetched_at = cache.get('fetched_at', 0.0)
+        except Exception as e:
+            logger.warning(f"Could not load metadata cache: {e}")
+
+    def _save_cache(self):
+        try:
+            cache = {
+                'fetched_at': self.fetched_at,
+                'worlds': [{'id': k, 'name': v} for k, v in self.worlds_by_id.items()],
+                'data_centers': list(self.data_centers.values()),
+                'tax_rates': {str(k): v for k, v in self.tax_rates.items()},
+            }
+            write_json(self.path, cache)
+        except Exception as e:
+            logger.warning(f"Could not save metadata cache: {e}")
+
+    # Lookups
+
+    def world_id(self, world: WorldKey) -> Optional[int]:
+        if isinstance(world, str) and not world.isdigit():
+            return self.world_ids_by_name.get(world.lower())
+        world_id = int(world)
+        return world_id if world_id in self.worlds_by_id else None
+
+    def world_name(self, world_id: int) -> Optional[str]:
+        return self.worlds_by_id.get(world_id)
+
+    def datacenter_of(self, world: WorldKey) -> Optional[str]:
+        world_id = self.world_id(world)
+        return self.dc_by_world.get(world_id) if world_id is not None else None
+
+    def worlds_in_datacenter(self, datacenter: str) -> List[int]:
+        dc = self.data_centers.get(datacenter)
+        return [int(w) for w in dc.get('worlds', [])] if dc else []
+
+    def region_of(self, datacenter: str) -> Optional[str]:
+        dc = self.data_centers.get(datacenter)
+        return dc.get('region') if dc else None
+
+    def datacenters_in_region(self, region: str) -> List[str]:
+        return [name for name, dc in self.data_centers.items() if dc.get('region') == region]
+
+    def city_tax_rates(self, world: WorldKey) -> Dict[str, int]:
+        """Tax rate (percent) per retainer city for a world"""
+        world_id = self.world_id(world)
+        return self.tax_rates.get(world_id, {}) if world_id is not None else {}
+
+    def market_tax(self, world: WorldKey) -> Optional[float]:
+        """
+        Effective seller tax for a world as a fraction: the cheapest retainer
+        city, since that is where a seller would list.
+        """
+        world_id = self.world_id(world)
+        return self.effective_tax.get(world_id) if world_id is not None else None
+
+    def datacenter_market_tax(self, datacenter: str) -> Optional[float]:
+        """Lowest effective tax among the worlds of a datacenter"""
+        taxes = [self.market_tax(w) for w in self.worlds_in_datacenter(datacenter)]
+        taxes = [t for t in taxes if t is not None]
+        return min(taxes) if taxes else None
+
+
+def apply_market_tax(df: pd.DataFrame, metadata: MarketMetadata, datacenter: str,
+                     world_col: str = 'sell_world_id') -> pd.DataFrame:
+    """
+    Add tax-aware margins to a v2 result frame in one vectorized step.
+
+    Each item is taxed at the rate of the world it mostly sells on (world_col);
+    items without a known world fall back to the datacenter's lowest rate.
+    Adds tax_rate, net_sell_price, net_margin_per_unit and net_profitability.
+    """
+    default_rate = metadata.datacenter_market_tax(datacenter)
+    default_rate = 0.0 if default_rate is None else default_rate
+
+    if world_col in df.columns:
+        rates = df[world_col].map(metadata.effective_tax).fillna(default_rate)
+    else:
+        rates = pd.Series(default_rate, index=df.index)
+
+    df = df.copy()
+    df['tax_rate'] = rates.astype(float)
+    df['net_sell_price'] = df['sell_price'] * (1 - df['tax_rate'])
+    df['net_margin_per_unit'] = df['net_sell_price'] - df['buy_price']
+    df['net_profitability'] = df['net_margin_per_unit'] * df['daily_volume']
+    return df
@@ -0,0 +1,172 @@
+"""
+Per-run snapshot of Universalis market data.
+
+One analysis run used to hit the same items through several endpoints and
+code paths: history for the targets, aggregated data once per craft
+ingredient (often an item that is itself a target), listings for the order
+book, and aggregated data again in the v1 analyzer. MarketSnapshot sits in
+front of all of them:
+
+- every (endpoint, item_id) pair is fetched at most once per run and then
+  served from memory,
+- misses are fetched in batches of 100 through BatchFetcher (retries,
+  bisection, bad-item memory),
+- an ID that another caller is already fetching is not requested again;
+  the second caller waits for the in-flight request and shares its result.
+"""
+import threading
+import logging
+from typing import Callable, Dict, Any, List, Iterator, Optional, Sequence
+from src.batch_fetcher import BatchFetcher
+
+logger = logging.getLogger(__name__)
+
+HISTORY = 'history'
+AGGREGATED = 'aggregated'
+LISTINGS = 'listings'
+ENDPOINTS = (HISTORY, AGGREGATED, LISTINGS)
+
+# Cached for IDs the endpoint did not return, so they are not asked for twice
+_MISSING = object()
+
+
+class MarketSnapshot:
+    """Coalescing, per-run cache over the history / aggregated / listings endpoints"""
+
+    def __init__(self, client, history_entries: int = 100, listings: int = 100,
+                 fetchers: Optional[Dict[str, BatchFetcher]] = None,
+                 history_within: Optional[float] = None, history_fields: Optional[Sequence[str]] = None):
+        self.client = client
+        fetch_fns: Dict[str, Callable[[List[int]], Dict[str, Any]]] = {
+            # Only the window (seconds) and entry fields the run's consumers read
+            HISTORY: lambda batch: client.get_history(batch, entries_to_return=history_entries,
+                                                      entries_within=history_within, fields=history_fields),
+            AGGREGATED: lambda batch: client.get_aggregated_data(batch),
+            # Both qualities; consumers filter by hq themselves
+            LISTINGS: lambda batch: client.get_listings(batch, listings=listings),
+        }
+        datacenter = getattr(client, 'datacenter', '')
+        self.fetchers = {endpoint: BatchFetcher(fn, scope=f"{endpoint}/{datacenter}")
+                         for endpoint, fn in fetch_fns.items()}
+        self.fetchers.update(fetchers or {})
+        self._data: Dict[str, Dict[int, Any]] = {endpoint: {} for endpoint in ENDPOINTS}
+        self._in_flight: Dict[str, Dict[int, threading.Event]] = {endpoint: {} for endpoint in ENDPOINTS}
+        self._lock = threading.Lock()
+        self.stats = {endpoint: {'hits': 0, 'fetched': 0, 'shared': 0} for endpoint in ENDPOINTS}
+
+    def clear(self):
+        """Drop all cached data (start of a new run)"""
+        with self._lock:
+            for endpoint in ENDPOINTS:
+                self._data[endpoint].clear()
+                self.stats[endpoint] = {'hits': 0, 'fetched': 0, 'shared': 0}
+
+    def evict(self, endpoint: str, item_ids: List[int]):
+        """Drop cached payloads that will not be needed again (streaming runs)"""
+        with self._lock:
+            for item_id in item_ids:
+                self._data[endpoint].pop(int(item_id), None)
+
+    def _claim(self, endpoint: str, item_ids: List[int]):
+        """Split IDs into cached, to-fetch (claimed by this caller) and in-flight elsewhere"""
+        cached, claimed, waiting = {}, [], {}
+        data, in_flight = self._data[endpoint], self._in_flight[endpoint]
+        with self._lock:
+            for item_id in dict.fromkeys(int(i) for i in item_ids):
+                if item_id in data:
+                    cached[item_id] = data[item_id]
+                elif item_id in in_flight:
+                    waiting[item_id] = in_flight[item_id]
+                else:
+                    in_flight[item_id] = threading.Event()
+                    claimed.append(item_id)
+            stats = self.stats[endpoint]
+            stats['hits'] += len(cached)
+            stats['fetched'] += len(claimed)
+            stats['shared'] += len(waiting)
+        return cached, claimed, waiting
+
+    def _store(self, endpoint: str, payloads: Dict[int, Any]):
+        with self._lock:
+            for item_id, payload in payloads.items():
+                self._data[endpoint][item_id] = payload
+                event = self._in_flight[endpoint].pop(item_id, None)
+                if event is not None:
+                    event.set()
+
+    def _release(self, endpoint: str, item_ids):
+        # Abandoned fetch: wake waiters without caching anything
+        with self._lock:
+            for item_id in item_ids:
+                event = self._in_flight[endpoint].pop(item_id, None)
+                if event is not None:
+                    event.set()
+
+    @staticmethod
+    def _present(payloads: Dict[int, Any]) -> Dict[int, Any]:
+        return {k: v for k, v in payloads.items() if v is not _MISSING}
+
+    def iter_batches(self, endpoint: str, item_ids: List[int]) -> Iterator[Dict[int, Any]]:
+        """
+        Yield {item_id: payload} as data becomes available: cached items first,
+        then each fetched batch, then items another caller was fetching.
+        IDs the endpoint could not resolve are left out.
+        """
+        cached, claimed, waiting = self._claim(endpoint, item_ids)
+        if cached:
+            cached = self._present(cached)
+            if cached:
+                yield cached
+
+        if claimed:
+            remaining = set(claimed)
+            completed = False
+            try:
+                for payloads in self.fetchers[endpoint].iter_batches(claimed):
+                    payloads = {k: v for k, v in payloads.items() if k in remaining}
+                    remaining.difference_update(payloads)
+                    self._store(endpoint, payloads)
+                    if payloads:
+                        yield payloads
+                completed = True
+            finally:
+                if completed:
+                    # Unresolvable IDs are remembered as missing for the rest of the run
+                    self._store(endpoint, {item_id: _MISSING for item_id in remaining})
+                else:
+                    self._release(endpoint, remaining)
+
+        if waiting:
+            for event in waiting.values():
+                event.wait()
+            with self._lock:
+                shared = {item_id: self._data[endpoint].get(item_id, _MISSING) for item_id in waiting}
+            shared = self._present(shared)
+            if shared:
+                yield shared
+
+    def get(self, endpoint: str, item_ids: List[int]) -> Dict[int, Any]:
+        """All available payloads for item_ids as one {item_id: payload} mapping"""
+        results: Dict[int, Any] = {}
+        for payloads in self.iter_batches(endpoint, item_ids):
+            results.update(payloads)
+        return results
+
+    def prefetch(self, endpoint: str, item_ids: List[int]):
+        """Warm the snapshot so later per-item lookups are served from memory"""
+        for _ in self.iter_batches(endpoint, item_ids):
+            pass
+
+    def history(self, item_ids: List[int]) -> Dict[int, Any]:
+        return self.get(HISTORY, item_ids)
+
+    def aggregated(self, item_ids: List[int]) -> Dict[int, Any]:
+        return self.get(AGGREGATED, item_ids)
+
+    def listings(self, item_ids: List[int]) -> Dict[int, Any]:
+        return self.get(LISTINGS, item_ids)
+
+    def summary(self) -> str:
+        parts = [f"{endpoint}: {s['fetched']} fetched, {s['hits']} cached, {s['shared']} shared"
+                 for endpoint, s in self.stats.items() if any(s.values())]
+        return "; ".join(parts) or "no requests"
@@ -0,0 +1,485 @@
+"""
+Pluggable metric engine over one shared market snapshot.
+
+Each metric family is a plugin registered with @register_metric. It names
+the inputs it reads (aggregated payloads, sales, listings, craft costs, ...)
+and the metrics whose columns it builds on, and computes its columns for
+every item at once from whole-frame array operations:
+
+    @register_metric('spread', inputs=('listings',), requires=('v2_percentiles',))
+    def spread(frame, inputs):
+        ...  # return a DataFrame indexed by item_id
+
+MetricEngine.compute() resolves the dependencies of the requested metrics
+into one order, fetches every input at most once (through the snapshot, so
+the v1 and v2 metrics of one run share the same market data), and joins the
+results into one row per item. A new metric is one function; it adds no
+fetch of its own and no loop over items.
+
+Base metrics (base=True) decide which items get a row: the union of the
+items they could compute. Other metrics are left-joined onto those rows.
+"""
+import logging
+from contextlib import nullcontext
+from typing import Callable, Dict, Any, List, Optional, Iterable
+import numpy as np
+import pandas as pd
+from src.market_snapshot import MarketSnapshot
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+RECENT_DAYS = 3   # v2 sell price: median of the last 3 days when there are enough sales
+MIN_RECENT_SALES = 5
+
+# Metrics computed for each quality; HQ copies are exported as hq_<metric>
+HQ_METRICS = ['buy_price', 'median_price', 'sell_price', 'sell_price_p75', 'margin_per_unit',
+              'daily_volume', 'profitability', 'price_min', 'price_max', 'price_p25', 'price_p75',
+              'total_sales_in_history', 'total_quantity_in_history']
+
+
+class Metric:
+    """A registered metric family: its inputs, the metrics it builds on and its compute function"""
+
+    def __init__(self, name: str, compute: Callable[[pd.DataFrame, "MetricInputs"], pd.DataFrame],
+                 inputs: Iterable[str] = (), requires: Iterable[str] = (), after: Iterable[str] = (),
+                 base: bool = False):
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.requires = tuple(requires)
+        # Soft ordering: run after these when they are requested too
+        self.after = tuple(after)
+        self.base = base
+
+
+METRICS: Dict[str, Metric] = {}
+INPUT_LOADERS: Dict[str, Callable[["MetricInputs"], Any]] = {}
+
+
+def register_metric(name: str, inputs: Iterable[str] = (), requires: Iterable[str] = (),
+                    after: Iterable[str] = (), base: bool = False):
+    """Decorator registering compute(frame, inputs) -> DataFrame of new columns indexed by item_id"""
+    def decorator(fn):
+        METRICS[name] = Metric(name, fn, inputs, requires, after, base)
+        return fn
+    return decorator
+
+
+def register_input(name: str):
+    """Decorator registering loader(inputs) -> value for a named input"""
+    def decorator(fn):
+        INPUT_LOADERS[name] = fn
+        return fn
+    return decorator
+
+
+def resolve_order(names: Iterable[str]) -> List[Metric]:
+    """Requested metrics plus their dependencies, dependencies first"""
+    order: List[Metric] = []
+    state: Dict[str, str] = {}
+    requested = set()
+
+    def collect(name: str):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric: {name} (available: {', '.join(sorted(METRICS))})")
+        if name in requested:
+            return
+        requested.add(name)
+        for dep in METRICS[name].requires:
+            collect(dep)
+
+    for name in names:
+        collect(name)
+
+    def visit(name: str):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Metric dependency cycle through {name}")
+        state[name] = 'visiting'
+        metric = METRICS[name]
+        for dep in metric.requires + tuple(d for d in metric.after if d in requested):
+            visit(dep)
+        state[name] = 'done'
+        order.append(metric)
+
+    for name in names:
+        visit(name)
+    for name in sorted(requested):
+        visit(name)
+    return order
+
+
+class MetricInputs:
+    """Inputs for one compute() call, each loaded at most once on first use"""
+
+    def __init__(self, engine: "MetricEngine", item_ids: List[int], preloaded: Optional[Dict[str, Any]] = None,
+                 options: Optional[Dict[str, Any]] = None):
+        self.engine = engine
+        self.item_ids = [int(i) for i in item_ids]
+        # Items that got a row from the base metrics; per-row inputs are fetched for these only
+        self.rows = list(self.item_ids)
+        self.options = options or {}
+        self._values: Dict[str, Any] = dict(preloaded or {})
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._values:
+            if name not in INPUT_LOADERS:
+                raise KeyError(f"No loader for input {name!r}")
+            self._values[name] = INPUT_LOADERS[name](self)
+        return self._values[name]
+
+
+class MetricEngine:
+    """Computes requested metric families for many items over one shared snapshot"""
+
+    def __init__(self, client, datacenter: str, snapshot: Optional[MarketSnapshot] = None,
+                 metadata=None, timer=None):
+        self.client = client
+        self.datacenter = datacenter
+        self.snapshot = snapshot or MarketSnapshot(client)
+        self.metadata = metadata
+        self.timer = timer
+
+    def _stage(self, name: str):
+        return self.timer.stage(name) if self.timer is not None else nullcontext()
+
+    def compute(self, item_ids: List[int], metrics: Iterable[str], inputs: Optional[Dict[str, Any]] = None,
+                **options) -> pd.DataFrame:
+        """
+        One row per item with the columns of every requested metric (and its dependencies).
+        inputs may pass already fetched inputs (e.g. {'history': payloads});
+        options are handed to the metrics (e.g. risk_paths).
+        """
+        context = MetricInputs(self, item_ids, inputs, options)
+        # Base metrics have no dependencies and decide the rows, so they go first
+        order = sorted(resolve_order(metrics), key=lambda m: not m.base)
+        base_rows = None
+        frame = pd.DataFrame(index=pd.Index([] if order and order[0].base else context.item_ids,
+                                            name='item_id', dtype='int64'))
+        for metric in order:
+            with self._stage(metric.name):
+                columns = metric.compute(frame, context)
+            if columns is None or len(columns.columns) == 0:
+                continue
+            columns.index = columns.index.astype('int64')
+            columns.index.name = 'item_id'
+            if metric.base:
+                frame = columns if base_rows is None else frame.combine_first(columns)
+                base_rows = frame.index
+                context.rows = base_rows.tolist()
+            else:
+                frame = frame.join(columns.drop(columns=[c for c in columns.columns if c in frame.columns]),
+                                   how='left')
+        return frame.reset_index()
+
+
+# Inputs
+
+@register_input('aggregated')
+def _load_aggregated(inputs: MetricInputs) -> Dict[int, Any]:
+    return inputs.engine.snapshot.aggregated(inputs.item_ids)
+
+
+@register_input('history')
+def _load_history(inputs: MetricInputs) -> Dict[int, Any]:
+    return inputs.engine.snapshot.history(inputs.item_ids)
+
+
+@register_input('listings')
+def _load_listings(inputs: MetricInputs) -> Dict[int, List[Dict[str, Any]]]:
+    from src.order_book import fetch_listings
+    engine = inputs.engine
+    return fetch_listings(engine.client, inputs.rows, snapshot=engine.snapshot)
+
+
+def sales_frame(history: Dict[int, Any]) -> pd.DataFrame:
+    """
+    All history entries of all items as one long frame (entry order kept),
+    with the sales the streaming anomaly detector flags marked `anomalous`
+    """
+    from src.anomaly import flag_sales
+    columns: Dict[str, list] = {'item_id': [], 'hq': [], 'price': [], 'quantity': [],
+                                'timestamp': [], 'world_id': [], 'last_upload': []}
+    for item_id, payload in history.items():
+        last_upload = (payload.get('lastUploadTime') or 0) / 1000
+        for entry in payload.get('entries', []):
+            columns['item_id'].append(int(item_id))
+            columns['hq'].append(bool(entry.get('hq')))
+            columns['price'].append(entry.get('pricePerUnit', 0))
+            columns['quantity'].append(entry.get('quantity', 0))
+            columns['timestamp'].append(entry.get('timestamp', 0))
+            columns['world_id'].append(entry.get('worldID'))
+            columns['last_upload'].append(last_upload)
+    sales = pd.DataFrame(columns).astype({'item_id': 'int64', 'hq': bool, 'price': 'float64', 'quantity': 'int64',
+                                          'timestamp': 'int64', 'world_id': 'float64', 'last_upload': 'float64'})
+    sales['anomalous'] = flag_sales(sales)
+    return sales
+
+
+@register_input('sales')
+def _load_sales(inputs: MetricInputs) -> pd.DataFrame:
+    return sales_frame(inputs['history'])
+
+
+@register_input('sale_samples')
+def _load_sale_samples(inputs: MetricInputs) -> Dict[int, Any]:
+    """NQ price / daily volume samples from the same non-anomalous sales as v2_percentiles"""
+    from src.risk_sim import frame_samples
+    sales = inputs['sales']
+    return frame_samples(sales[~sales['anomalous']])
+
+
+@register_input('craft_costs')
+def _load_craft_costs(inputs: MetricInputs) -> Dict[int, Dict[str, Any]]:
+    from src.craft_cost import estimate_craft_costs
+    engine = inputs.engine
+    return estimate_craft_costs(inputs.rows, engine.client, engine.datacenter, engine.snapshot)
+
+
+@register_input('item_names')
+def _load_item_names(inputs: MetricInputs) -> Dict[int, str]:
+    from src.item_mapper import fetch_item_names_batch
+    return fetch_item_names_batch(inputs.rows)
+
+
+# Vectorized helpers
+
+def _group_bounds(keys: np.ndarray):
+    """Start offsets and sizes of runs of equal keys in a sorted array"""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    return starts, counts
+
+
+def _exclusive_quartiles(values: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+    """
+    Per-group quartiles of sorted values, as statistics.quantiles(n=4) for
+    groups of more than 3 values and (min, median, max) for smaller groups.
+    """
+    def median():
+        lo = values[starts + (counts - 1) // 2]
+        hi = values[starts + counts // 2]
+        return (lo + hi) / 2
+
+    m = counts + 1
+    quartiles = []
+    for i in (1, 2, 3):
+        j = np.clip((i * m) // 4, 1, np.maximum(counts - 1, 1))
+        delta = i * m - j * 4
+        interpolated = (values[starts + j - 1] * (4 - delta) + values[np.minimum(starts + j, len(values) - 1)] * delta) / 4
+        quartiles.append(interpolated)
+    small = counts <= 3
+    q1 = np.where(small, values[starts], quartiles[0])
+    q2 = np.where(small, median(), quartiles[1])
+    q3 = np.where(small, values[starts + counts - 1], quartiles[2])
+    return q1, q2, q3
+
+
+def _quality_frame(sales: pd.DataFrame, days_span: pd.Series) -> pd.DataFrame:
+    """v2 price/volume metrics for the valid sales of one quality, one row per item"""
+    if len(sales) == 0:
+        return pd.DataFrame(columns=HQ_METRICS, index=pd.Index([], name='item_id', dtype='int64'))
+    ordered = sales.sort_values(['item_id', 'price'], kind='stable')
+    keys = ordered['item_id'].to_numpy()
+    prices = ordered['price'].to_numpy(dtype=np.float64)
+    starts, counts = _group_bounds(keys)
+    q1, q2, q3 = _exclusive_quartiles(prices, starts, counts)
+    items = keys[starts]
+
+    recent = ordered[ordered['recent']]
+    recent_median = recent.groupby('item_id')['price'].median()
+    recent_count = recent.groupby('item_id').size()
+    recent_median = recent_median.reindex(items)
+    use_recent = recent_count.reindex(items).fillna(0).to_numpy() >= MIN_RECENT_SALES
+    sell_price = np.where(use_recent, recent_median.to_numpy(), q2)
+
+    total_quantity = ordered.groupby('item_id')['quantity'].sum().reindex(items).to_numpy()
+    daily_volume = total_quantity / days_span.reindex(items).to_numpy()
+    return pd.DataFrame({
+        'buy_price': q1,            # 25th percentile of sales
+        'median_price': q2,         # overall median
+        'sell_price': sell_price,   # median of the last 3 days if available, else overall median
+        'sell_price_p75': q3,
+        'margin_per_unit': sell_price - q1,
+        'daily_volume': daily_volume,
+        'profitability': (sell_price - q1) * daily_volume,
+        'price_min': prices[starts],
+        'price_max': prices[starts + counts - 1],
+        'price_p25': q1,
+        'price_p75': q3,
+        'total_sales_in_history': counts,
+        'total_quantity_in_history': total_quantity,
+    }, index=pd.Index(items, name='item_id'))
+
+
+# Metrics
+
+def _listing_field(payloads: Dict[int, Any], quality: str, field: str, value_key: str) -> np.ndarray:
+    """DC value of an aggregated field per item, falling back to the region value"""
+    values = []
+    for payload in payloads.values():
+        entry = (payload.get(quality) or {}).get(field) or {}
+        value = (entry.get('dc') or {}).get(value_key, 0)
+        if not value:
+            value = (entry.get('region') or {}).get(value_key, 0)
+        values.append(value or 0)
+    return np.asarray(values, dtype=np.float64)
+
+
+@register_metric('v1_margins', inputs=('aggregated',), base=True)
+def v1_margins(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """
+    v1 margins from aggregated data, for NQ and HQ:
+    margin per unit = average sale price - minimum listing (0 unless both are known),
+    profitability = margin per unit x daily sale velocity.
+    Items without any sale velocity are left out.
+    """
+    payloads = inputs['aggregated']
+    out = pd.DataFrame(index=pd.Index([int(i) for i in payloads], name='item_id', dtype='int64'))
+    for quality in ('nq', 'hq'):
+        min_listing = _listing_field(payloads, quality, 'minListing', 'price')
+        avg_sale = _listing_field(payloads, quality, 'averageSalePrice', 'price')
+        velocity = _listing_field(payloads, quality, 'dailySaleVelocity', 'quantity')
+        margin = np.where((avg_sale > 0) & (min_listing > 0), avg_sale - min_listing, 0.0)
+        out[f'{quality}_min_listing'] = min_listing
+        out[f'{quality}_avg_sale_price'] = avg_sale
+        out[f'{quality}_daily_sales'] = velocity
+        out[f'{quality}_margin_per_unit'] = margin
+        out[f'{quality}_profitability'] = margin * velocity
+    return out[(out['nq_daily_sales'] != 0) | (out['hq_daily_sales'] != 0)]
+
+
+@register_metric('v2_percentiles', inputs=('sales',), base=True)
+def v2_percentiles(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """
+    v2 metrics from actual sales, per quality (NQ unprefixed, HQ as hq_*).
+
+    Pricing model (to avoid overvalued listings):
+    - buy_price: 25th percentile of sales (what we realistically pay to acquire)
+    - sell_price: median of the last 3 days' sales (at least 5), else the overall median
+    Volume model:
+    - daily_volume: units sold per day over the span of the observed history
+
+    Sales flagged as anomalous (spikes, dumps; see src/anomaly.py) are left
+    out of the prices and volumes and counted in anomalous_sales.
+
+    days_span covers both qualities (at least 1 day); sell_world_id is the
+    world with the most units sold; hq_premium is the HQ to NQ median ratio.
+    Items with only HQ sales have NaN NQ prices and zero NQ volume.
+    """
+    sales = inputs['sales']
+    stamped = sales[sales['timestamp'] > 0]
+    span = (stamped.groupby('item_id')['timestamp'].max() - stamped.groupby('item_id')['timestamp'].min())
+    anomalous = sales[sales['anomalous']].groupby('item_id').size()
+    valid = sales[(sales['price'] > 0) & (sales['quantity'] > 0) & ~sales['anomalous']].copy()
+    items = pd.Index(valid['item_id'].unique(), name='item_id')
+    days_span = (span / SECONDS_PER_DAY).clip(lower=1).reindex(items).fillna(1)
+
+    cutoff = valid['last_upload'] - RECENT_DAYS * SECONDS_PER_DAY
+    valid['recent'] = (valid['last_upload'] > 0) & (valid['timestamp'] >= cutoff)
+
+    nq = _quality_frame(valid[~valid['hq']], days_span).reindex(items)
+    nq['daily_volume'] = nq['daily_volume'].fillna(0.0)
+    nq['profitability'] = nq['profitability'].fillna(0.0)
+    for col in ('total_sales_in_history', 'total_quantity_in_history'):
+        nq[col] = nq[col].fillna(0).astype('int64')
+    hq = _quality_frame(valid[valid['hq']], days_span).add_prefix('hq_')
+
+    out = nq.join(hq, how='left')
+    out['days_span'] = days_span
+    out['anomalous_sales'] = anomalous.reindex(items, fill_value=0).astype('int64')
+
+    # Most units sold; ties go to the world seen first
+    worlds = valid.dropna(subset=['world_id']).assign(position=np.arange(len(valid))[valid['world_id'].notna().to_numpy()])
+    per_world = worlds.groupby(['item_id', 'world_id']).agg(units=('quantity', 'sum'), first=('position', 'min'))
+    per_world = per_world.reset_index().sort_values(['item_id', 'units', 'first'], ascending=[True, False, True])
+    out['sell_world_id'] = per_world.drop_duplicates('item_id').set_index('item_id')['world_id'].astype('int64')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        premium = out['hq_median_price'] / out['median_price']
+    out['hq_premium'] = premium.where(out['median_price'] > 0)
+    return out
+
+
+@register_metric('volatility', inputs=('sales',), requires=('v2_percentiles',))
+def volatility(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """NQ price dispersion: coefficient of variation and interquartile range relative to the median"""
+    sales = inputs['sales']
+    nq = sales[(~sales['hq']) & (sales['price'] > 0) & (sales['quantity'] > 0) & ~sales['anomalous']]
+    grouped = nq.groupby('item_id')['price']
+    cv = grouped.std() / grouped.mean()
+    iqr = (frame['price_p75'] - frame['price_p25']) / frame['median_price'].where(frame['median_price'] > 0)
+    return pd.DataFrame({'price_cv': cv.reindex(frame.index), 'price_iqr_ratio': iqr})
+
+
+@register_metric('item_name', inputs=('item_names',))
+def item_name(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    names = inputs['item_names']
+    return pd.DataFrame({'item_name': [names.get(int(i), f"Item_{i}") for i in frame.index]}, index=frame.index)
+
+
+@register_metric('craft_profit', inputs=('craft_costs',), requires=('v2_percentiles',))
+def craft_profit(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """
+    Craft cost and profit (best-effort; XIVAPI may miss recipes). Recipes
+    that can produce HQ are valued at the HQ market when it has sales.
+    """
+    costs = inputs['craft_costs']
+    craft_cost = pd.Series({item_id: info['craft_cost'] for item_id, info in costs.items()}, dtype=float)
+    can_hq = pd.Series({item_id: bool(info.get('can_hq')) for item_id, info in costs.items()}, dtype=bool)
+    craft_cost = craft_cost.reindex(frame.index)
+    known = craft_cost.notna()
+    if 'hq_sell_price' in frame.columns:
+        sell_hq = can_hq.reindex(frame.index, fill_value=False) & frame['hq_sell_price'].notna()
+        sell_price = frame['hq_sell_price'].where(sell_hq, frame['sell_price'])
+        daily_volume = frame['hq_daily_volume'].where(sell_hq, frame['daily_volume'])
+    else:
+        sell_hq = pd.Series(False, index=frame.index)
+        sell_price, daily_volume = frame['sell_price'], frame['daily_volume']
+    return pd.DataFrame({
+        'craft_cost': craft_cost,
+        'craft_sell_quality': np.where(sell_hq, 'hq', 'nq'),
+        'craft_profit': sell_price - craft_cost,
+        'craft_profit_daily': (sell_price - craft_cost) * daily_volume,
+    }, index=frame.index)[known]
+
+
+@register_metric('tax_margin', requires=('v2_percentiles',))
+def tax_margin(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """Tax-adjusted margins at the tax rate of each item's main sell world"""
+    from src.market_metadata import apply_market_tax
+    engine = inputs.engine
+    if engine.metadata is None:
+        return pd.DataFrame(index=frame.index)
+    taxed = apply_market_tax(frame, engine.metadata, engine.datacenter)
+    return taxed[['tax_rate', 'net_sell_price', 'net_margin_per_unit', 'net_profitability']]
+
+
+@register_metric('order_book', inputs=('listings',), requires=('v2_percentiles',))
+def order_book(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """Cost of buying each item's daily volume right now by sweeping current NQ listings"""
+    from src.order_book import build_depth_book, add_depth_metrics
+    logger.info(f"Fetching current listings for {len(frame)} items...")
+    book = build_depth_book(inputs['listings'], hq=False)
+    depth = add_depth_metrics(frame[['daily_volume', 'sell_price']].reset_index(), book,
+                              target_col='daily_volume', sell_col='sell_price')
+    return depth.set_index('item_id').drop(columns=['daily_volume', 'sell_price'])
+
+
+@register_metric('risk', inputs=('sale_samples',), requires=('v2_percentiles',),
+                 after=('tax_margin', 'order_book', 'craft_profit'))
+def risk(frame: pd.DataFrame, inputs: MetricInputs) -> pd.DataFrame:
+    """
+    Monte Carlo profit distribution from resampled sale prices and daily volumes
+    (mc_* columns); the buy side uses order-book and craft costs when computed
+    """
+    from src.risk_sim import add_risk_metrics, DEFAULT_PATHS
+    n_paths = inputs.options.get('risk_paths', DEFAULT_PATHS)
+    base_cols = [c for c in ('buy_price', 'tax_rate', 'depth_buy_price', 'craft_cost') if c in frame.columns]
+    simulated = add_risk_metrics(frame[base_cols].reset_index(), inputs['sale_samples'], n_paths=n_paths,
+                                 seed=inputs.options.get('risk_seed'))
+    return simulated.set_index('item_id').drop(columns=base_cols)
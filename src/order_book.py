@@ -0,0 +1,188 @@
+"""
+Order-book depth simulation from current market board listings.
+
+Listings for many items are packed into padded (items x levels) NumPy arrays
+sorted by unit price, so cumulative depth curves and the cost of buying a
+target quantity are computed for every item at once with array math.
+"""
+import logging
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+from src.batch_fetcher import BatchFetcher
+
+logger = logging.getLogger(__name__)
+
+
+class DepthBook:
+    """
+    Padded depth arrays for a set of items.
+
+    prices[i, k] is the k-th cheapest unit price of item_ids[i] (inf padding),
+    quantities[i, k] the units at that level (0 padding); cum_qty / cum_cost are
+    the cumulative units and gil needed to clear levels 0..k.
+    """
+
+    def __init__(self, item_ids: np.ndarray, prices: np.ndarray, quantities: np.ndarray):
+        self.item_ids = item_ids
+        self.prices = prices
+        self.quantities = quantities
+        self.cum_qty = np.cumsum(quantities, axis=1)
+        finite_prices = np.where(np.isfinite(prices), prices, 0.0)
+        self.cum_cost = np.cumsum(finite_prices * quantities, axis=1)
+        self.levels = (quantities > 0).sum(axis=1)
+
+    @property
+    def total_units(self) -> np.ndarray:
+        if self.cum_qty.shape[1] == 0:
+            return np.zeros(len(self.item_ids))
+        return self.cum_qty[:, -1]
+
+    def fill(self, target_qty) -> pd.DataFrame:
+        """
+        Simulate buying target_qty units of every item (scalar or one value per item),
+        sweeping the book from the cheapest listing up.
+
+        Returns per item: units filled, total cost, average fill price, the
+        marginal (worst) price paid and the fill ratio.
+        """
+        n_items = len(self.item_ids)
+        target = np.broadcast_to(np.asarray(target_qty, dtype=float), (n_items,))
+        if n_items == 0 or self.prices.shape[1] == 0:
+            return pd.DataFrame({
+                'item_id': self.item_ids,
+                'depth_units_filled': np.zeros(n_items),
+                'depth_fill_cost': np.zeros(n_items),
+                'depth_buy_price': np.full(n_items, np.nan),
+                'depth_marginal_price': np.full(n_items, np.nan),
+                'depth_fill_ratio': np.zeros(n_items),
+                'depth_units_listed': np.zeros(n_items),
+            })
+
+        rows = np.arange(n_items)
+        # Index of the level where the target is reached (= levels fully cleared before it)
+        k = (self.cum_qty < target[:, None]).sum(axis=1)
+        k = np.minimum(k, self.levels)
+        exhausted = k >= self.levels
+
+        prev = np.maximum(k - 1, 0)
+        prev_qty = np.where(k > 0, self.cum_qty[rows, prev], 0.0)
+        prev_cost = np.where(k > 0, self.cum_cost[rows, prev], 0.0)
+        level = np.minimum(k, self.prices.shape[1] - 1)
+        level_price = self.prices[rows, level]
+
+        total_units = self.total_units
+        filled = np.where(exhausted, total_units, target)
+        # Partial take at level k (nothing left to take when the book is exhausted)
+        cost = prev_cost + (target - prev_qty) * np.where(exhausted, 0.0, level_price)
+        last_level = np.maximum(self.levels - 1, 0)
+        marginal = np.where(exhausted, self.prices[rows, last_level], level_price)
+        marginal = np.where(self.levels == 0, np.nan, marginal)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_price = np.where(filled > 0, cost / filled, np.nan)
+            fill_ratio = np.where(target > 0, filled / target, 1.0)
+
+        return pd.DataFrame({
+            'item_id': self.item_ids,
+            'depth_units_filled': filled,
+            'depth_fill_cost': cost,
+            'depth_buy_price': avg_price,
+            'depth_marginal_price': marginal,
+            'depth_fill_ratio': fill_ratio,
+            'depth_units_listed': total_units,
+        })
+
+    def curve(self, item_id: int) -> pd.DataFrame:
+        """Cumulative depth curve for one item (for inspection/plotting)"""
+        idx = int(np.flatnonzero(self.item_ids == item_id)[0])
+        n = self.levels[idx]
+        return pd.DataFrame({
+            'price': self.prices[idx, :n],
+            'quantity': self.quantities[idx, :n],
+            'cum_qty': self.cum_qty[idx, :n],
+            'cum_cost': self.cum_cost[idx, :n],
+        })
+
+
+def listings_from_response(response: Dict[str, Any]) -> Dict[int, List[Dict[str, Any]]]:
+    """Normalize a single- or multi-item listings response to {item_id: listings}"""
+    if 'itemID' in response:
+        return {int(response['itemID']): response.get('listings', [])}
+    return {int(item_id): data.get('listings', []) for item_id, data in response.get('items', {}).items()}
+
+
+def build_depth_book(listings_by_item: Dict[int, List[Dict[str, Any]]],
+                     hq: Optional[bool] = None, include_tax: bool = True) -> DepthBook:
+    """
+    Pack listings into padded, price-sorted arrays.
+
+    hq filters listings by quality (None keeps both). With include_tax the
+    buyer-side market tax reported by Universalis is added to the unit price,
+    i.e. the price is what it actually costs to buy.
+    """
+    item_ids = np.array(sorted(listings_by_item), dtype=np.int64)
+    owner, prices, quantities = [], [], []
+    for idx, item_id in enumerate(item_ids):
+        for listing in listings_by_item[int(item_id)]:
+            if hq is not None and bool(listing.get('hq')) != hq:
+                continue
+            qty = listing.get('quantity', 0)
+            price = listing.get('pricePerUnit', 0)
+            if qty <= 0 or price <= 0:
+                continue
+            if include_tax and listing.get('tax'):
+                price = price + listing['tax'] / qty
+            owner.append(idx)
+            prices.append(price)
+            quantities.append(qty)
+
+    owner = np.asarray(owner, dtype=np.int64)
+    prices = np.asarray(prices, dtype=float)
+    quantities = np.asarray(quantities, dtype=float)
+
+    # Sort by (item, price) and scatter into a padded matrix
+    order = np.lexsort((prices, owner))
+    owner, prices, quantities = owner[order], prices[order], quantities[order]
+    counts = np.bincount(owner, minlength=len(item_ids))
+    width = int(counts.max()) if len(counts) and counts.max() > 0 else 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else np.array([], dtype=np.int64)
+    position = np.arange(len(owner)) - np.repeat(starts, counts)
+
+    price_matrix = np.full((len(item_ids), width), np.inf)
+    qty_matrix = np.zeros((len(item_ids), width))
+    price_matrix[owner, position] = prices
+    qty_matrix[owner, position] = quantities
+    return DepthBook(item_ids, price_matrix, qty_matrix)
+
+
+def fetch_listings(client, item_ids: List[int], listings: int = 100,
+                   hq: Optional[bool] = None, snapshot=None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Fetch current listings for many items in batches of 100.
+    With a MarketSnapshot, listings of both qualities come from the run's
+    snapshot (filter by quality in build_depth_book).
+    """
+    if snapshot is not None:
+        return {item_id: data.get('listings', []) for item_id, data in snapshot.listings(item_ids).items()}
+    fetcher = BatchFetcher(lambda batch: client.get_listings(batch, listings=listings, hq=hq),
+                           scope=f"listings/{client.datacenter}")
+    return {item_id: data.get('listings', []) for item_id, data in fetcher.fetch(item_ids).items()}
+
+
+def add_depth_metrics(df: pd.DataFrame, book: DepthBook, target_col: str = 'daily_volume',
+                      sell_col: str = 'sell_price') -> pd.DataFrame:
+    """
+    Join depth-based buy prices onto a result frame.
+
+    The target quantity per item is target_col rounded up (at least 1 unit).
+    depth_profitability = (sell price - average fill price) x units we could
+    actually buy right now, capped at the target.
+    """
+    targets = df.set_index('item_id')[target_col].reindex(book.item_ids)
+    targets = np.ceil(targets.fillna(1).clip(lower=1).to_numpy())
+    depth = book.fill(targets)
+
+    merged = df.merge(depth, on='item_id', how='left')
+    merged['depth_profitability'] = (merged[sell_col] - merged['depth_buy_price']) * merged['depth_units_filled']
+    return merged
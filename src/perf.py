@@ -0,0 +1,270 @@
+"""
+Performance benchmarks and the regression gate.
+
+Each benchmark run starts the synthetic stand-in API (src/synthetic_market.py)
+in-process and times the analyze, crawl and report paths in fresh child
+interpreters, each in its own scratch directory, so every sample starts
+cold. Per sample it records:
+
+- wall time and per-stage timings (StageTimer inside the analyzer),
+- items per second,
+- peak RSS of the child process,
+- HTTP requests made against the stand-in.
+
+Records are appended per commit to data/benchmarks/perf_history.json.
+compare_records() checks a candidate against a baseline metric by metric.
+A metric regresses when it moves the wrong way by more than both the
+configured tolerance and the measured noise (k x the pooled MAD of the
+repeats), so a few noisy samples do not fail the gate, while real slowdowns,
+extra requests and memory growth do.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERF_HISTORY_FILE = "data/benchmarks/perf_history.json"
+PATHS = ('analyze', 'crawl', 'report')
+
+# metric -> (direction, default tolerance); direction +1 = higher is better
+GATED_METRICS: Dict[str, Tuple[int, float]] = {
+    'wall_s': (-1, 0.10),
+    'items_per_s': (+1, 0.10),
+    'peak_rss_mb': (-1, 0.15),
+    'requests': (-1, 0.0),
+}
+NOISE_K = 3.0
+MAD_SCALE = 1.4826  # MAD -> standard deviation for normal noise
+
+
+class StageTimer:
+    """Accumulates wall time per named pipeline stage"""
+
+    def __init__(self):
+        self.times: Dict[str, float] = {}
+
+    def reset(self):
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.times.items()) or "no stages"
+
+
+# Child side: one timed path in this interpreter
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_path(path: str, datacenter: str, num_items: int, results_file: str) -> Dict[str, Any]:
+    """Run one benchmark path in the current process and measure it"""
+    import contextlib
+    import io
+    from src.compression import IO_STATS
+
+    start = time.perf_counter()
+    stages: Dict[str, float] = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if path == 'report':
+            from reports_v2 import generate_reports_v2
+            from src.results_io import load_results
+            generate_reports_v2(results_file)
+            items = len(load_results(results_file, columns=['item_id']))
+        else:
+            from main_v2 import build_analyzer
+            analyzer = build_analyzer(datacenter)
+            IO_STATS.reset()
+            if path == 'crawl':
+                item_ids = analyzer.client.get_marketable_items()
+                df = analyzer.analyze_and_export(output_file=results_file, item_ids=item_ids)
+            else:
+                df = analyzer.analyze_and_export(output_file=results_file, num_items=num_items)
+            items = len(df)
+            stages = dict(analyzer.timer.times)
+    wall = time.perf_counter() - start
+    return {
+        'wall_s': wall,
+        'items': items,
+        'items_per_s': items / wall if wall > 0 else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+        'requests': IO_STATS.as_dict()['requests'],
+        'stages': stages,
+    }
+
+
+# Parent side: stand-in API, child processes, records
+
+def _git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': 'unknown', 'dirty': True}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def _start_stand_in(n_items: int, seed: int):
+    """Synthetic stand-in API on a free port in a background thread"""
+    from http.server import ThreadingHTTPServer
+    from src import synthetic_market
+
+    market = synthetic_market.SyntheticMarket(n_items, seed=seed, now=time.time())
+    handler = synthetic_market.make_handler(market)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _run_child(path: str, base_url: str, workdir: str, datacenter: str, num_items: int,
+               results_file: str) -> Dict[str, Any]:
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ,
+               UNIVERSALIS_BASE_URL=f"{base_url}/api/v2", XIVAPI_BASE_URL=f"{base_url}/xivapi",
+               TEAMCRAFT_ITEMS_URL=f"{base_url}/teamcraft/items.json", UNIVERSALIS_RATE_LIMIT_DELAY="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [repo, os.environ.get('PYTHONPATH')])))
+    out_file = os.path.join(workdir, f"{path}.json")
+    code = ("import json, sys\n"
+            "from src.perf import run_path\n"
+            f"json.dump(run_path({path!r}, {datacenter!r}, {num_items}, {results_file!r}), "
+            f"open({out_file!r}, 'w'))\n")
+    subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(out_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _summarize(samples: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Median and MAD of every numeric metric (stages included as stage_<name>)"""
+    metrics: Dict[str, List[float]] = {}
+    for sample in samples:
+        values = {k: v for k, v in sample.items() if isinstance(v, (int, float)) and v is not None}
+        values.update({f"stage_{k}": v for k, v in sample.get('stages', {}).items()})
+        for key, value in values.items():
+            metrics.setdefault(key, []).append(float(value))
+    summary = {}
+    for key, values in metrics.items():
+        median = statistics.median(values)
+        summary[key] = {'median': median, 'mad': statistics.median(abs(v - median) for v in values),
+                        'n': len(values)}
+    return summary
+
+
+def run_benchmark(paths: List[str] = list(PATHS), n_items: int = 2000, seed: int = 0,
+                  repeats: int = 3, datacenter: str = 'Chaos', num_items: int = 200) -> Dict[str, Any]:
+    """
+    Benchmark the given paths against a fresh stand-in market.
+    The report path reads the crawl output (a crawl is run first if it is not benchmarked).
+    """
+    server, base_url = _start_stand_in(n_items, seed)
+    record: Dict[str, Any] = dict(_git_commit(), ts=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                  python=sys.version.split()[0], items=n_items, seed=seed,
+                                  repeats=repeats, paths={})
+    try:
+        for repeat in range(repeats):
+            with tempfile.TemporaryDirectory(prefix='market_bench_') as workdir:
+                crawl_file = os.path.join(workdir, 'data', 'crawl.parquet')
+                for path in sorted(paths, key=PATHS.index):
+                    if path == 'report' and 'crawl' not in paths:
+                        _run_child('crawl', base_url, workdir, datacenter, num_items, crawl_file)
+                    target = crawl_file if path in ('crawl', 'report') else os.path.join(workdir, 'data', 'analyze.parquet')
+                    sample = _run_child(path, base_url, workdir, datacenter, num_items, target)
+                    record['paths'].setdefault(path, {'samples': []})['samples'].append(sample)
+                    logger.info(f"{path} #{repeat + 1}: {sample['wall_s']:.2f}s, {sample['items_per_s']:.0f} items/s, "
+                                f"{sample['requests']} requests, peak RSS {sample['peak_rss_mb'] or 0:.0f} MB")
+    finally:
+        server.shutdown()
+        server.server_close()
+    for result in record['paths'].values():
+        result['summary'] = _summarize(result['samples'])
+    return record
+
+
+def load_history(path: str = PERF_HISTORY_FILE) -> List[Dict[str, Any]]:
+    from src.compression import read_json
+    return read_json(path) or []
+
+
+def save_record(record: Dict[str, Any], path: str = PERF_HISTORY_FILE):
+    from src.compression import write_json
+    history = load_history(path)
+    history.append(record)
+    write_json(path, history)
+
+
+def find_baseline(history: List[Dict[str, Any]], commit: Optional[str] = None,
+                  exclude_commit: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """A given commit's newest record, else the newest record of another commit"""
+    for record in reversed(history):
+        if commit is not None:
+            if record.get('commit', '').startswith(commit):
+                return record
+        elif record.get('commit') != exclude_commit:
+            return record
+    return None
+
+
+def compare_records(baseline: Dict[str, Any], candidate: Dict[str, Any],
+                    tolerances: Optional[Dict[str, float]] = None, noise_k: float = NOISE_K) -> List[Dict[str, Any]]:
+    """
+    Compare every gated metric of every path both records have.
+    Returns one row per metric with the relative change and a regression flag.
+    """
+    tolerances = tolerances or {}
+    rows = []
+    for path, cand in candidate.get('paths', {}).items():
+        base = baseline.get('paths', {}).get(path)
+        if base is None:
+            continue
+        for metric, (direction, default_tol) in GATED_METRICS.items():
+            b, c = base['summary'].get(metric), cand['summary'].get(metric)
+            if b is None or c is None or b['median'] is None:
+                continue
+            tolerance = tolerances.get(metric, default_tol)
+            change = c['median'] - b['median']
+            worse_by = -change if direction > 0 else change
+            noise = noise_k * MAD_SCALE * (b['mad'] ** 2 + c['mad'] ** 2) ** 0.5
+            threshold = max(tolerance * abs(b['median']), noise)
+            rows.append({
+                'path': path, 'metric': metric,
+                'baseline': b['median'], 'candidate': c['median'],
+                'change_pct': 100 * change / b['median'] if b['median'] else 0.0,
+                'threshold': threshold,
+                'regression': worse_by > threshold,
+                'improvement': -worse_by > threshold,
+            })
+    return rows
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'path':<8} {'metric':<12} {'baseline':>12} {'candidate':>12} {'change':>9}  status"]
+    for row in rows:
+        status = 'REGRESSION' if row['regression'] else ('improved' if row['improvement'] else 'ok')
+        lines.append(f"{row['path']:<8} {row['metric']:<12} {row['baseline']:>12.2f} {row['candidate']:>12.2f} "
+                     f"{row['change_pct']:>+8.1f}%  {status}")
+    return "\n".join(lines)
@@ -0,0 +1,179 @@
+"""
+Capital-constrained portfolio optimizer over analyzed opportunities.
+
+Chooses how many units of each item to buy (or craft) and resell per day to
+maximize expected daily profit subject to:
+- total capital (sum of quantity x unit cost),
+- per-item volume caps (a share of the market's daily_volume),
+- optionally, a maximum number of distinct items.
+
+Without the item-count cap this is a bounded fractional knapsack, which the
+ratio-greedy fill solves optimally (up to integer rounding of the last
+item). With the cap, a Lagrangian search over the price of capital picks the
+item set, and the same greedy fill allocates within it.
+"""
+import logging
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ALLOCATION_COLUMNS = ['item_id', 'item_name', 'source', 'quantity', 'unit_cost', 'unit_margin',
+                      'capital', 'expected_profit', 'volume_cap']
+
+
+def prepare_candidates(df: pd.DataFrame, volume_share: float = 1.0, use_craft: bool = True,
+                       profit_price_col: Optional[str] = None) -> pd.DataFrame:
+    """
+    Per-item unit cost, unit margin and quantity cap from a v2 result frame.
+
+    Sell price is net of tax when net_sell_price is present. With use_craft,
+    an item is crafted instead of bought when that earns more per day. Crafts
+    valued at the HQ market (craft_sell_quality == 'hq') are sold at the HQ
+    price and HQ volume, like craft_profit. Only items with a positive margin
+    and a cap of at least one unit are kept.
+    """
+    if profit_price_col is None:
+        profit_price_col = 'net_sell_price' if 'net_sell_price' in df.columns else 'sell_price'
+
+    cost = df['buy_price'].to_numpy(dtype=float)
+    sell = df[profit_price_col].to_numpy(dtype=float)
+    volume = df['daily_volume'].to_numpy(dtype=float)
+    source = np.full(len(df), 'market', dtype=object)
+    if use_craft and 'craft_cost' in df.columns:
+        craft = df['craft_cost'].to_numpy(dtype=float)
+        craft_sell, craft_volume = sell, volume
+        # HQ counterpart of the sell price column, taxed like it (net_sell_price -> hq_sell_price net of tax)
+        hq_col = 'hq_' + profit_price_col.removeprefix('net_')
+        if {'craft_sell_quality', hq_col, 'hq_daily_volume'} <= set(df.columns):
+            hq_price = df[hq_col].to_numpy(dtype=float)
+            if profit_price_col.startswith('net_') and 'tax_rate' in df.columns:
+                hq_price = hq_price * (1 - df['tax_rate'].fillna(0.0).to_numpy(dtype=float))
+            sell_hq = (df['craft_sell_quality'] == 'hq').to_numpy(dtype=bool) & np.isfinite(hq_price)
+            craft_sell = np.where(sell_hq, hq_price, sell)
+            craft_volume = np.where(sell_hq, df['hq_daily_volume'].to_numpy(dtype=float), volume)
+        valid = np.isfinite(craft) & (craft > 0)
+        market_daily = (sell - cost) * np.floor(volume * volume_share)
+        craft_daily = (craft_sell - craft) * np.floor(craft_volume * volume_share)
+        better = valid & (np.nan_to_num(craft_daily, nan=-np.inf) > np.nan_to_num(market_daily, nan=-np.inf))
+        cost = np.where(better, craft, cost)
+        sell = np.where(better, craft_sell, sell)
+        volume = np.where(better, craft_volume, volume)
+        source[better] = 'craft'
+
+    candidates = pd.DataFrame({
+        'item_id': df['item_id'].to_numpy(),
+        'item_name': df['item_name'].to_numpy() if 'item_name' in df.columns else df['item_id'].astype(str).to_numpy(),
+        'source': source,
+        'unit_cost': cost,
+        'unit_margin': sell - cost,
+        'volume_cap': np.floor(volume * volume_share),
+    })
+    keep = (candidates['unit_margin'] > 0) & (candidates['unit_cost'] > 0) & (candidates['volume_cap'] >= 1)
+    return candidates[keep.to_numpy()].reset_index(drop=True)
+
+
+def _greedy_fill(cost: np.ndarray, margin: np.ndarray, cap: np.ndarray, capital: float,
+                 order: np.ndarray) -> np.ndarray:
+    """Buy in the given order: whole caps while capital lasts, then what still fits"""
+    quantity = np.zeros(len(cost))
+    if len(order) == 0:
+        return quantity
+    full_cost = np.cumsum(cost[order] * cap[order])
+    n_full = int(np.searchsorted(full_cost, capital, side='right'))
+    quantity[order[:n_full]] = cap[order[:n_full]]
+    remaining = capital - (full_cost[n_full - 1] if n_full else 0.0)
+    # The first item that no longer fits entirely, then any cheaper ones after it
+    for i in order[n_full:]:
+        if remaining < cost[i]:
+            continue
+        quantity[i] = min(cap[i], np.floor(remaining / cost[i]))
+        remaining -= quantity[i] * cost[i]
+    return quantity
+
+
+def solve_allocation(cost: np.ndarray, margin: np.ndarray, cap: np.ndarray, capital: float,
+                     max_items: Optional[int] = None, iterations: int = 40) -> np.ndarray:
+    """Integer quantities per candidate maximizing sum(quantity * margin)"""
+    n = len(cost)
+    if n == 0 or capital <= 0:
+        return np.zeros(n)
+    ratio = margin / cost
+    by_ratio = np.argsort(-ratio, kind='stable')
+
+    # Integer rounding can leave greedy far from optimal on tiny problems;
+    # the best single item is the classic knapsack safeguard
+    single_qty = np.minimum(cap, np.floor(capital / cost))
+    best_single = int(np.argmax(single_qty * margin))
+    single = np.zeros(n)
+    single[best_single] = single_qty[best_single]
+
+    if max_items is None or max_items >= n:
+        greedy = _greedy_fill(cost, margin, cap, capital, by_ratio)
+        return greedy if greedy @ margin >= single @ margin else single
+
+    def allocate(price_of_capital: float) -> np.ndarray:
+        # Best max_items items when each gil of capital "costs" price_of_capital
+        value = cap * (margin - price_of_capital * cost)
+        chosen = np.argsort(-value, kind='stable')[:max_items]
+        chosen = chosen[value[chosen] > 0] if price_of_capital > 0 else chosen
+        chosen = chosen[np.argsort(-ratio[chosen], kind='stable')]
+        return _greedy_fill(cost, margin, cap, capital, chosen)
+
+    # Ratio order restricted to the first max_items items is always a candidate too
+    best = _greedy_fill(cost, margin, cap, capital, by_ratio[:max_items])
+    if single @ margin > best @ margin:
+        best = single
+    best_profit = float(best @ margin)
+    low, high = 0.0, float(ratio.max())
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        quantity = allocate(mid)
+        profit = float(quantity @ margin)
+        if profit > best_profit:
+            best, best_profit = quantity, profit
+        # Capital left over -> capital is priced too high
+        if quantity @ cost < capital * 0.999:
+            high = mid
+        else:
+            low = mid
+    quantity = allocate(0.0)
+    if float(quantity @ margin) > best_profit:
+        best = quantity
+    return best
+
+
+def optimize_portfolio(df: pd.DataFrame, capital: float, volume_share: float = 1.0,
+                       max_items: Optional[int] = None, use_craft: bool = True) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Allocate capital across the items of a v2 result frame.
+
+    Returns the allocation (ALLOCATION_COLUMNS, one row per item bought,
+    best ratio first) and a summary dict.
+    """
+    candidates = prepare_candidates(df, volume_share=volume_share, use_craft=use_craft)
+    quantity = solve_allocation(candidates['unit_cost'].to_numpy(), candidates['unit_margin'].to_numpy(),
+                                candidates['volume_cap'].to_numpy(), capital, max_items)
+
+    candidates['quantity'] = quantity
+    candidates['capital'] = quantity * candidates['unit_cost']
+    candidates['expected_profit'] = quantity * candidates['unit_margin']
+    allocation = candidates[candidates['quantity'] > 0][ALLOCATION_COLUMNS]
+    allocation = allocation.assign(_ratio=allocation['unit_margin'] / allocation['unit_cost'])
+    allocation = allocation.sort_values('_ratio', ascending=False).drop(columns='_ratio').reset_index(drop=True)
+
+    summary = {
+        'capital': capital,
+        'capital_used': float(allocation['capital'].sum()),
+        'expected_daily_profit': float(allocation['expected_profit'].sum()),
+        'items': len(allocation),
+        'candidates': len(candidates),
+        'volume_share': volume_share,
+        'max_items': max_items,
+    }
+    summary['return_on_capital'] = (summary['expected_daily_profit'] / summary['capital_used']
+                                    if summary['capital_used'] else 0.0)
+    logger.info(f"Allocated {summary['capital_used']:,.0f} of {capital:,.0f} gil across "
+                f"{summary['items']} items for {summary['expected_daily_profit']:,.0f} gil/day")
+    return allocation, summary
@@ -0,0 +1,326 @@
+"""
+Mergeable streaming quantile sketches for per-item sale prices.
+
+TDigest is a merging t-digest: sales are buffered and periodically compressed
+into a bounded number of centroids, so memory stays flat no matter how much
+history is ingested. Digests can be merged (e.g. world -> DC -> region) and
+optionally apply exponential time decay via forward decay, which keeps
+updates O(1) amortized without touching old centroids.
+
+SketchStore keeps one digest per (item, world, quality), ingests Universalis
+history payloads incrementally and persists to JSON.
+"""
+import math
+import logging
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from src.compression import read_json, write_json, store_exists
+from src.watermarks import SaleWatermarks
+
+logger = logging.getLogger(__name__)
+
+SKETCH_FILE = "data/price_sketches.json"
+
+# Rescale forward-decay weights before exp() gets anywhere near overflow
+MAX_DECAY_EXPONENT = 50.0
+
+
+class TDigest:
+    """
+    Weighted merging t-digest with optional exponential time decay.
+
+    compression controls accuracy vs size: the centroid count is a small
+    multiple of compression and grows only logarithmically with the data.
+    half_life (seconds) enables forward decay: a sale at time t gets weight
+    exp(lambda * (t - landmark)), so older sales count less without ever
+    rewriting existing centroids.
+    """
+
+    def __init__(self, compression: float = 100, half_life: Optional[float] = None):
+        self.compression = compression
+        self.half_life = half_life
+        self.decay_rate = math.log(2) / half_life if half_life else 0.0
+        self.landmark: Optional[float] = None
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.total_weight = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[Tuple[float, float]] = []
+        self._buffer_size = int(5 * compression)
+
+    def __len__(self) -> int:
+        return len(self.means) + len(self._buffer)
+
+    def _decay_weight(self, weight: float, timestamp: Optional[float]) -> float:
+        if not self.decay_rate or timestamp is None:
+            return weight
+        if self.landmark is None:
+            self.landmark = timestamp
+        exponent = self.decay_rate * (timestamp - self.landmark)
+        if exponent > MAX_DECAY_EXPONENT:
+            self._move_landmark(timestamp)
+            exponent = 0.0
+        return weight * math.exp(exponent)
+
+    def _move_landmark(self, new_landmark: float):
+        """Rescale all stored weights to a later landmark (keeps weights finite)"""
+        factor = math.exp(-self.decay_rate * (new_landmark - self.landmark))
+        self.weights = [w * factor for w in self.weights]
+        self._buffer = [(v, w * factor) for v, w in self._buffer]
+        self.total_weight *= factor
+        self.landmark = new_landmark
+
+    def add(self, value: float, weight: float = 1.0, timestamp: Optional[float] = None):
+        """Add one observation (e.g. a sale price weighted by quantity)"""
+        if weight <= 0:
+            return
+        weight = self._decay_weight(weight, timestamp)
+        self._buffer.append((value, weight))
+        self.total_weight += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def merge(self, other: "TDigest"):
+        """Merge another digest into this one (in place)"""
+        if other.total_weight == 0:
+            return
+        if self.decay_rate != other.decay_rate:
+            raise ValueError("Cannot merge digests with different half-lives")
+
+        factor = 1.0
+        if self.decay_rate and other.landmark is not None:
+            if self.landmark is None:
+                self.landmark = other.landmark
+            elif other.landmark > self.landmark:
+                self._move_landmark(other.landmark)
+            factor = math.exp(self.decay_rate * (other.landmark - self.landmark))
+
+        self._buffer.extend((m, w * factor) for m, w in zip(other.means, other.weights))
+        self._buffer.extend((v, w * factor) for v, w in other._buffer)
+        self.total_weight += other.total_weight * factor
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def _compress(self):
+        """Merge buffered points into centroids respecting the t-digest size bound"""
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+        if total <= 0:
+            self.means, self.weights = [], []
+            return
+
+        means: List[float] = []
+        weights: List[float] = []
+        cur_mean, cur_weight = points[0]
+        weight_so_far = 0.0
+        for mean, weight in points[1:]:
+            q0 = weight_so_far / total
+            q2 = (weight_so_far + cur_weight + weight) / total
+            limit = 4 * total * min(q0 * (1 - q0), q2 * (1 - q2)) / self.compression
+            if cur_weight + weight <= limit:
+                cur_mean += (mean - cur_mean) * weight / (cur_weight + weight)
+                cur_weight += weight
+            else:
+                means.append(cur_mean)
+                weights.append(cur_weight)
+                weight_so_far += cur_weight
+                cur_mean, cur_weight = mean, weight
+        means.append(cur_mean)
+        weights.append(cur_weight)
+
+        self.means, self.weights = means, weights
+        self.total_weight = total
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile (0 <= q <= 1); NaN when empty"""
+        self._compress()
+        if not self.means:
+            return math.nan
+        if len(self.means) == 1:
+            return self.means[0]
+        q = min(max(q, 0.0), 1.0)
+        target = q * self.total_weight
+
+        # Centroid i is centred at cumulative weight before it + half its weight
+        first_center = self.weights[0] / 2
+        if target <= first_center:
+            if first_center == 0:
+                return self.min
+            return self.min + (self.means[0] - self.min) * target / first_center
+
+        cumulative = 0.0
+        for i in range(len(self.means) - 1):
+            center = cumulative + self.weights[i] / 2
+            next_center = cumulative + self.weights[i] + self.weights[i + 1] / 2
+            if target <= next_center:
+                span = next_center - center
+                frac = (target - center) / span if span > 0 else 0.0
+                return self.means[i] + (self.means[i + 1] - self.means[i]) * frac
+            cumulative += self.weights[i]
+
+        last_center = self.total_weight - self.weights[-1] / 2
+        tail = self.total_weight - last_center
+        frac = (target - last_center) / tail if tail > 0 else 1.0
+        return self.means[-1] + (self.max - self.means[-1]) * min(frac, 1.0)
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        return [self.quantile(q) for q in qs]
+
+    def effective_weight(self, now: Optional[float] = None) -> float:
+        """Total (decayed) weight as of `now`; plain total when decay is off"""
+        if not self.decay_rate or self.landmark is None or now is None:
+            return self.total_weight
+        return self.total_weight * math.exp(-self.decay_rate * (now - self.landmark))
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {
+            'compression': self.compression,
+            'half_life': self.half_life,
+            'landmark': self.landmark,
+            'means': self.means,
+            'weights': self.weights,
+            'min': self.min if self.means else None,
+            'max': self.max if self.means else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        digest = cls(data.get('compression', 100), data.get('half_life'))
+        digest.landmark = data.get('landmark')
+        digest.means = list(data.get('means', []))
+        digest.weights = list(data.get('weights', []))
+        digest.total_weight = sum(digest.weights)
+        if digest.means:
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
+
+
+class SketchStore:
+    """
+    Per-item price sketches keyed by item, then (world, quality ('nq'/'hq')).
+
+    Ingestion is incremental: each (item, world, quality) remembers the
+    timestamp of its newest sale and how many sales of each (price, quantity)
+    it has ingested at that timestamp. Re-fetched history is skipped without
+    double counting, while sales in the same second, or on a world whose
+    upload lags behind the others, are still added. World sketches merge
+    into DC/region views on demand.
+    """
+
+    def __init__(self, path: str = SKETCH_FILE, compression: float = 100,
+                 half_life: Optional[float] = None):
+        self.path = path
+        self.compression = compression
+        self.half_life = half_life
+        # item_id -> (world, quality) -> digest, so per-item lookups never scan other items
+        self.sketches: Dict[int, Dict[Tuple[str, str], TDigest]] = {}
+        # item_id -> which sales were already ingested, per (world, quality)
+        self.watermarks: Dict[int, SaleWatermarks] = {}
+
+    def _sketch(self, world: str, item_id: int, quality: str) -> TDigest:
+        sketches = self.sketches.setdefault(item_id, {})
+        sketch = sketches.get((world, quality))
+        if sketch is None:
+            sketch = TDigest(self.compression, self.half_life)
+            sketches[(world, quality)] = sketch
+        return sketch
+
+    def add_sale(self, item_id: int, price: float, quantity: int = 1,
+                 timestamp: Optional[float] = None, world: str = "", hq: bool = False):
+        """Add one sale; quantity is used as the sample weight"""
+        if price <= 0 or quantity <= 0:
+            return
+        key = (str(world), 'hq' if hq else 'nq')
+        self._sketch(key[0], item_id, key[1]).add(price, quantity, timestamp)
+
+    def update_from_history(self, item_id: int, history_data: Dict[str, Any]) -> int:
+        """
+        Ingest the sales of one history payload that were not ingested before
+        for this item. Returns the number of sales added.
+        """
+        watermarks = self.watermarks.setdefault(item_id, SaleWatermarks())
+        # Oldest first so forward decay landmarks move monotonically
+        new_entries = watermarks.fresh(history_data.get('entries', []))
+        for entry in new_entries:
+            self.add_sale(item_id, entry.get('pricePerUnit', 0), entry.get('quantity', 0), entry.get('timestamp', 0),
+                          str(entry.get('worldID', entry.get('worldName', ''))), bool(entry.get('hq')))
+        return len(new_entries)
+
+    def worlds_for_item(self, item_id: int) -> List[str]:
+        return sorted({world for world, _ in self.sketches.get(item_id, {})})
+
+    def merged(self, item_id: int, worlds: Optional[Iterable] = None,
+               quality: str = 'nq') -> TDigest:
+        """
+        Merge world sketches for an item into one view. worlds=None merges every
+        world seen (DC/region view depending on what was ingested); pass the
+        world IDs of a DC to get that DC's view.
+        """
+        wanted = None if worlds is None else {str(w) for w in worlds}
+        view = TDigest(self.compression, self.half_life)
+        for (world, sketch_quality), sketch in self.sketches.get(item_id, {}).items():
+            if sketch_quality != quality:
+                continue
+            if wanted is not None and world not in wanted:
+                continue
+            view.merge(sketch)
+        return view
+
+    def price_quantiles(self, item_id: int, worlds: Optional[Iterable] = None,
+                        quality: str = 'nq') -> Optional[Dict[str, float]]:
+        """Return p25/median/p75 for an item, or None when nothing was ingested"""
+        view = self.merged(item_id, worlds, quality)
+        if view.total_weight == 0:
+            return None
+        p25, p50, p75 = view.quantiles([0.25, 0.5, 0.75])
+        return {'sketch_p25': p25, 'sketch_median': p50, 'sketch_p75': p75}
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        sketches = []
+        for item_id, item_sketches in self.sketches.items():
+            marks = self.watermarks[item_id].marks if item_id in self.watermarks else {}
+            for (w, q), s in item_sketches.items():
+                entry = {'world': w, 'item_id': item_id, 'quality': q, 'digest': s.to_dict()}
+                mark = marks.get((w, q))
+                if mark is not None:
+                    entry['last_timestamp'] = mark[0]
+                    entry['last_sales'] = [[price, quantity, count] for (price, quantity), count in mark[1].items()]
+                sketches.append(entry)
+        payload = {
+            'compression': self.compression,
+            'half_life': self.half_life,
+            'sketches': sketches,
+        }
+        write_json(path, payload)
+
+    @classmethod
+    def load(cls, path: str = SKETCH_FILE, compression: float = 100,
+             half_life: Optional[float] = None) -> "SketchStore":
+        """Load a store from disk, or return an empty one if the file is missing/unreadable"""
+        store = cls(path, compression, half_life)
+        if not store_exists(path):
+            return store
+        try:
+            payload = read_json(path)
+            store.compression = payload.get('compression', compression)
+            store.half_life = payload.get('half_life', half_life)
+            for entry in payload.get('sketches', []):
+                item_id, key = int(entry['item_id']), (entry['world'], entry['quality'])
+                store.sketches.setdefault(item_id, {})[key] = TDigest.from_dict(entry['digest'])
+                if 'last_timestamp' in entry:
+                    counts = {(price, quantity): count for price, quantity, count in entry.get('last_sales', [])}
+                    store.watermarks.setdefault(item_id, SaleWatermarks()).marks[key] = [entry['last_timestamp'], counts]
+        except Exception as e:
+            logger.warning(f"Could not load price sketches: {e}")
+        return store
@@ -0,0 +1,184 @@
+"""
+Bulk recipe resolution against XIVAPI.
+
+fetch_recipe_for_item() costs two sequential requests per item (a search,
+then the recipe body). RecipeResolver resolves many items at once:
+
+- one search per up to 100 result item IDs (filters=ItemResult.ID|=a,b,c),
+  following the pagination, and asking for the recipe columns the craft
+  estimator needs so most recipes need no second request,
+- any recipe bodies still missing are fetched by ID,
+- every request goes through a bounded thread pool and a per-host token
+  bucket, with jittered retries on 429/5xx/timeouts.
+
+Resolved recipes (and items without one) are memoized per resolver.
+"""
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
+from src.batch_fetcher import is_transient
+from src.compression import http_session
+
+logger = logging.getLogger(__name__)
+
+INGREDIENT_SLOTS = 10
+# Everything extract_ingredients()/estimate_craft_cost() read from a recipe
+RECIPE_COLUMNS = (['ID', 'ItemResultTargetID', 'CanHq', 'AmountResult']
+                  + [f'ItemIngredient{i}TargetID' for i in range(INGREDIENT_SLOTS)]
+                  + [f'AmountIngredient{i}' for i in range(INGREDIENT_SLOTS)])
+
+
+class HostRateLimiter:
+    """Token bucket per host: at most `rate` requests/s with bursts of `burst`"""
+
+    def __init__(self, rate: float = 15.0, burst: int = 5):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str):
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                tokens, last = self._buckets.get(host, [float(self.burst), time.monotonic()])
+                now = time.monotonic()
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = [tokens - 1, now]
+                    return
+                self._buckets[host] = [tokens, now]
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+class RecipeResolver:
+    """Resolve recipes for many items with batched searches and a concurrent fetch pool"""
+
+    def __init__(self, search_url: Optional[str] = None, recipe_url: Optional[str] = None,
+                 max_workers: int = 8, rate: float = 15.0, ids_per_search: int = 100,
+                 page_size: int = 100, timeout: float = 15.0, max_retries: int = 3):
+        from src.craft_cost import XIVAPI_SEARCH, XIVAPI_RECIPE
+        self.search_url = search_url or XIVAPI_SEARCH
+        self.recipe_url = recipe_url or XIVAPI_RECIPE
+        self.max_workers = max_workers
+        self.ids_per_search = ids_per_search
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = HostRateLimiter(rate)
+        self.session = http_session()
+        # One pooled connection per worker
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.recipes: Dict[int, Optional[Dict[str, Any]]] = {}
+        self.stats = {'searches': 0, 'bodies': 0, 'retries': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(url)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+        raise RuntimeError("unreachable")
+
+    def _search(self, item_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """First recipe per result item for one chunk of IDs, across all result pages"""
+        found: Dict[int, Dict[str, Any]] = {}
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            data = self._get(self.search_url, {
+                'indexes': 'recipe',
+                'filters': f"ItemResult.ID|={','.join(map(str, item_ids))}",
+                'columns': ','.join(RECIPE_COLUMNS),
+                'limit': self.page_size,
+                'page': page,
+            })
+            self._count('searches')
+            for result in data.get('Results', []):
+                item_id = result.get('ItemResultTargetID') or (result.get('ItemResult') or {}).get('ID')
+                if item_id is not None and int(item_id) not in found:
+                    found[int(item_id)] = result
+            total_pages = int((data.get('Pagination') or {}).get('PageTotal') or 1)
+            page += 1
+        return found
+
+    def _fetch_body(self, recipe_id: int) -> Optional[Dict[str, Any]]:
+        self._count('bodies')
+        return self._get(self.recipe_url.format(id=recipe_id))
+
+    def resolve(self, item_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """{item_id: recipe or None} for every requested item"""
+        pending = [int(i) for i in dict.fromkeys(item_ids) if int(i) not in self.recipes]
+        if pending:
+            start = time.perf_counter()
+            chunks = [pending[i:i + self.ids_per_search] for i in range(0, len(pending), self.ids_per_search)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                found: Dict[int, Dict[str, Any]] = {}
+                failed = set()
+                for chunk, future in zip(chunks, [pool.submit(self._search, c) for c in chunks]):
+                    try:
+                        found.update(future.result())
+                    except Exception as e:
+                        logger.warning(f"Recipe search failed for {len(chunk)} items: {e}")
+                        self._count('failed', len(chunk))
+                        failed.update(chunk)
+
+                # Search results without ingredient columns need the full body
+                need_body = {item_id: result.get('ID') for item_id, result in found.items()
+                             if 'ItemIngredient0TargetID' not in result and result.get('ID') is not None}
+                futures = {item_id: pool.submit(self._fetch_body, recipe_id)
+                           for item_id, recipe_id in need_body.items()}
+                for item_id, future in futures.items():
+                    try:
+                        found[item_id] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Recipe fetch failed for item {item_id}: {e}")
+                        self._count('failed')
+                        found.pop(item_id, None)
+                        failed.add(item_id)
+
+            # Failures are not memoized, so a later call tries them again
+            for item_id in pending:
+                if item_id not in failed:
+                    self.recipes[item_id] = found.get(item_id)
+            logger.info(f"Resolved recipes for {len(pending)} items in {time.perf_counter() - start:.1f}s: "
+                        f"{sum(1 for i in pending if self.recipes.get(i))} craftable, "
+                        f"{self.stats['searches']} searches, {self.stats['bodies']} bodies, "
+                        f"{self.stats['retries']} retries")
+        return {int(i): self.recipes.get(int(i)) for i in item_ids}
+
+    def resolve_one(self, item_id: int) -> Optional[Dict[str, Any]]:
+        return self.resolve([item_id]).get(int(item_id))
+
+
+_default_resolver: Optional[RecipeResolver] = None
+_default_lock = threading.Lock()
+
+
+def default_resolver() -> RecipeResolver:
+    """Process-wide resolver, so recipes are only looked up once per process"""
+    global _default_resolver
+    with _default_lock:
+        if _default_resolver is None:
+            _default_resolver = RecipeResolver()
+        return _default_resolver
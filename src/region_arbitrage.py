@@ -0,0 +1,159 @@
+"""
+Cross-datacenter arbitrage within a region.
+
+Every analysis so far looks at one datacenter. RegionArbitrage pulls the
+aggregated DC-level metrics of every datacenter in a region (found through
+get_data_centers, via MarketMetadata) and lays them out as DC x item
+matrices: cheapest listing, average sale price and daily sale velocity.
+
+For every item and every (buy DC, sell DC) pair at once, as one broadcast
+over a DC x DC x item array:
+
+- buy cost: cheapest listing in the buy DC plus the buyer's market tax,
+- sell price: average sale price in the sell DC, capped at its cheapest
+  listing (a seller has to undercut it), minus that DC's seller tax,
+- daily units: volume_share of the smaller of the two DCs' velocities (the
+  sell DC's demand, and the buy DC's turnover as a proxy for how fast cheap
+  listings come back), optionally capped at max_units,
+- daily profit: margin per unit x daily units.
+
+The best pair per item is an argmax over the flattened DC pairs, so the
+whole marketable universe is ranked in one pass. Only DC values are used:
+region values are the same for every DC and would hide the spread.
+"""
+import time
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from src.universalis_client import UniversalisClient
+from src.market_snapshot import MarketSnapshot
+
+logger = logging.getLogger(__name__)
+
+BUYER_TAX = 0.05   # added to market board purchases (Universalis listing 'tax')
+
+MATRIX_FIELDS = {
+    'min_listing': ('minListing', 'price'),
+    'avg_sale': ('averageSalePrice', 'price'),
+    'velocity': ('dailySaleVelocity', 'quantity'),
+}
+
+ARBITRAGE_COLUMNS = ['item_id', 'item_name', 'quality', 'buy_dc', 'sell_dc', 'buy_price', 'sell_price',
+                     'sell_tax_rate', 'net_sell_price', 'margin_per_unit', 'margin_pct',
+                     'daily_units', 'daily_profit', 'datacenters_priced']
+
+
+class RegionArbitrage:
+    """DC x item price/volume matrices for one region and the best buy/sell DC pair per item"""
+
+    def __init__(self, region: str, metadata=None, snapshots: Optional[Dict[str, MarketSnapshot]] = None):
+        if metadata is None:
+            from src.market_metadata import MarketMetadata
+            metadata = MarketMetadata().load()
+        self.region = region
+        self.metadata = metadata
+        self.datacenters = sorted(metadata.datacenters_in_region(region))
+        if not self.datacenters:
+            raise ValueError(f"Unknown region: {region}")
+        self.snapshots = snapshots or {dc: MarketSnapshot(UniversalisClient(dc)) for dc in self.datacenters}
+        # Seller tax per DC: the lowest rate among its worlds
+        self.seller_tax = np.asarray([metadata.datacenter_market_tax(dc) or 0.0 for dc in self.datacenters])
+        self.item_ids = np.empty(0, dtype=np.int64)
+        self.matrices: Dict[str, Dict[str, np.ndarray]] = {}
+
+    def fetch(self, item_ids: List[int]) -> "RegionArbitrage":
+        """Fetch aggregated data for item_ids on every DC and build the matrices"""
+        self.item_ids = np.asarray(list(dict.fromkeys(int(i) for i in item_ids)), dtype=np.int64)
+        column = {item_id: j for j, item_id in enumerate(self.item_ids.tolist())}
+        shape = (len(self.datacenters), len(self.item_ids))
+        self.matrices = {quality: {name: np.zeros(shape) for name in MATRIX_FIELDS} for quality in ('nq', 'hq')}
+
+        for d, dc in enumerate(self.datacenters):
+            start = time.perf_counter()
+            payloads = self.snapshots[dc].aggregated(self.item_ids.tolist())
+            for item_id, payload in payloads.items():
+                j = column.get(int(item_id))
+                if j is None:
+                    continue
+                for quality, matrices in self.matrices.items():
+                    metrics = payload.get(quality) or {}
+                    for name, (field, key) in MATRIX_FIELDS.items():
+                        value = ((metrics.get(field) or {}).get('dc') or {}).get(key)
+                        if value:
+                            matrices[name][d, j] = value
+            logger.info(f"{dc}: aggregated data for {len(payloads)} of {len(self.item_ids)} items "
+                        f"in {time.perf_counter() - start:.1f}s")
+        return self
+
+    def price_matrix(self, metric: str = 'min_listing', quality: str = 'nq') -> pd.DataFrame:
+        """One matrix as a DC x item frame (NaN where the DC has no value)"""
+        values = self.matrices[quality][metric]
+        return pd.DataFrame(np.where(values > 0, values, np.nan), index=pd.Index(self.datacenters, name='datacenter'),
+                            columns=pd.Index(self.item_ids, name='item_id'))
+
+    def best_pairs(self, quality: str = 'nq', volume_share: float = 1.0,
+                   max_units: Optional[float] = None, min_profit: float = 0.0) -> pd.DataFrame:
+        """
+        Most profitable (buy DC, sell DC) pair per item for one quality,
+        keeping items whose best daily profit is above min_profit
+        """
+        if not len(self.item_ids):
+            return pd.DataFrame(columns=[c for c in ARBITRAGE_COLUMNS if c != 'item_name'])
+        m = self.matrices[quality]
+        listing, avg_sale, velocity = m['min_listing'], m['avg_sale'], m['velocity']
+        n_dc = len(self.datacenters)
+
+        buy = np.where(listing > 0, listing * (1 + BUYER_TAX), np.nan)
+        sell = np.where(avg_sale > 0, np.where(listing > 0, np.minimum(avg_sale, listing), avg_sale), np.nan)
+        net_sell = sell * (1 - self.seller_tax[:, None])
+
+        # [buy DC, sell DC, item]
+        margin = net_sell[None, :, :] - buy[:, None, :]
+        units = volume_share * np.minimum(velocity[:, None, :], velocity[None, :, :])
+        if max_units is not None:
+            units = np.minimum(units, max_units)
+        profit = margin * units
+        profit[np.arange(n_dc), np.arange(n_dc), :] = np.nan
+        profit = np.where(np.isnan(profit), -np.inf, profit).reshape(n_dc * n_dc, -1)
+
+        best = np.argmax(profit, axis=0)
+        columns = np.arange(len(self.item_ids))
+        daily_profit = profit[best, columns]
+        keep = daily_profit > min_profit
+        b, s, j = best[keep] // n_dc, best[keep] % n_dc, columns[keep]
+        dcs = np.asarray(self.datacenters, dtype=object)
+
+        buy_price, net = buy[b, j], net_sell[s, j]
+        out = pd.DataFrame({
+            'item_id': self.item_ids[j],
+            'quality': quality,
+            'buy_dc': dcs[b],
+            'sell_dc': dcs[s],
+            'buy_price': buy_price,
+            'sell_price': sell[s, j],
+            'sell_tax_rate': self.seller_tax[s],
+            'net_sell_price': net,
+            'margin_per_unit': net - buy_price,
+            'margin_pct': (net - buy_price) / buy_price,
+            'daily_units': units.reshape(n_dc * n_dc, -1)[best[keep], j],
+            'daily_profit': daily_profit[keep],
+            'datacenters_priced': (listing[:, j] > 0).sum(axis=0),
+        })
+        return out.sort_values('daily_profit', ascending=False, kind='stable').reset_index(drop=True)
+
+    def analyze(self, item_ids: List[int], qualities: tuple = ('nq', 'hq'), volume_share: float = 1.0,
+                max_units: Optional[float] = None, min_profit: float = 0.0,
+                with_names: bool = True) -> pd.DataFrame:
+        """Fetch every DC and return the best pair per item and quality, most profitable first"""
+        self.fetch(item_ids)
+        start = time.perf_counter()
+        frames = [self.best_pairs(q, volume_share, max_units, min_profit) for q in qualities]
+        df = pd.concat(frames, ignore_index=True).sort_values('daily_profit', ascending=False, kind='stable')
+        logger.info(f"Ranked {len(self.datacenters)}x{len(self.datacenters)} DC pairs for "
+                    f"{len(self.item_ids)} items in {time.perf_counter() - start:.2f}s: {len(df)} profitable")
+        if with_names and len(df):
+            from src.item_mapper import fetch_item_names_batch
+            names = fetch_item_names_batch(df['item_id'].unique().tolist())
+            df['item_name'] = [names.get(int(i), f"Item_{i}") for i in df['item_id']]
+        return df.reindex(columns=[c for c in ARBITRAGE_COLUMNS if c in df.columns]).reset_index(drop=True)
@@ -0,0 +1,212 @@
+"""
+Typed columnar storage for analysis results.
+
+Results are written as Parquet (or Feather) with an explicit schema and the
+run metadata (datacenter, timestamp, parameters) embedded in the file, so
+readers can load only the columns they need without re-inferring types.
+CSV remains available as an optional export.
+"""
+import json
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+import pandas as pd
+from src.compression import record_file_write
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b"market_annihilation"
+
+# Explicit dtypes for every column the v2 analyzer can export.
+# Float columns are nullable so optional metrics (craft cost etc.) round-trip as NaN.
+RESULT_SCHEMA: Dict[str, str] = {
+    'item_id': 'int64',
+    'item_name': 'string',
+    'buy_price': 'float64',
+    'median_price': 'float64',
+    'sell_price': 'float64',
+    'sell_price_p75': 'float64',
+    'margin_per_unit': 'float64',
+    'daily_volume': 'float64',
+    'profitability': 'float64',
+    'price_min': 'float64',
+    'price_p25': 'float64',
+    'price_p75': 'float64',
+    'price_max': 'float64',
+    'total_sales_in_history': 'int64',
+    'total_quantity_in_history': 'int64',
+    'days_span': 'float64',
+    'anomalous_sales': 'int64',
+    'sell_world_id': 'Int64',
+    'tax_rate': 'float64',
+    'net_sell_price': 'float64',
+    'net_margin_per_unit': 'float64',
+    'net_profitability': 'float64',
+    'sketch_p25': 'float64',
+    'sketch_median': 'float64',
+    'sketch_p75': 'float64',
+    'vwap_7d': 'float64',
+    'volume_7d': 'float64',
+    'median_7d': 'float64',
+    'volatility_7d': 'float64',
+    'vwap_change_7d': 'float64',
+    'trend_days': 'float64',
+    'forecast_sell_price': 'float64',
+    'forecast_daily_volume': 'float64',
+    'forecast_days': 'Int64',
+    'depth_buy_price': 'float64',
+    'depth_marginal_price': 'float64',
+    'depth_units_filled': 'float64',
+    'depth_units_listed': 'float64',
+    'depth_fill_ratio': 'float64',
+    'depth_profitability': 'float64',
+    'mc_expected_profit': 'float64',
+    'mc_profit_std': 'float64',
+    'mc_profit_p05': 'float64',
+    'mc_profit_p50': 'float64',
+    'mc_cvar_05': 'float64',
+    'mc_prob_loss': 'float64',
+    'hq_buy_price': 'float64',
+    'hq_median_price': 'float64',
+    'hq_sell_price': 'float64',
+    'hq_sell_price_p75': 'float64',
+    'hq_margin_per_unit': 'float64',
+    'hq_daily_volume': 'float64',
+    'hq_profitability': 'float64',
+    'hq_price_min': 'float64',
+    'hq_price_p25': 'float64',
+    'hq_price_p75': 'float64',
+    'hq_price_max': 'float64',
+    'hq_total_sales_in_history': 'Int64',
+    'hq_total_quantity_in_history': 'Int64',
+    'hq_premium': 'float64',
+    'craft_cost': 'float64',
+    'craft_sell_quality': 'string',
+    'craft_profit': 'float64',
+    'craft_profit_daily': 'float64',
+}
+
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.feather': 'feather'}
+
+
+def _first_part(path: str) -> str:
+    """First Parquet part file of a streamed (partitioned) result directory"""
+    parts = sorted(name for name in os.listdir(path)
+                   if name.endswith('.parquet') and not name.startswith(('.', '_')))
+    if not parts:
+        raise FileNotFoundError(f"No result parts in {path}")
+    return os.path.join(path, parts[0])
+
+
+def detect_format(path: str) -> str:
+    """Return 'parquet', 'feather' or 'csv' based on the file extension (directories are Parquet parts)"""
+    if os.path.isdir(path):
+        return 'parquet'
+    suffix = os.path.splitext(path)[1].lower()
+    return COLUMNAR_FORMATS.get(suffix, 'csv')
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast known result columns to their schema dtypes (unknown columns are left as-is)"""
+    casts = {col: dtype for col, dtype in RESULT_SCHEMA.items() if col in df.columns}
+    return df.astype(casts)
+
+
+def build_run_metadata(datacenter: str, parameters: Optional[Dict[str, Any]] = None,
+                       run_ts: Optional[datetime] = None) -> Dict[str, Any]:
+    """Build the metadata record stored alongside a result set"""
+    run_ts = run_ts or datetime.now(timezone.utc)
+    return {
+        'datacenter': datacenter,
+        'run_ts': run_ts.isoformat(),
+        'parameters': parameters or {},
+        'schema_version': 1,
+    }
+
+
+def write_results(df: pd.DataFrame, path: str, metadata: Optional[Dict[str, Any]] = None):
+    """
+    Write a result frame to Parquet, Feather or CSV (chosen by extension).
+
+    For the columnar formats the run metadata is stored in the Arrow schema
+    metadata; CSV output carries no metadata.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df = apply_schema(df)
+    fmt = detect_format(path)
+
+    if fmt == 'csv':
+        # .csv.gz / .csv.zst are compressed by pandas
+        df.to_csv(path, index=False)
+        record_file_write(path)
+        return
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[METADATA_KEY] = json.dumps(metadata or {}).encode('utf-8')
+    table = table.replace_schema_metadata(schema_metadata)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression='zstd')
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression='zstd')
+    record_file_write(path, table.nbytes)
+
+
+def _read_arrow_schema(path: str, fmt: str):
+    if fmt == 'parquet' and os.path.isdir(path):
+        path = _first_part(path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(path)
+    import pyarrow.ipc as ipc
+    with ipc.open_file(path) as reader:
+        return reader.schema
+
+
+def available_columns(path: str) -> List[str]:
+    """List the columns stored in a result file without loading any data"""
+    fmt = detect_format(path)
+    if fmt == 'csv':
+        return list(pd.read_csv(path, nrows=0).columns)
+    return list(_read_arrow_schema(path, fmt).names)
+
+
+def read_run_metadata(path: str) -> Dict[str, Any]:
+    """Return the run metadata embedded in a Parquet/Feather result file ({} for CSV)"""
+    fmt = detect_format(path)
+    if fmt == 'csv':
+        return {}
+    schema_metadata = _read_arrow_schema(path, fmt).metadata or {}
+    raw = schema_metadata.get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def load_results(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load a result file, reading only the requested columns.
+
+    Columns that are not present in the file are silently skipped so reports
+    can ask for optional metrics (e.g. craft_cost) without checking first.
+    A directory is read as the Parquet parts of a streamed run.
+    """
+    fmt = detect_format(path)
+    if columns is not None:
+        present = set(available_columns(path))
+        columns = [col for col in columns if col in present]
+
+    if fmt == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+    elif fmt == 'feather':
+        df = pd.read_feather(path, columns=columns)
+    else:
+        dtypes = {col: dtype for col, dtype in RESULT_SCHEMA.items()
+                  if columns is None or col in columns}
+        df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+
+    return df
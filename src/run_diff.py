@@ -0,0 +1,213 @@
+"""
+Diff engine for comparing analysis runs.
+
+Joins any number of result sets (historical v2 runs, or v1 vs v2 outputs)
+on item_id and computes deltas, rank changes and new/dropped items with
+vectorized pandas operations instead of per-item lookups.
+"""
+import os
+import logging
+from typing import Dict, List, Optional, Sequence
+import pandas as pd
+from src.results_io import load_results, available_columns, read_run_metadata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS = ['profitability', 'daily_volume', 'margin_per_unit']
+
+# v1 (aggregated) column names mapped onto the v2 names used by the engine
+V1_COLUMN_MAP = {
+    'nq_min_listing': 'buy_price',
+    'nq_avg_sale_price': 'sell_price',
+    'nq_margin_per_unit': 'margin_per_unit',
+    'nq_daily_sales': 'daily_volume',
+    'nq_profitability': 'profitability',
+}
+
+
+def normalize_run(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rename v1 columns to their v2 equivalents and index the frame by item_id.
+    Duplicate item_ids keep their first row.
+    """
+    if 'profitability' not in df.columns and 'nq_profitability' in df.columns:
+        df = df.rename(columns=V1_COLUMN_MAP)
+    df = df.drop_duplicates(subset='item_id')
+    return df.set_index('item_id')
+
+
+def load_run(path: str, metrics: Sequence[str] = DEFAULT_METRICS) -> pd.DataFrame:
+    """Load one result file, reading only item_id, item_name and the requested metrics"""
+    present = set(available_columns(path))
+    reverse_v1 = {v: k for k, v in V1_COLUMN_MAP.items()}
+    columns = ['item_id', 'item_name']
+    for metric in metrics:
+        if metric in present:
+            columns.append(metric)
+        elif reverse_v1.get(metric) in present:
+            columns.append(reverse_v1[metric])
+    return normalize_run(load_results(path, columns=columns))
+
+
+def run_label(path: str) -> str:
+    """Label a run by its embedded run timestamp, falling back to the file name"""
+    metadata = read_run_metadata(path)
+    return metadata.get('run_ts') or os.path.splitext(os.path.basename(path))[0]
+
+
+def unique_labels(labels: Sequence[str]) -> List[str]:
+    """Make repeated labels unique with a #2, #3, ... suffix (first occurrence unchanged)"""
+    taken = set(labels)
+    counts: Dict[str, int] = {}
+    out = []
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+        if counts[label] == 1:
+            out.append(label)
+            continue
+        n = counts[label]
+        while f"{label}#{n}" in taken:
+            n += 1
+        counts[label] = n
+        taken.add(f"{label}#{n}")
+        out.append(f"{label}#{n}")
+    return out
+
+
+def load_runs(paths: Sequence[str], metrics: Sequence[str] = DEFAULT_METRICS,
+              labels: Optional[Sequence[str]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Load several result files into an ordered {label: frame} mapping.
+    Derived labels (run timestamp / file name) that repeat get a #N suffix;
+    repeated explicit labels are an error.
+    """
+    if labels:
+        labels = list(labels)
+        duplicates = sorted({label for label in labels if labels.count(label) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate run labels: {', '.join(duplicates)}")
+    else:
+        labels = unique_labels([run_label(p) for p in paths])
+    if len(labels) != len(paths):
+        raise ValueError("Need exactly one label per run")
+    return {label: load_run(path, metrics) for label, path in zip(labels, paths)}
+
+
+def stack_runs(runs: Dict[str, pd.DataFrame], metrics: Sequence[str] = DEFAULT_METRICS,
+               rank_metric: str = 'profitability') -> pd.DataFrame:
+    """
+    Concatenate runs into one long frame indexed by (run, item_id) and add a
+    per-run rank on rank_metric (1 = best).
+    """
+    frames = []
+    for frame in runs.values():
+        cols = [m for m in metrics if m in frame.columns]
+        if 'item_name' in frame.columns:
+            cols = ['item_name'] + cols
+        frames.append(frame[cols])
+
+    long_df = pd.concat(frames, keys=list(runs.keys()), names=['run', 'item_id'])
+    if rank_metric in long_df.columns:
+        long_df['rank'] = (
+            long_df.groupby(level='run')[rank_metric]
+            .rank(ascending=False, method='min')
+        )
+    return long_df
+
+
+def diff_runs(runs: Dict[str, pd.DataFrame], metrics: Sequence[str] = DEFAULT_METRICS,
+              rank_metric: str = 'profitability') -> pd.DataFrame:
+    """
+    Build a comparison table across runs (in the given order).
+
+    Returns one row per item seen in any run with:
+    - `<metric>@<run>` and `rank@<run>` for every run
+    - `<metric>_delta` / `<metric>_pct_change`: last run vs first run
+    - `rank_change`: positive when the item moved up between first and last run
+    - `runs_present`: number of runs containing the item
+    - `status`: 'new' (absent in first run), 'dropped' (absent in last run),
+      'persistent' (in both) or 'transient' (in neither endpoint)
+    """
+    if len(runs) < 2:
+        raise ValueError("Need at least two runs to compare")
+
+    labels = list(runs.keys())
+    first, last = labels[0], labels[-1]
+    long_df = stack_runs(runs, metrics, rank_metric)
+    value_cols = [c for c in long_df.columns if c != 'item_name']
+
+    wide = long_df[value_cols].unstack(level='run')
+    wide = wide.reindex(columns=labels, level='run')
+
+    flat = wide.copy()
+    flat.columns = [f"{col}@{label}" for col, label in flat.columns]
+    if 'item_name' in long_df.columns:
+        # Most recent non-null name per item
+        names = long_df['item_name'].dropna().groupby(level='item_id').last()
+        table = pd.concat([names.rename('item_name'), flat], axis=1)
+    else:
+        table = flat
+
+    present = wide[value_cols[0]].notna()
+    in_first = present[first]
+    in_last = present[last]
+    table['runs_present'] = present.sum(axis=1)
+
+    for metric in metrics:
+        if metric not in value_cols:
+            continue
+        start = wide[(metric, first)]
+        end = wide[(metric, last)]
+        table[f"{metric}_delta"] = end - start
+        table[f"{metric}_pct_change"] = (end - start) / start.abs().where(start != 0)
+
+    if 'rank' in value_cols:
+        table['rank_change'] = wide[('rank', first)] - wide[('rank', last)]
+
+    status = pd.Series('transient', index=table.index)
+    status[in_first & in_last] = 'persistent'
+    status[~in_first & in_last] = 'new'
+    status[in_first & ~in_last] = 'dropped'
+    table['status'] = status
+
+    sort_col = f"{rank_metric}@{last}"
+    if sort_col in table.columns:
+        table = table.sort_values(sort_col, ascending=False, na_position='last')
+    return table
+
+
+def summarize_runs(runs: Dict[str, pd.DataFrame], rank_metric: str = 'profitability') -> pd.DataFrame:
+    """
+    One row per run: item count, items new/dropped versus the previous run,
+    and the total/positive counts of rank_metric.
+    """
+    labels = list(runs.keys())
+    presence = pd.concat(
+        [pd.Series(True, index=runs[label].index, name=label) for label in labels], axis=1
+    ).fillna(False).astype(bool)
+    previous = presence.shift(1, axis=1, fill_value=False)
+
+    summary = pd.DataFrame(index=pd.Index(labels, name='run'))
+    summary['items'] = presence.sum(axis=0)
+    summary['new_items'] = (presence & ~previous).sum(axis=0)
+    summary['dropped_items'] = (~presence & previous).sum(axis=0)
+    summary.iloc[0, summary.columns.get_loc('new_items')] = 0
+    summary[f"total_{rank_metric}"] = [
+        runs[label][rank_metric].sum() if rank_metric in runs[label].columns else float('nan')
+        for label in labels
+    ]
+    summary[f"positive_{rank_metric}"] = [
+        int((runs[label][rank_metric] > 0).sum()) if rank_metric in runs[label].columns else 0
+        for label in labels
+    ]
+    return summary
+
+
+def top_movers(table: pd.DataFrame, metric: str = 'profitability', n: int = 10) -> Dict[str, pd.DataFrame]:
+    """Return the n biggest gainers and losers by `<metric>_delta` among persistent items"""
+    delta_col = f"{metric}_delta"
+    persistent = table[table['status'] == 'persistent']
+    return {
+        'gainers': persistent.nlargest(n, delta_col),
+        'losers': persistent.nsmallest(n, delta_col),
+    }
@@ -0,0 +1,123 @@
+"""
+Building blocks for the streaming (bounded-memory) analysis mode.
+
+- StreamingResultWriter appends each analyzed chunk to disk as soon as it
+  is ready: a directory of Parquet part files (each written atomically, so
+  the partial output can be read with load_results(dir) mid-run) or a
+  single CSV that grows one chunk at a time.
+- RunningSummary keeps only the top-K rows and summary statistics (the
+  median comes from a t-digest) instead of the full result frame.
+"""
+import glob
+import heapq
+import os
+import logging
+from typing import Dict, Any, List, Optional
+import pandas as pd
+from src.results_io import write_results, apply_schema
+from src.quantile_sketch import TDigest
+from src.compression import IO_STATS
+
+logger = logging.getLogger(__name__)
+
+PART_PATTERN = "part-{:05d}.parquet"
+
+
+class StreamingResultWriter:
+    """Append result chunks to a Parquet part directory or a CSV file"""
+
+    def __init__(self, path: str, columns: List[str], metadata: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.columns = columns
+        self.metadata = metadata or {}
+        self.is_csv = path.lower().endswith(('.csv', '.csv.gz', '.csv.zst'))
+        self.parts = 0
+        self.rows = 0
+        self._reset_output()
+
+    def _reset_output(self):
+        if self.is_csv:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # Only our own part files from a previous run are removed
+        for old_part in glob.glob(os.path.join(self.path, "part-*.parquet")):
+            os.remove(old_part)
+
+    def append(self, df: pd.DataFrame):
+        """Write one chunk; every chunk has the same columns so the parts form one dataset"""
+        if len(df) == 0:
+            return
+        chunk = apply_schema(df.reindex(columns=self.columns))
+        if self.is_csv:
+            before = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            chunk.to_csv(self.path, mode='a', header=self.rows == 0, index=False)
+            IO_STATS.record_write(os.path.getsize(self.path) - before)
+        else:
+            part = os.path.join(self.path, PART_PATTERN.format(self.parts))
+            # Dot-prefixed temp files are ignored by dataset readers until renamed
+            tmp = os.path.join(self.path, "." + os.path.basename(part))
+            write_results(chunk, tmp, self.metadata)
+            os.replace(tmp, part)
+        self.parts += 1
+        self.rows += len(chunk)
+        logger.info(f"Wrote chunk {self.parts} ({len(chunk)} rows, {self.rows} total) to {self.path}")
+
+
+class RunningSummary:
+    """Top-K rows by a key column plus running summary statistics"""
+
+    def __init__(self, top_k: int = 15, key: str = 'profitability',
+                 top_columns: Optional[List[str]] = None):
+        self.top_k = top_k
+        self.key = key
+        self.top_columns = top_columns or ['item_id', 'item_name', 'buy_price', 'sell_price',
+                                           'daily_volume', 'profitability']
+        self._heap: List[tuple] = []
+        self._seq = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = float('-inf')
+        self.positive = 0
+        self.liquid = 0
+        self.digest = TDigest()
+
+    def update(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        values = df[self.key].fillna(0.0)
+        self.count += len(df)
+        self.total += float(values.sum())
+        self.maximum = max(self.maximum, float(values.max()))
+        self.positive += int((values > 0).sum())
+        if 'daily_volume' in df.columns:
+            self.liquid += int((df['daily_volume'] > 5).sum())
+        for value in values:
+            self.digest.add(float(value))
+
+        # Only rows that can enter the top-K are materialized
+        cols = [c for c in self.top_columns if c in df.columns]
+        for row in df.loc[values.nlargest(self.top_k).index, cols].to_dict('records'):
+            self._seq += 1
+            entry = (float(row[self.key] if pd.notna(row.get(self.key)) else 0.0), self._seq, row)
+            if len(self._heap) < self.top_k:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def top(self) -> pd.DataFrame:
+        rows = [row for _, _, row in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
+        return pd.DataFrame(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'items': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'median': self.digest.quantile(0.5) if self.count else 0.0,
+            'max': self.maximum if self.count else 0.0,
+            'positive': self.positive,
+            'liquid': self.liquid,
+        }
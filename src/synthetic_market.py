@@ -0,0 +1,666 @@
+"""
+Deterministic synthetic market for load and scale tests.
+
+SyntheticMarket produces Universalis- and XIVAPI-shaped payloads from a seed:
+
+- items with power-law popularity (daily sale rates), log-normal base prices,
+  per-item volatility, drift and an HQ share for HQ-able items,
+- sale histories as a Poisson process over the last history_days, with
+  power-law stack sizes, occasional outlier sales (mistypes, troll buys) and
+  the HQ/NQ mix, spread over the worlds of the queried datacenter,
+- current listings, aggregated summaries, most-recently-updated lists,
+- recipes in a DAG (materials -> intermediates -> products) where popular
+  materials and intermediates are shared by many recipes,
+- the world / datacenter / tax-rate layout.
+
+Every payload is derived from (seed, item_id, datacenter) alone, so any
+subset of 100k items can be generated in any order with bounded memory and
+the same answer every time. write_dataset() dumps API-shaped batch files;
+serve_market() runs a local stand-in API that the clients use when
+UNIVERSALIS_BASE_URL / XIVAPI_BASE_URL / TEAMCRAFT_ITEMS_URL point at it,
+including a WebSocket event feed on /api/ws (UNIVERSALIS_WS_URL).
+"""
+import json
+import os
+import re
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from src.compression import write_json
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+FIRST_ITEM_ID = 1000
+
+# region -> datacenter -> [(world_id, world_name)]
+DEFAULT_LAYOUT: Dict[str, Dict[str, List[Tuple[int, str]]]] = {
+    'Europe': {
+        'Chaos': [(80, 'Cerberus'), (83, 'Louisoix'), (71, 'Moogle'), (39, 'Omega'),
+                  (401, 'Phantom'), (97, 'Ragnarok'), (400, 'Sagittarius'), (85, 'Spriggan')],
+        'Light': [(402, 'Alpha'), (36, 'Lich'), (66, 'Odin'), (56, 'Phoenix'),
+                  (403, 'Raiden'), (67, 'Shiva'), (33, 'Twintania'), (42, 'Zodiark')],
+    },
+    'North-America': {
+        'Aether': [(73, 'Adamantoise'), (79, 'Cactuar'), (54, 'Faerie'), (63, 'Gilgamesh'),
+                   (40, 'Jenova'), (65, 'Midgardsormr'), (99, 'Sargatanas'), (57, 'Siren')],
+        'Primal': [(78, 'Behemoth'), (93, 'Excalibur'), (53, 'Exodus'), (35, 'Famfrit'),
+                   (95, 'Hyperion'), (55, 'Lamia'), (64, 'Leviathan'), (77, 'Ultros')],
+    },
+}
+
+TAX_CITIES = ['Limsa Lominsa', 'Gridania', "Ul'dah", 'Ishgard', 'Kugane', 'Crystarium',
+              'Old Sharlayan', 'Tuliyollal']
+
+_ADJECTIVES = ['Aged', 'Ancient', 'Blessed', 'Bright', 'Crimson', 'Dark', 'Deep', 'Dusk', 'Frozen',
+               'Gilded', 'Grade 3', 'Grade 8', 'High', 'Hallowed', 'Iron', 'Mythril', 'Noble',
+               'Ocean', 'Royal', 'Rustic', 'Silver', 'Storm', 'Sun', 'Titanium', 'Wind']
+_NOUNS = ['Ingot', 'Lumber', 'Cloth', 'Leather', 'Dye', 'Tincture', 'Ring', 'Earrings', 'Halberd',
+          'Grimoire', 'Boots', 'Gloves', 'Tea', 'Stew', 'Materia', 'Glaze', 'Whetstone', 'Rivets',
+          'Thread', 'Sand', 'Ore', 'Log', 'Crystal', 'Cluster', 'Resin']
+
+
+class SyntheticMarket:
+    """Seeded generator of market, history, listing, recipe and layout payloads"""
+
+    def __init__(self, n_items: int = 10000, seed: int = 0, history_days: int = 14,
+                 mean_daily_sales: float = 8.0, outlier_rate: float = 0.01,
+                 craftable_share: float = 0.35, material_share: float = 0.4,
+                 layout: Optional[Dict[str, Dict[str, List[Tuple[int, str]]]]] = None,
+                 now: Optional[float] = None):
+        self.n_items = n_items
+        self.seed = seed
+        self.history_days = history_days
+        self.outlier_rate = outlier_rate
+        self.layout = layout or DEFAULT_LAYOUT
+        self.now = int(now if now is not None else time.time())
+        self.item_ids = np.arange(FIRST_ITEM_ID, FIRST_ITEM_ID + n_items, dtype=np.int64)
+        self.dc_worlds = {dc: worlds for region in self.layout.values() for dc, worlds in region.items()}
+        self.dc_index = {dc: i for i, dc in enumerate(self.dc_worlds)}
+        self.world_dc = {world_id: dc for dc, worlds in self.dc_worlds.items() for world_id, _ in worlds}
+
+        rng = np.random.default_rng([seed, 0])
+        # Power law: a few items sell hundreds per day, most a handful
+        popularity = 1 + rng.pareto(1.5, n_items)
+        self.daily_rate = np.minimum(popularity * mean_daily_sales / 3.0, 2000.0)
+        self.volatility = rng.uniform(0.05, 0.4, n_items)
+        self.drift = rng.normal(0.0, 0.01, n_items)              # log-price change per day
+        self.stackable = rng.random(n_items) < 0.6
+        self.hq_premium = rng.uniform(1.15, 2.0, n_items)
+        # Recently active items were uploaded recently
+        self.upload_age = rng.exponential(6 * 3600 / np.sqrt(popularity))
+
+        # Materials first (ingredients only), then craftables in id order so a
+        # recipe can only use materials and lower-id craftables (a DAG)
+        kind = rng.random(n_items)
+        self.is_material = kind < material_share
+        self.is_craftable = (kind >= material_share) & (kind < material_share + craftable_share)
+        self.hq_share = np.where(self.is_craftable | (rng.random(n_items) < 0.3),
+                                 rng.uniform(0.2, 0.8, n_items), 0.0)
+        self.base_price = np.clip(rng.lognormal(6.5, 1.4, n_items), 5, 5e7)
+        self.rate_cdf = np.cumsum(self.daily_rate) / self.daily_rate.sum()
+        self.recipes = self._build_recipes(rng)
+        self.recipe_ids = {item_id: 30000 + i for i, item_id in enumerate(sorted(self.recipes))}
+        self.recipe_items = {recipe_id: item_id for item_id, recipe_id in self.recipe_ids.items()}
+
+    # Items and recipes
+
+    def _build_recipes(self, rng: np.random.Generator) -> Dict[int, List[Tuple[int, int]]]:
+        materials = np.flatnonzero(self.is_material)
+        if len(materials) == 0:
+            return {}
+        # Zipf-like preference: low-ranked materials are shared by many recipes
+        material_cdf = np.cumsum(1.0 / np.arange(1, len(materials) + 1) ** 0.8)
+        material_cdf /= material_cdf[-1]
+        recipes: Dict[int, List[Tuple[int, int]]] = {}
+        crafted: List[int] = []
+        for idx in np.flatnonzero(self.is_craftable):
+            n_ingredients = int(rng.integers(1, 7))
+            picks = list(materials[np.minimum(np.searchsorted(material_cdf, rng.random(n_ingredients)),
+                                              len(materials) - 1)])
+            if crafted and rng.random() < 0.3:
+                # Sub-component: a popular intermediate crafted earlier
+                picks[-1] = crafted[min(int(rng.pareto(1.0)), len(crafted) - 1)]
+            ingredients = {}
+            for ing in picks:
+                ingredients[int(ing)] = ingredients.get(int(ing), 0) + int(rng.integers(1, 4))
+            cost = sum(self.base_price[i] * amount for i, amount in ingredients.items())
+            # Crafting is usually, but not always, profitable
+            self.base_price[idx] = max(cost * rng.lognormal(0.15, 0.3), 5)
+            recipes[int(self.item_ids[idx])] = [(int(self.item_ids[i]), a) for i, a in ingredients.items()]
+            crafted.append(int(idx))
+        return recipes
+
+    def _index(self, item_id: int) -> Optional[int]:
+        idx = int(item_id) - FIRST_ITEM_ID
+        return idx if 0 <= idx < self.n_items else None
+
+    def item_name(self, item_id: int) -> str:
+        rng = np.random.default_rng([self.seed, 1, int(item_id)])
+        return f"{_ADJECTIVES[rng.integers(len(_ADJECTIVES))]} {_NOUNS[rng.integers(len(_NOUNS))]} {item_id}"
+
+    def _streams(self, item_id: int, datacenter: str, purpose: int, n: int) -> List[np.random.Generator]:
+        """Independent generators per attribute, so prefixes agree for any entry limit"""
+        seq = np.random.SeedSequence([self.seed, int(item_id), self.dc_index.get(datacenter, 99), purpose])
+        return [np.random.default_rng(s) for s in seq.spawn(n)]
+
+    def _dc_factor(self, idx: int, datacenter: str) -> float:
+        rng = np.random.default_rng([self.seed, 2, int(self.item_ids[idx]), self.dc_index.get(datacenter, 99)])
+        return float(rng.lognormal(0.0, 0.12))
+
+    def _price_at(self, idx: int, datacenter: str, ages: np.ndarray) -> np.ndarray:
+        """Mean NQ price at the given ages (seconds before now)"""
+        days_ago = ages / SECONDS_PER_DAY
+        return self.base_price[idx] * self._dc_factor(idx, datacenter) * np.exp(-self.drift[idx] * days_ago)
+
+    def _worlds(self, datacenter: str) -> List[Tuple[int, str]]:
+        if datacenter not in self.dc_worlds:
+            raise KeyError(f"Unknown datacenter: {datacenter}")
+        return self.dc_worlds[datacenter]
+
+    # Universalis payloads
+
+    def sales(self, item_id: int, datacenter: str, limit: int = 1800,
+              within: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Newest-first sales columns: timestamp, price, quantity, hq, world"""
+        idx = self._index(item_id)
+        if idx is None:
+            return {}
+        window = float(self.history_days * SECONDS_PER_DAY if within is None
+                       else min(within, self.history_days * SECONDS_PER_DAY))
+        gaps, prices, quantities, quality, outliers, worlds = self._streams(item_id, datacenter, 3, 6)
+        # Poisson process backwards from now; only the newest `limit` sales are drawn
+        ages = np.cumsum(gaps.exponential(SECONDS_PER_DAY / self.daily_rate[idx], size=limit))
+        n = int(np.searchsorted(ages, window))
+        ages = ages[:n]
+
+        hq = quality.random(n) < self.hq_share[idx]
+        price = self._price_at(idx, datacenter, ages) * np.exp(prices.normal(0.0, self.volatility[idx], n))
+        price = np.where(hq, price * self.hq_premium[idx], price)
+        outlier = outliers.random(n) < self.outlier_rate
+        price = np.where(outlier, price * outliers.choice([0.05, 10.0, 50.0], size=n), price)
+        if self.stackable[idx]:
+            quantity = np.minimum(quantities.zipf(2.0, n), 99)
+        else:
+            quantity = np.ones(n, dtype=np.int64)
+        world_pool = self._worlds(datacenter)
+        world_weights = np.random.default_rng([self.seed, 4, int(item_id)]).dirichlet(np.ones(len(world_pool)))
+        return {
+            'timestamp': (self.now - ages).astype(np.int64),
+            'price': np.maximum(np.round(price), 1).astype(np.int64),
+            'quantity': quantity.astype(np.int64),
+            'hq': hq,
+            'world': worlds.choice(len(world_pool), size=n, p=world_weights),
+        }
+
+    def history_item(self, item_id: int, datacenter: str, entries: int = 1800,
+                     within: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """One item of a /history response (None for unknown IDs)"""
+        idx = self._index(item_id)
+        if idx is None:
+            return None
+        s = self.sales(item_id, datacenter, limit=entries, within=within)
+        world_pool = self._worlds(datacenter)
+        entry_list = [
+            {'hq': bool(hq), 'pricePerUnit': price, 'quantity': qty, 'buyerName': 'Synthetic Buyer',
+             'onMannequin': False, 'timestamp': ts, 'worldName': world_pool[w][1], 'worldID': world_pool[w][0]}
+            for ts, price, qty, hq, w in zip(s['timestamp'].tolist(), s['price'].tolist(),
+                                             s['quantity'].tolist(), s['hq'].tolist(), s['world'].tolist())
+        ]
+        rate = float(self.daily_rate[idx])
+        return {
+            'itemID': int(item_id),
+            'dcName': datacenter,
+            'lastUploadTime': int((self.now - self.upload_age[idx]) * 1000),
+            'entries': entry_list,
+            'regularSaleVelocity': rate,
+            'nqSaleVelocity': rate * (1 - self.hq_share[idx]),
+            'hqSaleVelocity': rate * self.hq_share[idx],
+        }
+
+    def listings_item(self, item_id: int, datacenter: str, listings: int = 100,
+                      hq: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        """One item of a current-data response (listings only, cheapest first)"""
+        idx = self._index(item_id)
+        if idx is None:
+            return None
+        counts, prices, quantities, quality, worlds = self._streams(item_id, datacenter, 5, 5)
+        n = int(min(counts.poisson(3 + 4 * np.sqrt(self.daily_rate[idx])), 500))
+        is_hq = quality.random(n) < self.hq_share[idx]
+        # Listings sit above the going rate, with a long tail of overpriced ones
+        price = self._price_at(idx, datacenter, np.zeros(n)) * (1 + prices.exponential(0.15, n))
+        price = np.maximum(np.round(np.where(is_hq, price * self.hq_premium[idx], price)), 1).astype(np.int64)
+        quantity = (np.minimum(quantities.zipf(1.8, n), 99) if self.stackable[idx]
+                    else np.ones(n, dtype=np.int64))
+        world_pool = self._worlds(datacenter)
+        world = worlds.integers(len(world_pool), size=n)
+        order = np.argsort(price, kind='stable')
+        rows = []
+        for i in order.tolist():
+            if hq is not None and bool(is_hq[i]) != hq:
+                continue
+            total = int(price[i] * quantity[i])
+            rows.append({'lastReviewTime': int(self.now - self.upload_age[idx]), 'pricePerUnit': int(price[i]),
+                         'quantity': int(quantity[i]), 'worldName': world_pool[world[i]][1],
+                         'worldID': world_pool[world[i]][0], 'hq': bool(is_hq[i]),
+                         'total': total, 'tax': int(round(total * 0.05))})
+            if len(rows) >= listings:
+                break
+        return {
+            'itemID': int(item_id),
+            'dcName': datacenter,
+            'lastUploadTime': int((self.now - self.upload_age[idx]) * 1000),
+            'listings': rows,
+            'listingsCount': len(rows),
+            'unitsForSale': sum(r['quantity'] for r in rows),
+            'minPrice': rows[0]['pricePerUnit'] if rows else 0,
+            'recentHistory': [],
+        }
+
+    def aggregated_item(self, item_id: int, datacenter: str) -> Optional[Dict[str, Any]]:
+        """One entry of an /aggregated response, consistent with listings and history"""
+        idx = self._index(item_id)
+        if idx is None:
+            return None
+        current = self.listings_item(item_id, datacenter, listings=500)['listings']
+        sales = self.sales(item_id, datacenter, limit=1800, within=4 * SECONDS_PER_DAY)
+        world_pool = dict(self._worlds(datacenter))
+
+        def summary(hq: bool) -> Dict[str, Any]:
+            mine = [l for l in current if l['hq'] == hq]
+            mask = sales['hq'] == hq
+            out: Dict[str, Any] = {}
+            if mine:
+                cheapest = mine[0]
+                out['minListing'] = {'dc': {'price': cheapest['pricePerUnit'], 'worldId': cheapest['worldID']},
+                                     'region': {'price': cheapest['pricePerUnit'], 'worldId': cheapest['worldID']}}
+            if mask.any():
+                prices, quantities = sales['price'][mask], sales['quantity'][mask]
+                out['recentPurchase'] = {'dc': {'price': int(prices[0]), 'timestamp': int(sales['timestamp'][mask][0]) * 1000,
+                                                'worldId': list(world_pool)[int(sales['world'][mask][0])]}}
+                out['averageSalePrice'] = {'dc': {'price': float(prices.mean())}}
+                out['dailySaleVelocity'] = {'dc': {'quantity': float(quantities.sum()) / 4}}
+            return out
+
+        return {'itemId': int(item_id), 'nq': summary(False), 'hq': summary(True),
+                'worldUploadTimes': [{'worldId': w, 'timestamp': int((self.now - self.upload_age[idx]) * 1000)}
+                                     for w in list(world_pool)[:3]]}
+
+    def _multi(self, builder, item_ids: List[int], *args, **kwargs) -> Dict[str, Any]:
+        items, unresolved = {}, []
+        for item_id in item_ids:
+            payload = builder(item_id, *args, **kwargs)
+            if payload is None:
+                unresolved.append(int(item_id))
+            else:
+                items[str(item_id)] = payload
+        if len(item_ids) == 1 and items:
+            # Single-ID requests return the item object itself, as Universalis does
+            return next(iter(items.values()))
+        return {'itemIDs': [int(i) for i in item_ids], 'items': items, 'unresolvedItems': unresolved}
+
+    def history(self, item_ids: List[int], datacenter: str, entries: int = 1800,
+                within: Optional[float] = None) -> Dict[str, Any]:
+        return self._multi(self.history_item, item_ids, datacenter, entries=entries, within=within)
+
+    def listings(self, item_ids: List[int], datacenter: str, listings: int = 100,
+                 hq: Optional[bool] = None) -> Dict[str, Any]:
+        return self._multi(self.listings_item, item_ids, datacenter, listings=listings, hq=hq)
+
+    def aggregated(self, item_ids: List[int], datacenter: str) -> Dict[str, Any]:
+        results = [self.aggregated_item(i, datacenter) for i in item_ids]
+        return {'results': [r for r in results if r is not None],
+                'failedItems': [int(i) for i, r in zip(item_ids, results) if r is None]}
+
+    def most_recently_updated(self, datacenter: str, entries: int = 200) -> Dict[str, Any]:
+        order = np.argsort(self.upload_age, kind='stable')[:max(entries, 0)]
+        world_pool = self._worlds(datacenter)
+        return {'items': [{'itemID': int(self.item_ids[i]),
+                           'lastUploadTime': int((self.now - self.upload_age[i]) * 1000),
+                           'worldID': world_pool[i % len(world_pool)][0],
+                           'worldName': world_pool[i % len(world_pool)][1]} for i in order.tolist()]}
+
+    def marketable(self) -> List[int]:
+        return self.item_ids.tolist()
+
+    def worlds(self) -> List[Dict[str, Any]]:
+        return [{'id': world_id, 'name': name} for worlds in self.dc_worlds.values() for world_id, name in worlds]
+
+    def data_centers(self) -> List[Dict[str, Any]]:
+        return [{'name': dc, 'region': region, 'worlds': [w for w, _ in worlds]}
+                for region, dcs in self.layout.items() for dc, worlds in dcs.items()]
+
+    def tax_rates(self, world: str) -> Dict[str, int]:
+        rng = np.random.default_rng([self.seed, 6, sum(map(ord, world))])
+        return {city: int(rng.choice([0, 3, 5], p=[0.1, 0.3, 0.6])) for city in TAX_CITIES}
+
+    # WebSocket feed events
+
+    def live_event(self, rng: np.random.Generator, world_ids: List[int],
+                   now: Optional[float] = None) -> Dict[str, Any]:
+        """One sales/add or listings/add event at `now`, on a popularity-weighted item"""
+        now = time.time() if now is None else now
+        idx = min(int(np.searchsorted(self.rate_cdf, rng.random())), self.n_items - 1)
+        world_id = int(world_ids[rng.integers(len(world_ids))])
+        world_name = dict(self._worlds(self.world_dc[world_id]))[world_id]
+        hq = bool(rng.random() < self.hq_share[idx])
+        price = float(self._price_at(idx, self.world_dc[world_id], np.zeros(1))[0])
+        price *= self.hq_premium[idx] if hq else 1.0
+        quantity = int(min(rng.zipf(2.0), 99)) if self.stackable[idx] else 1
+        event: Dict[str, Any] = {'item': int(self.item_ids[idx]), 'world': world_id}
+        if rng.random() < 0.5:
+            price = max(round(price * np.exp(rng.normal(0.0, self.volatility[idx]))), 1)
+            event.update(event='sales/add', sales=[{
+                'hq': hq, 'pricePerUnit': price, 'quantity': quantity, 'total': price * quantity,
+                'timestamp': int(now), 'onMannequin': False, 'worldID': world_id, 'worldName': world_name,
+                'buyerName': f"Buyer {int(rng.integers(1_000_000))}"}])
+        else:
+            price = max(round(price * (1 + rng.exponential(0.15))), 1)
+            event.update(event='listings/add', listings=[{
+                'listingID': rng.bytes(12).hex(), 'hq': hq, 'pricePerUnit': price, 'quantity': quantity,
+                'total': price * quantity, 'lastReviewTime': int(now), 'worldID': world_id,
+                'worldName': world_name, 'retainerName': f"Retainer {int(rng.integers(10_000))}"}])
+        return event
+
+    # XIVAPI / teamcraft payloads
+
+    def recipe_search(self, item_ids: List[int], columns: Optional[List[str]] = None,
+                      page: int = 1, limit: int = 100) -> Dict[str, Any]:
+        """XIVAPI search over recipes by result item, with column selection and paging"""
+        matches = [self.recipe_ids[int(i)] for i in item_ids if int(i) in self.recipe_ids]
+        total_pages = max((len(matches) + limit - 1) // limit, 1)
+        results = []
+        for recipe_id in matches[(page - 1) * limit:page * limit]:
+            if columns:
+                recipe = self.recipe(recipe_id)
+                results.append({col: recipe[col] for col in columns if col in recipe})
+            else:
+                results.append({'ID': recipe_id, 'Name': self.item_name(self.recipe_items[recipe_id])})
+        return {'Pagination': {'Page': page, 'PageTotal': total_pages, 'Results': len(results),
+                               'ResultsTotal': len(matches),
+                               'PageNext': page + 1 if page < total_pages else None},
+                'Results': results}
+
+    def recipe(self, recipe_id: int) -> Optional[Dict[str, Any]]:
+        item_id = self.recipe_items.get(int(recipe_id))
+        if item_id is None:
+            return None
+        payload: Dict[str, Any] = {'ID': int(recipe_id), 'ItemResult': {'ID': item_id},
+                                   'ItemResultTargetID': item_id, 'AmountResult': 1,
+                                   'CanHq': int(self.hq_share[self._index(item_id)] > 0)}
+        for i in range(10):
+            ingredient = self.recipes[item_id][i] if i < len(self.recipes[item_id]) else (0, 0)
+            payload[f'ItemIngredient{i}TargetID'] = ingredient[0]
+            payload[f'AmountIngredient{i}'] = ingredient[1]
+        return payload
+
+    def item_names(self) -> Dict[str, Dict[str, str]]:
+        return {str(i): {'en': self.item_name(i)} for i in self.item_ids.tolist()}
+
+
+def write_dataset(market: SyntheticMarket, out_dir: str, datacenter: str = 'Chaos',
+                  entries: int = 100, batch_size: int = 100) -> Dict[str, Any]:
+    """
+    Dump API-shaped responses for every item: history/aggregated/listings
+    batch files plus the layout, recipes and item names (compressed JSON stores).
+    """
+    stats = {'items': market.n_items, 'sales': 0, 'listings': 0, 'batches': 0, 'bytes': 0}
+    ids = market.marketable()
+    for batch_no, start in enumerate(range(0, len(ids), batch_size)):
+        batch = ids[start:start + batch_size]
+        history = market.history(batch, datacenter, entries=entries)
+        listings = market.listings(batch, datacenter)
+        for name, payload in (('history', history), ('listings', listings),
+                              ('aggregated', market.aggregated(batch, datacenter))):
+            stats['bytes'] += write_json(os.path.join(out_dir, name, f"{batch_no:05d}.json"), payload)
+        items = history['items'].values() if 'items' in history else [history]
+        stats['sales'] += sum(len(item['entries']) for item in items)
+        items = listings['items'].values() if 'items' in listings else [listings]
+        stats['listings'] += sum(len(item['listings']) for item in items)
+        stats['batches'] += 1
+
+    static = {
+        'worlds.json': market.worlds(),
+        'data-centers.json': market.data_centers(),
+        'tax-rates.json': {w['name']: market.tax_rates(w['name']) for w in market.worlds()},
+        'marketable.json': ids,
+        'recipes.json': {str(i): market.recipe(r) for i, r in market.recipe_ids.items()},
+        'items.json': market.item_names(),
+    }
+    for name, payload in static.items():
+        stats['bytes'] += write_json(os.path.join(out_dir, name), payload)
+    logger.info(f"Wrote {stats['batches']} batches ({stats['sales']:,} sales, {stats['listings']:,} listings) "
+                f"to {out_dir}: {stats['bytes'] / 1024 / 1024:,.1f} MiB")
+    return stats
+
+
+# Local stand-in API
+
+def _ids(raw: str) -> List[int]:
+    return [int(i) for i in raw.split(',') if i.strip().isdigit()]
+
+
+def project(payload: Any, paths: List[str]) -> Any:
+    """
+    Keep only the dotted paths of a JSON payload. Lists and item-ID maps
+    (such as a multi-item response's 'items') are projected per element.
+    """
+    if isinstance(payload, list):
+        return [project(element, paths) for element in payload]
+    if not isinstance(payload, dict):
+        return payload
+    if payload and all(key.isdigit() for key in payload):
+        return {key: project(value, paths) for key, value in payload.items()}
+    nested: Dict[str, List[str]] = {}
+    whole = set()
+    for path in paths:
+        head, _, rest = path.partition('.')
+        nested.setdefault(head, [])
+        if rest:
+            nested[head].append(rest)
+        else:
+            whole.add(head)
+    # A bare key keeps the whole value
+    return {key: payload[key] if key in whole else project(payload[key], rest)
+            for key, rest in nested.items() if key in payload}
+
+
+def route(market: SyntheticMarket, path: str, query: Dict[str, List[str]]) -> Tuple[int, Any]:
+    """Resolve one stand-in API request to (status, JSON payload)"""
+    def arg(name: str, default=None, cast=str):
+        return cast(query[name][0]) if name in query else default
+
+    parts = [p for p in path.split('/') if p]
+    if parts[:2] == ['api', 'v2']:
+        rest = parts[2:]
+        if rest == ['worlds']:
+            return 200, market.worlds()
+        if rest == ['data-centers']:
+            return 200, market.data_centers()
+        if rest == ['marketable']:
+            return 200, market.marketable()
+        if rest == ['tax-rates']:
+            return 200, market.tax_rates(arg('world', ''))
+        if rest == ['extra', 'stats', 'most-recently-updated']:
+            return 200, market.most_recently_updated(arg('dcName', 'Chaos'), arg('entries', 200, int))
+        try:
+            if len(rest) == 3 and rest[0] in ('history', 'aggregated'):
+                ids = _ids(rest[2])
+                if len(ids) > 100:
+                    return 400, {'error': 'Maximum 100 items per request'}
+                if rest[0] == 'history':
+                    payload = market.history(ids, rest[1], entries=arg('entriesToReturn', 1800, int),
+                                             within=arg('entriesWithin', None, float))
+                    fields = arg('fields')
+                    return 200, project(payload, fields.split(',')) if fields else payload
+                return 200, market.aggregated(ids, rest[1])
+            if len(rest) == 2:
+                hq = arg('hq')
+                return 200, market.listings(_ids(rest[1]), rest[0], listings=arg('listings', 100, int),
+                                            hq=None if hq is None else hq == 'true')
+        except KeyError as e:
+            return 404, {'error': str(e)}
+    if parts[:1] == ['xivapi']:
+        if parts[1:] == ['search']:
+            # ItemResult.ID=123 or the multi-value form ItemResult.ID|=1,2,3
+            match = re.search(r'ItemResult\.ID\|?=([\d,]+)', arg('filters', ''))
+            columns = arg('columns')
+            return 200, market.recipe_search(_ids(match.group(1)) if match else [],
+                                             columns=columns.split(',') if columns else None,
+                                             page=arg('page', 1, int), limit=min(arg('limit', 100, int), 3000))
+        if len(parts) == 3 and parts[1] == 'recipe' and parts[2].isdigit():
+            recipe = market.recipe(int(parts[2]))
+            return (200, recipe) if recipe else (404, {'Error': True, 'Message': 'Recipe not found'})
+    if parts == ['teamcraft', 'items.json']:
+        return 200, market.item_names()
+    return 404, {'error': f"Unknown endpoint {path}"}
+
+
+def _serve_feed(handler, market: SyntheticMarket, rng: np.random.Generator, rate: float, drop_after: int):
+    """
+    WebSocket feed on an upgraded stand-in connection: BSON subscribe /
+    unsubscribe messages in, `rate` events per second out for the subscribed
+    channels. drop_after > 0 closes the connection after that many events,
+    to exercise reconnects and gap fills.
+    """
+    from src.ws_protocol import (accept_key, encode_frame, read_message, bson_decode, bson_encode,
+                                 WebSocketClosed, OP_BINARY, OP_CLOSE)
+
+    handler.send_response(101, 'Switching Protocols')
+    handler.send_header('Upgrade', 'websocket')
+    handler.send_header('Connection', 'Upgrade')
+    handler.send_header('Sec-WebSocket-Accept', accept_key(handler.headers.get('Sec-WebSocket-Key', '')))
+    handler.end_headers()
+    handler.wfile.flush()
+    handler.close_connection = True
+
+    subscriptions = set()   # (channel, world_id)
+    lock = threading.Lock()
+    closed = threading.Event()
+
+    def send(opcode: int, payload: bytes):
+        with lock:
+            handler.wfile.write(encode_frame(opcode, payload, mask=False))
+            handler.wfile.flush()
+
+    def read_subscriptions():
+        try:
+            while not closed.is_set():
+                _, payload = read_message(handler.rfile, send)
+                message = bson_decode(payload)
+                match = re.fullmatch(r'([a-z/]+)\{world=(\d+)\}', str(message.get('channel', '')))
+                if not match or int(match.group(2)) not in market.world_dc:
+                    continue
+                key = (match.group(1), int(match.group(2)))
+                with lock:
+                    if message.get('event') == 'subscribe':
+                        subscriptions.add(key)
+                    elif message.get('event') == 'unsubscribe':
+                        subscriptions.discard(key)
+        except (WebSocketClosed, OSError, ValueError):
+            pass
+        finally:
+            closed.set()
+
+    threading.Thread(target=read_subscriptions, daemon=True).start()
+    listed: List[Dict[str, Any]] = []   # listings/add events that can later be removed
+    sent, next_at = 0, time.monotonic()
+    try:
+        while not closed.is_set() and (not drop_after or sent < drop_after):
+            with lock:
+                worlds = sorted({world for _, world in subscriptions})
+            if not worlds:
+                closed.wait(0.01)
+                continue
+            if listed and rng.random() < 0.1:
+                event = dict(listed.pop(int(rng.integers(len(listed)))), event='listings/remove')
+            else:
+                event = market.live_event(rng, worlds)
+                if event['event'] == 'listings/add':
+                    listed.append(event)
+                    del listed[:-500]
+            if (event['event'], event['world']) in subscriptions:
+                send(OP_BINARY, bson_encode(event))
+                sent += 1
+            next_at += 1.0 / rate
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                closed.wait(delay)
+        if drop_after and sent >= drop_after:
+            send(OP_CLOSE, (1001).to_bytes(2, 'big'))
+    except OSError:
+        pass
+    finally:
+        closed.set()
+
+
+def make_handler(market: SyntheticMarket, error_rate: float = 0.0, latency: float = 0.0,
+                 feed_rate: float = 200.0, feed_drop_after: int = 0):
+    """
+    HTTP request handler class serving the stand-in API. error_rate injects
+    HTTP 503s and latency adds a fixed delay per request, to exercise retries and pacing.
+    WebSocket upgrades on /api/ws get the event feed (feed_rate events/s).
+    """
+    from http.server import BaseHTTPRequestHandler
+    import gzip
+    import itertools
+
+    faults = np.random.default_rng([market.seed, 7])
+    faults_lock = threading.Lock()
+    connections = itertools.count()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Keep-alive plus small writes otherwise stalls on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/api/ws' and self.headers.get('Upgrade', '').lower() == 'websocket':
+                rng = np.random.default_rng([market.seed, 8, next(connections)])
+                _serve_feed(self, market, rng, feed_rate, feed_drop_after)
+                return
+            if latency:
+                time.sleep(latency)
+            with faults_lock:
+                fail = error_rate and faults.random() < error_rate
+            status, payload = (503, {'error': 'injected failure'}) if fail else route(market, url.path, parse_qs(url.query))
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *log_args):
+            logger.debug(format % log_args)
+
+    return Handler
+
+
+def serve_market(market: SyntheticMarket, host: str = '127.0.0.1', port: int = 8700,
+                 error_rate: float = 0.0, latency: float = 0.0, feed_rate: float = 200.0,
+                 feed_drop_after: int = 0):
+    """Run the stand-in API until interrupted"""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), make_handler(market, error_rate, latency,
+                                                            feed_rate, feed_drop_after))
+    server.daemon_threads = True
+    base = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Synthetic market ({market.n_items} items, seed {market.seed}) on {base}")
+    print(f"export UNIVERSALIS_BASE_URL={base}/api/v2 XIVAPI_BASE_URL={base}/xivapi "
+          f"TEAMCRAFT_ITEMS_URL={base}/teamcraft/items.json UNIVERSALIS_RATE_LIMIT_DELAY=0 "
+          f"UNIVERSALIS_WS_URL=ws://{host}:{server.server_address[1]}/api/ws")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
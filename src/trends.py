@@ -0,0 +1,304 @@
+"""
+Incrementally maintained rolling trend metrics (7-day moving averages).
+
+Sales are rolled up into one bar per item per UTC day (VWAP, volume, median,
+low/high). A rolling window over the last N calendar days is kept with
+running sums, so each new day only adds one bar and evicts the oldest one
+instead of recomputing the window from scratch.
+
+Universalis only learns about a sale when someone uploads the market board,
+so sales of a day keep arriving after it ends. A day is therefore only
+closed by the clock once LATE_SALE_GRACE has passed after it (or earlier,
+by a sale from a later day); until then late uploads still land in its bar.
+"""
+import math
+import statistics
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional
+import pandas as pd
+from src.compression import read_json, write_json, store_exists
+from src.watermarks import SaleWatermarks
+
+logger = logging.getLogger(__name__)
+
+TREND_FILE = "data/trend_state.json"
+SECONDS_PER_DAY = 86400
+LATE_SALE_GRACE = SECONDS_PER_DAY  # how long a day stays open for late uploads
+
+TREND_COLUMNS = ['vwap_7d', 'volume_7d', 'median_7d', 'volatility_7d', 'vwap_change_7d', 'trend_days']
+
+
+class ItemTrend:
+    """
+    Rolling daily aggregates for one item.
+
+    Closed days live in `bars` (kept up to max_days for the time series);
+    the trailing `window` calendar days also feed running sums of volume,
+    notional and daily log-returns of VWAP. The current day stays open
+    until a sale from a later day arrives, or `grace` seconds after it ends.
+    """
+
+    def __init__(self, window: int = 7, max_days: int = 90, grace: float = LATE_SALE_GRACE):
+        self.window = window
+        self.grace = grace
+        self.bars: deque = deque(maxlen=max_days)
+        # Which sales were already ingested, per (world, quality)
+        self.watermarks = SaleWatermarks()
+        # Current (open) day
+        self.open_day: Optional[int] = None
+        self.open_prices: List[float] = []
+        self.open_volume = 0
+        self.open_notional = 0.0
+        # Rolling window state over closed bars
+        self.window_bars: deque = deque()
+        self.window_returns: deque = deque()
+        self.sum_volume = 0
+        self.sum_notional = 0.0
+        self.sum_ret = 0.0
+        self.sum_ret_sq = 0.0
+        self.prev_vwap: Optional[float] = None
+
+    def add_sale(self, price: float, quantity: int, timestamp: float):
+        """Add one sale (must arrive in timestamp order)"""
+        if price <= 0 or quantity <= 0:
+            return
+        day = int(timestamp // SECONDS_PER_DAY)
+        if self.open_day is not None and day < self.open_day:
+            return  # late sale for an already closed day
+        if self.open_day is None:
+            self.open_day = day
+        elif day > self.open_day:
+            self._close_open_day()
+            self.open_day = day
+        self._evict(day)
+        self.open_prices.append(price)
+        self.open_volume += quantity
+        self.open_notional += price * quantity
+
+    def advance_to(self, timestamp: float):
+        """
+        Close the open day and evict stale bars once the clock is more than
+        the grace period past its end; the new open day is the latest one
+        still accepting late sales.
+        """
+        day = int((timestamp - self.grace) // SECONDS_PER_DAY)
+        if self.open_day is None or day <= self.open_day:
+            return
+        self._close_open_day()
+        self.open_day = day
+        self._evict(day)
+
+    def _open_bar(self) -> Optional[Dict[str, Any]]:
+        if self.open_day is None or not self.open_volume:
+            return None
+        return {
+            'day': self.open_day,
+            'vwap': self.open_notional / self.open_volume,
+            'volume': self.open_volume,
+            'notional': self.open_notional,
+            'median': statistics.median(self.open_prices),
+            'low': min(self.open_prices),
+            'high': max(self.open_prices),
+            'sales': len(self.open_prices),
+        }
+
+    def _close_open_day(self):
+        bar = self._open_bar()
+        self.open_prices, self.open_volume, self.open_notional = [], 0, 0.0
+        if bar is None:
+            return
+
+        self.window_bars.append(bar)
+        self.sum_volume += bar['volume']
+        self.sum_notional += bar['notional']
+        if self.prev_vwap:
+            ret = math.log(bar['vwap'] / self.prev_vwap)
+            self.window_returns.append((bar['day'], ret))
+            self.sum_ret += ret
+            self.sum_ret_sq += ret * ret
+        self.prev_vwap = bar['vwap']
+
+        # Store the rolling values as of this day for the time series
+        bar.update(self._window_metrics())
+        self.bars.append(bar)
+
+    def _evict(self, current_day: int):
+        """Drop closed bars/returns that fall outside the window ending at current_day"""
+        cutoff = current_day - self.window
+        while self.window_bars and self.window_bars[0]['day'] <= cutoff:
+            old = self.window_bars.popleft()
+            self.sum_volume -= old['volume']
+            self.sum_notional -= old['notional']
+        while self.window_returns and self.window_returns[0][0] <= cutoff:
+            _, ret = self.window_returns.popleft()
+            self.sum_ret -= ret
+            self.sum_ret_sq -= ret * ret
+
+    def _window_metrics(self, extra_bar: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Compute rolling metrics from the running sums (plus an optional provisional bar)"""
+        volume = self.sum_volume
+        notional = self.sum_notional
+        medians = [b['median'] for b in self.window_bars]
+        sum_ret, sum_ret_sq, n_ret = self.sum_ret, self.sum_ret_sq, len(self.window_returns)
+        first_vwap = self.window_bars[0]['vwap'] if self.window_bars else None
+        last_vwap = self.window_bars[-1]['vwap'] if self.window_bars else None
+
+        if extra_bar is not None:
+            volume += extra_bar['volume']
+            notional += extra_bar['notional']
+            medians.append(extra_bar['median'])
+            if last_vwap:
+                ret = math.log(extra_bar['vwap'] / last_vwap)
+                sum_ret += ret
+                sum_ret_sq += ret * ret
+                n_ret += 1
+            first_vwap = first_vwap or extra_bar['vwap']
+            last_vwap = extra_bar['vwap']
+
+        if not volume:
+            return {col: math.nan for col in TREND_COLUMNS}
+
+        if n_ret > 1:
+            variance = max((sum_ret_sq - sum_ret * sum_ret / n_ret) / (n_ret - 1), 0.0)
+            volatility = math.sqrt(variance)
+        else:
+            volatility = math.nan
+
+        return {
+            'vwap_7d': notional / volume,
+            'volume_7d': volume / self.window,  # calendar-day average
+            'median_7d': statistics.median(medians),
+            'volatility_7d': volatility,  # std of daily log-returns of VWAP
+            'vwap_change_7d': (last_vwap / first_vwap - 1) if first_vwap else math.nan,
+            'trend_days': len(medians),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Current rolling metrics, including today's (still open) bar"""
+        if self.open_day is None:
+            return {col: math.nan for col in TREND_COLUMNS}
+        return self._window_metrics(self._open_bar())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'window': self.window,
+            'max_days': self.bars.maxlen,
+            'grace': self.grace,
+            'bars': list(self.bars),
+            'window_bars': list(self.window_bars),
+            'window_returns': list(self.window_returns),
+            'prev_vwap': self.prev_vwap,
+            'watermarks': self.watermarks.to_list(),
+            'open_day': self.open_day,
+            'open_prices': self.open_prices,
+            'open_volume': self.open_volume,
+            'open_notional': self.open_notional,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ItemTrend":
+        trend = cls(data.get('window', 7), data.get('max_days', 90), data.get('grace', LATE_SALE_GRACE))
+        trend.bars.extend(data.get('bars', []))
+        trend.window_bars.extend(data.get('window_bars', []))
+        trend.window_returns.extend(tuple(r) for r in data.get('window_returns', []))
+        trend.sum_volume = sum(b['volume'] for b in trend.window_bars)
+        trend.sum_notional = sum(b['notional'] for b in trend.window_bars)
+        trend.sum_ret = sum(r for _, r in trend.window_returns)
+        trend.sum_ret_sq = sum(r * r for _, r in trend.window_returns)
+        trend.prev_vwap = data.get('prev_vwap')
+        trend.watermarks = SaleWatermarks.from_list(data.get('watermarks', []))
+        trend.open_day = data.get('open_day')
+        trend.open_prices = data.get('open_prices', [])
+        trend.open_volume = data.get('open_volume', 0)
+        trend.open_notional = data.get('open_notional', 0.0)
+        return trend
+
+
+class TrendTracker:
+    """
+    Rolling trend state for many items, fed from Universalis history payloads.
+
+    Only sales not ingested before are applied, tracked per (world, quality)
+    the same way as SketchStore: late uploads from a lagging world and sales
+    in the same second as the newest ingested one still count, and each
+    refresh costs work proportional to the new sales only.
+    """
+
+    def __init__(self, path: str = TREND_FILE, window: int = 7, max_days: int = 90,
+                 grace: float = LATE_SALE_GRACE):
+        self.path = path
+        self.window = window
+        self.max_days = max_days
+        self.grace = grace
+        self.items: Dict[int, ItemTrend] = {}
+
+    def _item(self, item_id: int) -> ItemTrend:
+        trend = self.items.get(item_id)
+        if trend is None:
+            trend = ItemTrend(self.window, self.max_days, self.grace)
+            self.items[item_id] = trend
+        return trend
+
+    def update_from_history(self, item_id: int, history_data: Dict[str, Any], hq: bool = False) -> int:
+        """Ingest new sales of one quality from a history payload; returns sales added"""
+        trend = self._item(item_id)
+        entries = [e for e in history_data.get('entries', []) if bool(e.get('hq')) == hq]
+        new_entries = trend.watermarks.fresh(entries)
+        for entry in new_entries:
+            trend.add_sale(entry.get('pricePerUnit', 0), entry.get('quantity', 0), entry['timestamp'])
+        return len(new_entries)
+
+    def trend_metrics(self, item_id: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Current 7-day metrics for an item (NaN when nothing was ingested).
+        Passing `now` rolls the window forward so items without recent sales age out.
+        """
+        trend = self.items.get(item_id)
+        if trend is None:
+            return {col: math.nan for col in TREND_COLUMNS}
+        if now is not None:
+            trend.advance_to(now)
+        return trend.metrics()
+
+    def series(self, item_id: int) -> pd.DataFrame:
+        """Daily time series for an item: one row per closed day plus today's open bar"""
+        trend = self.items.get(item_id)
+        if trend is None:
+            return pd.DataFrame()
+        rows = list(trend.bars)
+        open_bar = trend._open_bar()
+        if open_bar is not None:
+            open_bar.update(trend.metrics())
+            rows.append(open_bar)
+        df = pd.DataFrame(rows)
+        if len(df) > 0:
+            df['date'] = pd.to_datetime(df['day'] * SECONDS_PER_DAY, unit='s', utc=True).dt.date
+        return df
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        payload = {
+            'window': self.window,
+            'max_days': self.max_days,
+            'grace': self.grace,
+            'items': {str(k): v.to_dict() for k, v in self.items.items()},
+        }
+        write_json(path, payload)
+
+    @classmethod
+    def load(cls, path: str = TREND_FILE, window: int = 7, max_days: int = 90,
+             grace: float = LATE_SALE_GRACE) -> "TrendTracker":
+        """Load tracker state from disk, or return an empty tracker"""
+        tracker = cls(path, window, max_days, grace)
+        if not store_exists(path):
+            return tracker
+        try:
+            payload = read_json(path)
+            tracker.window = payload.get('window', window)
+            tracker.max_days = payload.get('max_days', max_days)
+            tracker.grace = payload.get('grace', grace)
+            tracker.items = {int(k): ItemTrend.from_dict(v) for k, v in payload.get('items', {}).items()}
+        except Exception as e:
+            logger.warning(f"Could not load trend state: {e}")
+        return tracker
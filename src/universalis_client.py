@@ -1,21 +1,40 @@
 """
 Client for Universalis API - FFXIV Market Board data
 """
-import requests
+import os
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence
 import logging
+from src.compression import http_session
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# History entry fields each consumer reads; everything else (buyer names,
+# mannequin flags, world names, velocity stats) is projected away
+SALE_FIELDS = ('hq', 'pricePerUnit', 'quantity', 'timestamp', 'worldID')
+ANALYSIS_HISTORY_FIELDS = ('lastUploadTime',) + tuple(f'entries.{f}' for f in SALE_FIELDS)
+# Live gap fill also needs buyerName to deduplicate against feed sales
+GAP_FILL_HISTORY_FIELDS = ANALYSIS_HISTORY_FIELDS + ('entries.buyerName',)
+
+
+def project_fields(fields: Sequence[str], multi: bool) -> str:
+    """
+    Universalis `fields` parameter for item-level paths. Multi-item responses
+    nest items under 'items', so paths get that prefix there.
+    """
+    if multi:
+        return ",".join(['itemIDs', 'unresolvedItems'] + [f"items.{f}" for f in fields])
+    return ",".join(['itemID'] + list(fields))
+
 class UniversalisClient:
-    BASE_URL = "https://universalis.app/api/v2"
-    RATE_LIMIT_DELAY = 0.05  # 50ms between requests to stay under 25 req/s limit
+    # Overridable to point at a mirror or the synthetic stand-in API (src/synthetic_market.py)
+    BASE_URL = os.environ.get("UNIVERSALIS_BASE_URL", "https://universalis.app/api/v2").rstrip("/")
+    RATE_LIMIT_DELAY = float(os.environ.get("UNIVERSALIS_RATE_LIMIT_DELAY", 0.05))  # 50ms between requests to stay under 25 req/s limit
     
     def __init__(self, datacenter: str = "Chaos"):
         self.datacenter = datacenter
-        self.session = requests.Session()
+        # Negotiates zstd/br/gzip and counts wire bytes (see src.compression)
+        self.session = http_session()
         self.last_request_time = 0
     
     def _rate_limit(self):
@@ -41,6 +60,15 @@ class UniversalisClient:
         response.raise_for_status()
         return response.json()
     
+    def get_recently_updated(self, entries: int = 200) -> List[int]:
+        """IDs of the items most recently uploaded on the client's datacenter"""
+        self._rate_limit()
+        url = f"{self.BASE_URL}/extra/stats/most-recently-updated"
+        params = {"dcName": self.datacenter, "entries": entries}
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return [item['itemID'] for item in response.json().get('items') or []]
+    
     def get_marketable_items(self) -> List[int]:
         """Get all marketable item IDs"""
         logger.info("Fetching all marketable items...")
@@ -76,9 +104,16 @@ class UniversalisClient:
         response.raise_for_status()
         return response.json()
     
-    def get_history(self, item_ids: List[int], entries_to_return: int = 100) -> Dict[str, Any]:
+    def get_history(self, item_ids: List[int], entries_to_return: int = 100,
+                    entries_within: Optional[float] = None, stats_within: Optional[float] = None,
+                    fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
         """
         Get historical data for items (sales history)
+
+        entries_within / stats_within limit the sale entries and the velocity
+        stats to the last N seconds. fields projects each item payload onto
+        the given item-level paths (e.g. 'lastUploadTime', 'entries.hq'); the
+        item ID and unresolved-item keys are always kept.
         """
         if len(item_ids) > 100:
             raise ValueError("Maximum 100 items per request")
@@ -89,25 +124,57 @@ class UniversalisClient:
         params = {
             "entriesToReturn": entries_to_return
         }
+        if entries_within is not None:
+            params["entriesWithin"] = int(entries_within)
+        if stats_within is not None:
+            # Universalis takes statsWithin in milliseconds
+            params["statsWithin"] = int(stats_within * 1000)
+        if fields:
+            params["fields"] = project_fields(fields, multi=len(item_ids) > 1)
         
         response = self.session.get(url, params=params)
         response.raise_for_status()
         return response.json()
     
-    def get_tax_rates(self) -> Dict[str, int]:
-        """Get market tax rates for the datacenter"""
+    def get_listings(self, item_ids: List[int], listings: int = 100,
+                     hq: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Get current market board listings for items (no sale history).
+        Listings are returned cheapest first across the whole datacenter.
+        """
+        if len(item_ids) > 100:
+            raise ValueError("Maximum 100 items per request")
+        
         self._rate_limit()
-        # Get a world from the datacenter to fetch tax rates
-        worlds = self.get_worlds()
-        dc_worlds = [w for w in worlds if w.get('dataCenter') == self.datacenter]
+        item_ids_str = ",".join(map(str, item_ids))
+        url = f"{self.BASE_URL}/{self.datacenter}/{item_ids_str}"
+        params = {
+            "listings": listings,
+            "entries": 0
+        }
+        if hq is not None:
+            params["hq"] = str(hq).lower()
         
-        if not dc_worlds:
-            logger.warning(f"No worlds found for datacenter {self.datacenter}")
-            return {}
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    def get_tax_rates(self, world: Optional[str] = None) -> Dict[str, int]:
+        """
+        Get market tax rates (percent per retainer city) for a world.
+        Defaults to the first world of the client's datacenter; use
+        MarketMetadata for cached rates of every world.
+        """
+        if world is None:
+            dc = next((d for d in self.get_data_centers() if d.get('name') == self.datacenter), None)
+            if not dc or not dc.get('worlds'):
+                logger.warning(f"No worlds found for datacenter {self.datacenter}")
+                return {}
+            world = str(dc['worlds'][0])
         
-        world_name = dc_worlds[0]['name']
+        self._rate_limit()
         url = f"{self.BASE_URL}/tax-rates"
-        params = {"world": world_name}
+        params = {"world": world}
         
         response = self.session.get(url, params=params)
         response.raise_for_status()
@@ -0,0 +1,223 @@
+"""
+SQLite warehouse of every analysis run.
+
+Result files are overwritten by each run; the warehouse keeps them all:
+
+- runs:         one row per run (datacenter, run_ts, parameters)
+- item_metrics: one row per item per run, with every RESULT_SCHEMA metric
+- craft_costs:  craft cost/profit rows for items that could be crafted
+
+run_ts and datacenter are denormalized onto item_metrics so the common
+questions ("profitable in 5 of the last 7 runs", "price history of item X")
+are answered straight from the (item_id, run_ts) and (run_ts, profitability)
+indexes.
+"""
+import json
+import os
+import sqlite3
+import logging
+from typing import Dict, Any, List, Optional, Sequence
+import pandas as pd
+from src.results_io import RESULT_SCHEMA, load_results, read_run_metadata, build_run_metadata
+
+logger = logging.getLogger(__name__)
+
+WAREHOUSE_FILE = "data/warehouse.sqlite"
+
+CRAFT_COLUMNS = ['craft_cost', 'craft_sell_quality', 'craft_profit', 'craft_profit_daily']
+# Every schema metric except craft columns (those live in craft_costs)
+METRIC_COLUMNS = [col for col in RESULT_SCHEMA if col not in CRAFT_COLUMNS and col != 'item_id']
+
+SQL_TYPES = {'int64': 'INTEGER', 'Int64': 'INTEGER', 'float64': 'REAL', 'string': 'TEXT'}
+
+
+class ResultsWarehouse:
+    """Append-only SQLite store of analysis runs with a few canned queries"""
+
+    def __init__(self, path: str = WAREHOUSE_FILE):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def close(self):
+        self.conn.close()
+
+    def _create_schema(self):
+        metric_defs = ",\n".join(f"    {col} {SQL_TYPES.get(RESULT_SCHEMA[col], 'REAL')}" for col in METRIC_COLUMNS)
+        self.conn.executescript(f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_ts TEXT NOT NULL,
+    datacenter TEXT NOT NULL,
+    parameters TEXT,
+    schema_version INTEGER,
+    item_count INTEGER,
+    UNIQUE (datacenter, run_ts)
+);
+CREATE TABLE IF NOT EXISTS item_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    run_ts TEXT NOT NULL,
+    datacenter TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+{metric_defs}
+);
+CREATE TABLE IF NOT EXISTS craft_costs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    run_ts TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    craft_cost REAL,
+    craft_sell_quality TEXT,
+    craft_profit REAL,
+    craft_profit_daily REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_datacenter ON runs (datacenter, run_ts);
+CREATE INDEX IF NOT EXISTS idx_item_metrics_item_ts ON item_metrics (item_id, run_ts);
+CREATE INDEX IF NOT EXISTS idx_item_metrics_ts_profit ON item_metrics (run_ts, profitability);
+CREATE INDEX IF NOT EXISTS idx_item_metrics_datacenter ON item_metrics (datacenter);
+CREATE INDEX IF NOT EXISTS idx_craft_costs_item_ts ON craft_costs (item_id, run_ts);
+""")
+        # Columns added to RESULT_SCHEMA after the database was created
+        for table, columns in (('item_metrics', METRIC_COLUMNS), ('craft_costs', CRAFT_COLUMNS)):
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for col in columns:
+                if col not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} "
+                                      f"{SQL_TYPES.get(RESULT_SCHEMA[col], 'REAL')}")
+        self.conn.commit()
+
+    # Loading
+
+    def begin_run(self, metadata: Dict[str, Any], item_count: Optional[int] = None) -> Optional[int]:
+        """Register a run; returns its run_id, or None if (datacenter, run_ts) is already stored"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_ts, datacenter, parameters, schema_version, item_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (metadata['run_ts'], metadata.get('datacenter') or 'unknown',
+                 json.dumps(metadata.get('parameters', {})), metadata.get('schema_version'), item_count))
+        if cursor.rowcount == 0:
+            logger.info(f"Run {metadata.get('datacenter')} {metadata['run_ts']} already in warehouse, skipping")
+            return None
+        return cursor.lastrowid
+
+    def append_items(self, run_id: int, df: pd.DataFrame, metadata: Dict[str, Any]):
+        """Bulk-insert result rows (a whole run or one streamed chunk) in a single transaction"""
+        run_ts = metadata['run_ts']
+        datacenter = metadata.get('datacenter') or 'unknown'
+        columns = [col for col in METRIC_COLUMNS if col in df.columns]
+        # NaN/NA -> NULL, numpy scalars -> Python scalars
+        frame = df[['item_id'] + columns].astype(object).where(df[['item_id'] + columns].notna(), None)
+
+        with self.conn:
+            placeholders = ", ".join("?" * (4 + len(columns)))
+            self.conn.executemany(
+                f"INSERT INTO item_metrics (run_id, run_ts, datacenter, item_id, {', '.join(columns)}) "
+                f"VALUES ({placeholders})",
+                ((run_id, run_ts, datacenter, *row) for row in frame.itertuples(index=False, name=None)))
+
+            craft = [col for col in CRAFT_COLUMNS if col in df.columns]
+            if 'craft_cost' in craft:
+                crafted = df.loc[df['craft_cost'].notna(), ['item_id'] + craft].astype(object)
+                self.conn.executemany(
+                    f"INSERT INTO craft_costs (run_id, run_ts, item_id, {', '.join(craft)}) "
+                    f"VALUES ({', '.join('?' * (3 + len(craft)))})",
+                    ((run_id, run_ts, *row) for row in
+                     crafted.where(crafted.notna(), None).itertuples(index=False, name=None)))
+            self.conn.execute("UPDATE runs SET item_count = COALESCE(item_count, 0) + ? WHERE run_id = ?",
+                              (len(df), run_id))
+
+    def insert_run(self, df: pd.DataFrame, metadata: Dict[str, Any]) -> Optional[int]:
+        """
+        Store one run's result frame.
+        Returns the run_id, or None if this (datacenter, run_ts) is already stored.
+        """
+        run_id = self.begin_run(metadata)
+        if run_id is None:
+            return None
+        self.append_items(run_id, df, metadata)
+        logger.info(f"Stored run {run_id} ({metadata.get('datacenter')} {metadata['run_ts']}): {len(df)} items")
+        return run_id
+
+    def import_file(self, path: str, datacenter: Optional[str] = None) -> Optional[int]:
+        """Import a result file; files without embedded metadata use the file's mtime"""
+        metadata = read_run_metadata(path)
+        if not metadata.get('run_ts'):
+            from datetime import datetime, timezone
+            mtime = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+            metadata = build_run_metadata(datacenter or metadata.get('datacenter') or 'unknown', run_ts=mtime)
+        return self.insert_run(load_results(path), metadata)
+
+    # Queries
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """Run any SQL against the warehouse and return a DataFrame"""
+        return pd.read_sql_query(sql, self.conn, params=list(params))
+
+    def runs(self, datacenter: Optional[str] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        """Stored runs, newest first"""
+        sql = "SELECT * FROM runs"
+        params: List[Any] = []
+        if datacenter:
+            sql += " WHERE datacenter = ?"
+            params.append(datacenter)
+        sql += " ORDER BY run_ts DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.query(sql, params)
+
+    def consistently_profitable(self, min_runs: int = 5, last_runs: int = 7,
+                                datacenter: Optional[str] = None, min_profit: float = 0.0,
+                                metric: str = 'profitability') -> pd.DataFrame:
+        """Items whose metric exceeded min_profit in at least min_runs of the last last_runs runs"""
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"Unknown metric: {metric}")
+        dc_filter = "WHERE datacenter = ?" if datacenter else ""
+        params: List[Any] = ([datacenter] if datacenter else []) + [last_runs, min_profit, min_runs]
+        sql = f"""
+            WITH recent AS (
+                SELECT run_ts, datacenter FROM runs {dc_filter} ORDER BY run_ts DESC LIMIT ?
+            )
+            SELECT m.item_id, MAX(m.item_name) AS item_name, COUNT(*) AS profitable_runs,
+                   AVG(m.{metric}) AS avg_{metric}, MIN(m.{metric}) AS min_{metric},
+                   AVG(m.daily_volume) AS avg_daily_volume, MAX(m.run_ts) AS last_seen
+            FROM item_metrics m
+            JOIN recent r ON m.run_ts = r.run_ts AND m.datacenter = r.datacenter
+            WHERE m.{metric} > ?
+            GROUP BY m.item_id
+            HAVING COUNT(*) >= ?
+            ORDER BY profitable_runs DESC, avg_{metric} DESC
+        """
+        return self.query(sql, params)
+
+    def item_history(self, item_id: int, columns: Optional[List[str]] = None,
+                     datacenter: Optional[str] = None) -> pd.DataFrame:
+        """One item's metrics across all stored runs, oldest first"""
+        columns = [col for col in (columns or ['buy_price', 'sell_price', 'daily_volume', 'profitability'])
+                   if col in METRIC_COLUMNS]
+        sql = f"SELECT run_ts, datacenter, {', '.join(columns)} FROM item_metrics WHERE item_id = ?"
+        params: List[Any] = [item_id]
+        if datacenter:
+            sql += " AND datacenter = ?"
+            params.append(datacenter)
+        return self.query(sql + " ORDER BY run_ts", params)
+
+    def top_items(self, run_ts: Optional[str] = None, n: int = 20,
+                  datacenter: Optional[str] = None) -> pd.DataFrame:
+        """Most profitable items of one run (the latest by default)"""
+        if run_ts is None:
+            latest = self.runs(datacenter, limit=1)
+            if latest.empty:
+                return pd.DataFrame()
+            run_ts = latest['run_ts'].iloc[0]
+        sql = ("SELECT item_id, item_name, buy_price, sell_price, daily_volume, profitability "
+               "FROM item_metrics WHERE run_ts = ?")
+        params: List[Any] = [run_ts]
+        if datacenter:
+            sql += " AND datacenter = ?"
+            params.append(datacenter)
+        return self.query(sql + " ORDER BY profitability DESC LIMIT ?", params + [n])
@@ -0,0 +1,73 @@
+"""
+Ingest watermarks for incremental history ingestion.
+
+A datacenter's history mixes worlds whose market boards are uploaded at
+different times, and several sales can share one timestamp (Universalis
+timestamps have one-second resolution). A single "newest sale" timestamp
+per item therefore drops late uploads from other worlds and same-second
+sales. SaleWatermarks keeps, per (world, quality), the newest ingested
+timestamp and how many sales of each (price, quantity) were ingested at
+exactly that timestamp; only copies beyond those are new.
+"""
+from typing import Dict, Any, List, Tuple
+
+Key = Tuple[str, str]
+
+
+def _entry_key(entry: Dict[str, Any]) -> Key:
+    return str(entry.get('worldID', entry.get('worldName', ''))), 'hq' if entry.get('hq') else 'nq'
+
+
+class SaleWatermarks:
+    """Per-(world, quality) watermarks of one item's ingested sales"""
+
+    __slots__ = ('marks',)
+
+    def __init__(self):
+        # (world, quality) -> [newest timestamp, {(price, quantity): count at that timestamp}]
+        self.marks: Dict[Key, list] = {}
+
+    def fresh(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        History entries not ingested before, oldest first, and record them as
+        ingested. Entries repeated within `entries` are all kept.
+        """
+        # Watermarks as of before this payload
+        before = {key: (mark[0], dict(mark[1])) for key, mark in self.marks.items()}
+        repeats: Dict[tuple, int] = {}
+        new = []
+        for entry in sorted(entries, key=lambda e: e.get('timestamp', 0)):
+            key = _entry_key(entry)
+            timestamp = entry.get('timestamp', 0)
+            sale = (entry.get('pricePerUnit', 0), entry.get('quantity', 0))
+            mark = before.get(key)
+            if mark is not None:
+                if timestamp < mark[0]:
+                    continue
+                if timestamp == mark[0]:
+                    # Same second as the newest ingested sale: only copies beyond those already counted
+                    repeats[key + sale] = repeats.get(key + sale, 0) + 1
+                    if repeats[key + sale] <= mark[1].get(sale, 0):
+                        continue
+            self._record(key, timestamp, sale)
+            new.append(entry)
+        return new
+
+    def _record(self, key: Key, timestamp: float, sale: Tuple[float, int]):
+        mark = self.marks.get(key)
+        if mark is None or timestamp > mark[0]:
+            mark = self.marks[key] = [timestamp, {}]
+        if timestamp == mark[0]:
+            mark[1][sale] = mark[1].get(sale, 0) + 1
+
+    def to_list(self) -> List[list]:
+        return [[world, quality, mark[0], [[price, quantity, count] for (price, quantity), count in mark[1].items()]]
+                for (world, quality), mark in self.marks.items()]
+
+    @classmethod
+    def from_list(cls, data: List[list]) -> "SaleWatermarks":
+        watermarks = cls()
+        for world, quality, timestamp, sales in data:
+            watermarks.marks[(world, quality)] = [timestamp, {(price, quantity): count
+                                                              for price, quantity, count in sales}]
+        return watermarks
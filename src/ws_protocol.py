@@ -0,0 +1,264 @@
+"""
+Minimal WebSocket (RFC 6455) and BSON codecs for the Universalis event feed.
+
+The feed sends one BSON document per binary message and takes BSON
+subscribe/unsubscribe documents. Only what that protocol needs is
+implemented: the client handshake (ws:// and wss://), framing with
+fragmentation, ping/pong and close; a server-side handshake for the local
+stand-in; and the BSON types Universalis emits (documents, arrays, strings,
+doubles, 32/64-bit ints, booleans, null, UTC datetimes, ObjectIds).
+"""
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+import logging
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class WebSocketClosed(Exception):
+    """The peer closed the connection (close frame or EOF)"""
+
+
+# BSON
+
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+
+
+def _cstring(data: memoryview, pos: int) -> Tuple[str, int]:
+    end = bytes(data[pos:]).index(b'\x00') + pos
+    return bytes(data[pos:end]).decode('utf-8'), end + 1
+
+
+def _decode_document(data: memoryview, pos: int, as_list: bool = False):
+    size = _INT32.unpack_from(data, pos)[0]
+    end = pos + size - 1
+    pos += 4
+    out: Dict[str, Any] = {}
+    while pos < end:
+        kind = data[pos]
+        key, pos = _cstring(data, pos + 1)
+        if kind == 0x01:
+            value = _DOUBLE.unpack_from(data, pos)[0]
+            pos += 8
+        elif kind == 0x02:
+            length = _INT32.unpack_from(data, pos)[0]
+            value = bytes(data[pos + 4:pos + 3 + length]).decode('utf-8')
+            pos += 4 + length
+        elif kind in (0x03, 0x04):
+            value, pos = _decode_document(data, pos, as_list=kind == 0x04)
+        elif kind == 0x07:
+            value = bytes(data[pos:pos + 12]).hex()
+            pos += 12
+        elif kind == 0x08:
+            value = data[pos] != 0
+            pos += 1
+        elif kind == 0x09:  # UTC datetime, ms since epoch
+            value = _INT64.unpack_from(data, pos)[0]
+            pos += 8
+        elif kind == 0x0A:
+            value = None
+        elif kind == 0x10:
+            value = _INT32.unpack_from(data, pos)[0]
+            pos += 4
+        elif kind in (0x11, 0x12):  # timestamp / int64
+            value = _INT64.unpack_from(data, pos)[0]
+            pos += 8
+        else:
+            raise ValueError(f"Unsupported BSON type 0x{kind:02x} for key {key!r}")
+        out[key] = value
+    return (list(out.values()) if as_list else out), end + 1
+
+
+def bson_decode(data: bytes) -> Dict[str, Any]:
+    """Decode one BSON document"""
+    view = memoryview(data)
+    if len(view) < 5 or _INT32.unpack_from(view, 0)[0] != len(view):
+        raise ValueError("Truncated or oversized BSON document")
+    return _decode_document(view, 0)[0]
+
+
+def _encode_element(key: str, value: Any) -> bytes:
+    name = key.encode('utf-8') + b'\x00'
+    if isinstance(value, bool):
+        return b'\x08' + name + (b'\x01' if value else b'\x00')
+    if isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            return b'\x10' + name + _INT32.pack(value)
+        return b'\x12' + name + _INT64.pack(value)
+    if isinstance(value, float):
+        return b'\x01' + name + _DOUBLE.pack(value)
+    if isinstance(value, str):
+        raw = value.encode('utf-8') + b'\x00'
+        return b'\x02' + name + _INT32.pack(len(raw)) + raw
+    if isinstance(value, dict):
+        return b'\x03' + name + bson_encode(value)
+    if isinstance(value, (list, tuple)):
+        return b'\x04' + name + bson_encode({str(i): v for i, v in enumerate(value)})
+    if value is None:
+        return b'\x0A' + name
+    # numpy scalars and the like
+    if hasattr(value, 'item'):
+        return _encode_element(key, value.item())
+    raise TypeError(f"Cannot encode {type(value).__name__} as BSON")
+
+
+def bson_encode(document: Dict[str, Any]) -> bytes:
+    """Encode a dict as one BSON document"""
+    body = b''.join(_encode_element(str(k), v) for k, v in document.items())
+    return _INT32.pack(len(body) + 5) + body + b'\x00'
+
+
+# WebSocket framing
+
+def accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    # XOR with the repeated 4-byte key, done as one big-int operation
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(len(payload), 'little')
+
+
+def encode_frame(opcode: int, payload: bytes = b'', mask: bool = True) -> bytes:
+    """One final frame; clients must mask, servers must not"""
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('>H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('>Q', length)
+    if mask:
+        key = os.urandom(4)
+        return bytes(header) + key + _mask(payload, key)
+    return bytes(header) + payload
+
+
+def _read_exact(stream, n: int) -> bytes:
+    data = stream.read(n)
+    if data is None or len(data) < n:
+        raise WebSocketClosed("connection closed mid-frame")
+    return data
+
+
+def read_frame(stream) -> Tuple[bool, int, bytes]:
+    """(fin, opcode, payload) of the next frame from a buffered binary stream"""
+    first, second = _read_exact(stream, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', _read_exact(stream, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _read_exact(stream, 8))[0]
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"WebSocket frame of {length} bytes exceeds the limit")
+    key = _read_exact(stream, 4) if second & 0x80 else None
+    payload = _read_exact(stream, length) if length else b''
+    if key:
+        payload = _mask(payload, key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def read_message(stream, send_frame) -> Tuple[int, bytes]:
+    """
+    Next complete data message as (opcode, payload). Pings are answered
+    through send_frame(opcode, payload); a close frame raises WebSocketClosed.
+    """
+    opcode, parts = None, []
+    while True:
+        fin, frame_op, payload = read_frame(stream)
+        if frame_op == OP_PING:
+            send_frame(OP_PONG, payload)
+            continue
+        if frame_op == OP_PONG:
+            continue
+        if frame_op == OP_CLOSE:
+            code = struct.unpack('>H', payload[:2])[0] if len(payload) >= 2 else 1005
+            try:
+                send_frame(OP_CLOSE, payload[:2])
+            except OSError:
+                pass
+            raise WebSocketClosed(f"closed by peer ({code})")
+        if frame_op != OP_CONTINUATION:
+            opcode, parts = frame_op, []
+        parts.append(payload)
+        if fin:
+            return opcode, b''.join(parts)
+
+
+class WebSocketClient:
+    """Blocking WebSocket client connection"""
+
+    def __init__(self, url: str, timeout: float = 30.0, headers: Optional[Dict[str, str]] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.sock: Optional[socket.socket] = None
+        self.stream = None
+
+    def connect(self) -> "WebSocketClient":
+        parsed = urlparse(self.url)
+        secure = parsed.scheme == 'wss'
+        host = parsed.hostname or 'localhost'
+        port = parsed.port or (443 if secure else 80)
+        sock = socket.create_connection((host, port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        path = (parsed.path or '/') + (f"?{parsed.query}" if parsed.query else '')
+        lines = [f"GET {path} HTTP/1.1", f"Host: {parsed.netloc}", "Upgrade: websocket",
+                 "Connection: Upgrade", f"Sec-WebSocket-Key: {key}", "Sec-WebSocket-Version: 13"]
+        lines += [f"{name}: {value}" for name, value in self.headers.items()]
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode('ascii'))
+
+        stream = sock.makefile('rb')
+        status = stream.readline().decode('latin-1').strip()
+        response_headers = {}
+        while True:
+            line = stream.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if not status.startswith('HTTP/1.1 101') or response_headers.get('sec-websocket-accept') != accept_key(key):
+            sock.close()
+            raise ConnectionError(f"WebSocket handshake with {self.url} failed: {status}")
+        self.sock, self.stream = sock, stream
+        return self
+
+    def send(self, payload: bytes, opcode: int = OP_BINARY):
+        self.sock.sendall(encode_frame(opcode, payload, mask=True))
+
+    def recv(self) -> Tuple[int, bytes]:
+        """Next data message (opcode, payload); raises WebSocketClosed or socket.timeout"""
+        return read_message(self.stream, lambda op, data: self.send(data, op))
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendall(encode_frame(OP_CLOSE, struct.pack('>H', 1000), mask=True))
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        finally:
+            self.sock, self.stream = None, None